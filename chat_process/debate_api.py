@@ -1,5 +1,6 @@
 import asyncio
 import os
+import time
 import uuid
 from datetime import datetime
 from typing import Dict, List, Optional, Set
@@ -8,15 +9,25 @@ import httpx
 import psycopg2
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
-from openai import OpenAI
+from fastapi.responses import PlainTextResponse
 from psycopg2.extras import RealDictCursor, register_uuid
 from pydantic import BaseModel
 
+from debate_single_call import (
+    DEBATE_MODES, SINGLE_CALL_MAX_TOKENS, debate_response_format, resolve_speaker, single_call_instruction
+)
+from debate_summary import SUMMARY_PROMPT, IncrementalSummary
+from dialogue_context import DialogueContext, strip_speaker
+from llm_client import DEGRADED_MESSAGE, close_client, render_metrics, stream_chat_completion
+from json_stream import IncrementalJsonParser
+from llm_metrics import llm_tags
+from message_writer import MessageWriter
+from persona_prompt import persona_prompts
+from single_flight import SingleFlight
 from main import DialogueSystem, Persona
 
 # 환경 변수 로드
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 # FastAPI 앱 초기화
 app = FastAPI(title="페르소나 토론 채팅 API")
@@ -25,6 +36,13 @@ app = FastAPI(title="페르소나 토론 채팅 API")
 register_uuid()
 
 PERSONA_API_BASE = "https://port-0-back-m1ung2x3f53d462a.sel4.cloudtype.app"
+# turn_delta 프레임을 보내는 최소 간격(초) - 그 사이에 받은 토큰은 모아서 한 프레임으로 전송
+DEBATE_DELTA_INTERVAL = float(os.getenv("DEBATE_DELTA_INTERVAL", "0.05"))
+
+# chat_rooms에 채팅방별 토론 생성 방식(DEBATE_MODES) 컬럼 추가
+DEBATE_MODE_DDL = """
+ALTER TABLE chat_rooms ADD COLUMN IF NOT EXISTS debate_mode TEXT NOT NULL DEFAULT 'turns'
+"""
 
 # Database configuration
 DATABASE_CONFIG = {
@@ -56,54 +74,76 @@ class DialogueSystem:
         if self.connection_manager and self.room_id:
             await self.connection_manager.broadcast_to_room(message, self.room_id)
 
+    async def stream_turn(self, turn: int, speaker_name: str, messages: List[Dict]) -> str:
+        """
+        토론 턴 하나를 스트리밍으로 생성하며 turn_delta 프레임으로 중계하고, 정리된 전체 내용을 반환
+
+        응답 앞의 '화자 이름: '과 따옴표는 프레임을 보내기 전에 떼어 내고, 끝의 따옴표는
+        끝났는지 알 수 있을 때까지 보내지 않는다. 최종 내용은 turn_complete 프레임으로 다시 보낸다.
+        """
+        prefix = f"{speaker_name}: "
+        raw = ""
+        sent = 0
+        last_sent = 0.0
+
+        async def flush(text: str):
+            nonlocal sent, last_sent
+            if len(text) > sent:
+                await self.send_dialogue_message(
+                    {"type": "turn_delta", "turn": turn, "speaker": speaker_name, "delta": text[sent:]}
+                )
+                sent = len(text)
+                last_sent = time.monotonic()
+
+        # 같은 페르소나 쌍/질문/이전 턴이면 같은 응답을 재사용
+        with llm_tags(endpoint="debate_turn", room=self.room_id, persona=speaker_name):
+            async for delta in stream_chat_completion(
+                route="debate_turn", degraded=DEGRADED_MESSAGE, cache=True, messages=messages
+            ):
+                raw += delta
+                # 앞부분이 아직 '"화자 이름: '의 일부일 수 있으면 더 받아 본 뒤 판단
+                head = raw.lstrip('"')
+                if prefix.startswith(head):
+                    continue
+                if time.monotonic() - last_sent >= DEBATE_DELTA_INTERVAL:
+                    await flush(strip_speaker(raw, speaker_name))
+
+        content = strip_speaker(raw, speaker_name)
+        await flush(content)
+        return content
+
+    async def complete_turn(self, turn: int, speaker_name: str, content: str) -> Dict:
+        """
+        완성된 턴을 저장 버퍼에 넣고, 저장될 message_id와 함께 turn_complete 프레임 전송
+
+        message_id는 버퍼가 저장되기 전에 보내므로 이 시점에는 아직 DB에 없다. 클라이언트는
+        이 값을 화면 표시용으로만 쓰고, 조회는 토론이 끝난 뒤(요약 메시지를 받은 뒤)에 해야 한다.
+        그때 저장에 실패해 있으면 MessageWriter가 뒤에서 다시 시도하므로 잠시 더 없을 수 있다.
+        """
+        dialogue_turn = {
+            "speaker": speaker_name,
+            "content": content,
+            "timestamp": datetime.now().isoformat(),
+        }
+
+        # 턴 생성 경로에서 DB를 기다리지 않도록 write-behind 버퍼에 넣고 정해진 message_id로 알림
+        message = message_writer.add(self.room_id, "AI", self.user_id, content)
+        await self.send_dialogue_message({
+            "type": "turn_complete",
+            "turn": turn,
+            **dialogue_turn,
+            "message_id": str(message["message_id"]),
+            "sender_type": "AI",
+            "created_at": message["created_at"].isoformat(),
+        })
+        return dialogue_turn
+
     def _get_persona_prompt(self, persona_data: Dict) -> str:
-        """페르소나의 전체적인 컨텍스트 정보 생성"""
-        basic_info = persona_data.get("basic_info", {})
-        professional = persona_data.get("professional", {})
-        personal = persona_data.get("personal", {})
-        legacy = persona_data.get("legacy", {})
-        historical = persona_data.get("historical_context", {})
-
-        return f"""
-    === 페르소나 상세 프로필 ===
-
-    1. 인물 정보
-    - 이름: {basic_info.get('name', '')}
-    - 생애: {basic_info.get('birth_death', '')}
-    - 시대: {basic_info.get('era', '')}
-    - 국적: {basic_info.get('nationality', '')}
-
-    2. 직업과 업적
-    - 주요 직책: {professional.get('primary_occupation', '')}
-    - 관련 역할: {', '.join(role['roleName'] for role in professional.get('other_roles', []))}
-    - 주요 업적:
-        {self._format_list([ach['achievementName'] for ach in professional.get('major_achievements', [])])}
-
-    3. 개인 배경과 성향
-    - 교육 배경: {personal.get('education', '')}
-    - 개인 이력: {personal.get('background', '')}
-    - 성격 특성:
-        {self._format_list([trait['traitName'] for trait in personal.get('personality_traits', [])])}
-    - 영향 받은 요소:
-        {self._format_list([inf['influenceName'] for inf in personal.get('influences', [])])}
-
-    4. 역사적 맥락
-    - 시대적 배경: {historical.get('period_background', '')}
-    - 주요 사건:
-        {self._format_list([event['eventDescription'] for event in historical.get('key_events', [])])}
-
-    5. 역사적 의의
-    - 역사적 영향: {legacy.get('impact', '')}
-    - 현대적 의미: {legacy.get('modern_significance', '')}"""
-
-    def _format_list(self, items: List[str]) -> str:
-        return "\n        - ".join(items) if items else ""
+        """페르소나의 전체적인 컨텍스트 정보 생성 (person_id/프로필 버전별로 캐시)"""
+        return persona_prompts.compile(persona_data)["profile_text"]
 
-    async def generate_dialogue(
-        self, user_concern: str, num_turns: int = 3
-    ) -> tuple[list[dict], str]:
-        """페르소나 간 대화 생성 및 요약"""
-        system_prompt = f"""당신은 두 인물 간의 대화를 생성해야 합니다.
+    def _system_prompt(self) -> str:
+        return f"""당신은 두 인물 간의 대화를 생성해야 합니다.
         
 첫 번째 페르소나:
 {self._get_persona_prompt(self.persona1_data)}
@@ -111,10 +151,8 @@ class DialogueSystem:
 두 번째 페르소나:
 {self._get_persona_prompt(self.persona2_data)}
 
-사용자의 질문: {user_concern}
-
 다음 지침을 따라 대화를 생성하세요:
-1. 각 페르소나는 자신의 경험과 관점에서 사용자의 질문에 대해 답변해야 합니다.
+1. 각 페르소나는 자신의 경험과 관점에서 사용자의 질문(첫 번째 사용자 메시지)에 대해 답변해야 합니다.
 2. 대화는 자연스럽게 이어져야 하며, 각자의 시대적 배경과 가치관이 반영되어야 합니다.
 3. 페르소나의 성격 특성과 말투를 반영하여 대화를 생성하세요.
 4. 역사적 맥락과 개인적 경험을 연결지어 답변하도록 합니다.
@@ -123,13 +161,47 @@ class DialogueSystem:
 
 반드시 사용자의 고민에 대한 올바른 조언을 포함해야 합니다."""
 
-        dialogue_messages = [{"role": "system", "content": system_prompt}]
-        dialogue = []
-        current_persona = self.persona1_data
-        other_persona = self.persona2_data
+    async def generate_dialogue(
+        self, user_concern: str, num_turns: int = 3, mode: str = "turns"
+    ) -> tuple[list[dict], str]:
+        """
+        페르소나 간 대화 생성 및 요약
+
+        mode가 single_call이면 모든 턴과 요약을 구조화 출력 한 번으로 생성한다 (채팅방별로 선택).
+        토론이 끝나면(실패해도) 버퍼에 남은 턴을 저장하므로, 이후 저장하는 요약은 턴들 뒤에 온다.
+        """
+        try:
+            if mode == "single_call":
+                return await self.generate_dialogue_single_call(user_concern, num_turns)
+            return await self.generate_dialogue_turns(user_concern, num_turns)
+        finally:
+            await message_writer.flush(self.room_id)
+
+    async def generate_dialogue_turns(
+        self, user_concern: str, num_turns: int = 3, dialogue: Optional[List[Dict]] = None
+    ) -> tuple[list[dict], str]:
+        """
+        턴마다 호출해 토큰 단위로 스트리밍하는 방식
 
-        for turn in range(num_turns * 2):
-            prompt = f"""현재 말하는 페르소나는 {current_persona['basic_info'].get('name')}입니다.
+        dialogue가 주어지면 이미 보내고 저장한 그 턴들 다음 턴부터 이어서 생성한다
+        (single_call 응답이 중간에 끊기거나 턴이 모자란 경우).
+        """
+        system_prompt = self._system_prompt()
+        # 페르소나 프로필과 지침(system)은 같은 두 인물이면 항상 같은 앞부분이 되도록 두고,
+        # 사용자 질문과 대화 내용처럼 매번 달라지는 부분은 그 뒤에 붙인다 (프롬프트 캐시 재사용)
+        # 오래된 턴은 누적 요약으로 접어 턴 수가 늘어도 호출당 토큰이 일정 범위 안에 머물게 함
+        context = DialogueContext(system_prompt, user_concern, room_id=self.room_id)
+        summarizer = IncrementalSummary(user_concern, room_id=self.room_id)
+        dialogue = list(dialogue or [])
+        for previous in dialogue:
+            context.add_turn(previous["speaker"], previous["content"])
+            summarizer.add_turn(previous["speaker"], previous["content"])
+
+        personas = [self.persona1_data, self.persona2_data]
+        try:
+            for turn in range(len(dialogue), num_turns * 2):
+                current_persona, other_persona = personas[turn % 2], personas[(turn + 1) % 2]
+                prompt = f"""현재 말하는 페르소나는 {current_persona['basic_info'].get('name')}입니다.
 상대 페르소나는 {other_persona['basic_info'].get('name')}입니다.
 
 이전 대화를 고려하여, {current_persona['basic_info'].get('name')}의 관점에서 대화를 이어가세요.
@@ -138,69 +210,82 @@ class DialogueSystem:
 페르소나의 시대적 배경, 경험, 성격을 반영한 자연스러운 대화를 생성해주세요.
 현재 턴이 {turn + 1}/{num_turns * 2}입니다. 마지막 턴에 가까워질수록 대화를 자연스럽게 마무리해주세요."""
 
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=dialogue_messages + [{"role": "user", "content": prompt}],
-            )
+                # 토큰을 받는 대로 turn_delta로 중계 (보는 사람은 첫 토큰부터 읽기 시작)
+                speaker_name = current_persona["basic_info"].get("name")
+                content = await self.stream_turn(turn, speaker_name, await context.messages(prompt))
+                dialogue.append(await self.complete_turn(turn, speaker_name, content))
 
-            content = response.choices[0].message.content
-            speaker_name = current_persona["basic_info"].get("name")
-            content = content.replace(f"{speaker_name}: ", "").strip('"')
+                context.add_turn(speaker_name, content)
+                summarizer.add_turn(speaker_name, content)
 
-            dialogue_turn = {
-                "speaker": speaker_name,
-                "content": content,
-                "timestamp": datetime.now().isoformat(),
-            }
-            dialogue.append(dialogue_turn)
+            # 턴마다 백그라운드에서 갱신해 온 요약에 남은 턴만 반영
+            summary = await summarizer.result(degraded=DEGRADED_MESSAGE)
+            return dialogue, summary
+        finally:
+            # 중간에 실패해도 백그라운드 요약 호출이 남지 않도록 취소
+            await summarizer.close()
 
-            if self.connection_manager and self.room_id:
-                await self.send_dialogue_message(dialogue_turn)
+    async def generate_dialogue_single_call(
+        self, user_concern: str, num_turns: int = 3
+    ) -> tuple[list[dict], str]:
+        """
+        모든 턴과 요약을 json_schema 응답 한 번으로 생성
 
-            conn = get_db_connection()
+        턴마다 컨텍스트를 다시 보내는 대신 한 번만 보내고, 응답을 스트리밍으로 파싱해
+        turns 배열의 원소가 닫힐 때마다 그 턴을 저장하고 turn_complete로 보낸다.
+        이미 보낸 턴은 되돌릴 수 없으므로, 응답이 실패하거나 턴이 모자라면 보낸 턴들 뒤부터
+        턴별 호출 방식으로 이어서 생성하고, 요약만 없으면 보낸 턴들로 요약을 만든다.
+        그래서 클라이언트가 받은 턴과 저장된 턴은 항상 최종 대화와 같다.
+        """
+        speakers = [
+            self.persona1_data["basic_info"].get("name"),
+            self.persona2_data["basic_info"].get("name"),
+        ]
+        total_turns = num_turns * 2
+        messages = [
+            {"role": "system", "content": self._system_prompt()},
+            {"role": "user", "content": f"사용자의 질문: {user_concern}"},
+            {"role": "user", "content": single_call_instruction(speakers, total_turns, SUMMARY_PROMPT)},
+        ]
+        parser = IncrementalJsonParser(max_depth=2)
+        dialogue = []
+        summary = None
+
+        try:
+            with llm_tags(endpoint="debate_single_call", room=self.room_id):
+                async for delta in stream_chat_completion(
+                    route="debate_single_call",
+                    messages=messages,
+                    response_format=debate_response_format(speakers),
+                    max_tokens=SINGLE_CALL_MAX_TOKENS,
+                    cache=True,
+                ):
+                    for path, value in parser.feed(delta):
+                        if len(path) == 2 and path[0] == "turns" and len(dialogue) < total_turns:
+                            if not isinstance(value, dict) or not str(value.get("content") or "").strip():
+                                continue
+                            # 응답의 speaker가 두 화자 중 하나면 그대로, 아니면 순서로 정함
+                            speaker_name = resolve_speaker(speakers, len(dialogue), value.get("speaker"))
+                            content = strip_speaker(str(value["content"]), speaker_name)
+                            dialogue.append(await self.complete_turn(len(dialogue), speaker_name, content))
+                        elif path == ("summary",) and isinstance(value, str) and value.strip():
+                            summary = value
+        except Exception as e:
+            print(f"Single-call debate failed after {len(dialogue)} turns, continuing with turns: {str(e)}")
+            return await self.generate_dialogue_turns(user_concern, num_turns, dialogue)
+
+        if len(dialogue) < total_turns:
+            print(f"Single-call debate returned {len(dialogue)}/{total_turns} turns, continuing with turns")
+            return await self.generate_dialogue_turns(user_concern, num_turns, dialogue)
+        if summary is None:
+            print("Single-call debate returned no summary, summarizing the streamed turns")
+            summarizer = IncrementalSummary(user_concern, room_id=self.room_id)
             try:
-                await save_and_broadcast_message(
-                    conn,
-                    self.room_id,
-                    "AI",
-                    self.user_id,
-                    content,
-                )
-                conn.commit()
-            except Exception as e:
-                print(f"Failed to save AI message: {str(e)}")
-                conn.rollback()
+                for turn in dialogue:
+                    summarizer.add_turn(turn["speaker"], turn["content"])
+                summary = await summarizer.result(degraded=DEGRADED_MESSAGE)
             finally:
-                conn.close()
-
-            dialogue_messages.append({"role": "assistant", "content": content})
-            current_persona, other_persona = other_persona, current_persona
-
-        summary_prompt = """지금까지의 대화를 다음 형식으로 마크다운 요약을 작성해주세요:
-
-# 대화 요약
-
-## 주요 논점
-- 각 페르소나가 제시한 핵심 주장
-
-## 공통점과 차이점
-- 두 페르소나의 관점 비교
-
-## 핵심 조언
-- 사용자에게 도움이 될 만한 주요 조언들
-
-## 결론
-사용자의 고민에 대한 최종 조언 요약"""
-
-        summary_response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": summary_prompt},
-                {"role": "user", "content": str(dialogue)},
-            ],
-        )
-
-        summary = summary_response.choices[0].message.content
+                await summarizer.close()
         return dialogue, summary
 
 
@@ -230,6 +315,34 @@ class ConnectionManager:
 manager = ConnectionManager()
 
 
+def ensure_debate_schema():
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(DEBATE_MODE_DDL)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@app.on_event("startup")
+async def prepare_debate_schema():
+    await asyncio.to_thread(ensure_debate_schema)
+
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    # 아직 저장되지 않은 토론 턴을 먼저 저장
+    await message_writer.close()
+    await close_client()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """LLM 호출 지표 (Prometheus 텍스트 형식)"""
+    return PlainTextResponse(render_metrics())
+
+
 # 데이터베이스 연결 함수
 def get_db_connection():
     return psycopg2.connect(
@@ -242,6 +355,10 @@ def get_db_connection():
     )
 
 
+# 토론 턴 저장용 write-behind 버퍼 (채팅방별로 모아서 여러 행 INSERT)
+message_writer = MessageWriter(lambda: get_db_connection())
+
+
 # Pydantic 모델 정의
 class ChatRoomCreate(BaseModel):
     """채팅방 생성을 위한 모델"""
@@ -249,6 +366,7 @@ class ChatRoomCreate(BaseModel):
     title: str
     person_ids: List[uuid.UUID]  # 토론에 참여할 두 인물의 ID
     user_id: uuid.UUID
+    debate_mode: str = "turns"  # 토론 생성 방식 (DEBATE_MODES)
 
 
 class MessageCreate(BaseModel):
@@ -257,9 +375,17 @@ class MessageCreate(BaseModel):
     content: str
 
 
+# 같은 person_id의 동시 조회는 HTTP 호출 한 번으로 합침
+persona_fetches = SingleFlight()
+
+
 # 페르소나 API 호출 함수
 async def fetch_persona_data(person_id: uuid.UUID) -> Dict:
     """외부 API에서 페르소나 정보 조회 및 데이터 구조 변환"""
+    return await persona_fetches.do(str(person_id), lambda: _fetch_persona_data(person_id))
+
+
+async def _fetch_persona_data(person_id: uuid.UUID) -> Dict:
     async with httpx.AsyncClient() as client:
         try:
             response = await client.get(f"{PERSONA_API_BASE}/persons/{person_id}")
@@ -357,11 +483,17 @@ async def websocket_endpoint(websocket: WebSocket, room_id: uuid.UUID):
                 )
                 personas = cur.fetchall()
                 print("personas cur")
-                # API에서 페르소나 정보 조회
-                persona1_data = await fetch_persona_data(personas[0]["person_id"])
-                print(persona1_data)
-                persona2_data = await fetch_persona_data(personas[1]["person_id"])
-                print(persona2_data)
+
+                # 채팅방별 토론 생성 방식
+                cur.execute("SELECT debate_mode FROM chat_rooms WHERE room_id = %s", (room_id,))
+                room = cur.fetchone()
+                debate_mode = room["debate_mode"] if room else "turns"
+                # API에서 페르소나 정보 조회 (TTL 동안은 컴파일된 프롬프트와 함께 재사용)
+                persona1, persona2 = await asyncio.gather(
+                    persona_prompts.load(personas[0]["person_id"], fetch_persona_data),
+                    persona_prompts.load(personas[1]["person_id"], fetch_persona_data),
+                )
+                persona1_data, persona2_data = persona1["data"], persona2["data"]
 
                 # DialogueSystem을 사용하여 토론 응답 생성
                 dialogue_system = DialogueSystem(
@@ -374,7 +506,7 @@ async def websocket_endpoint(websocket: WebSocket, room_id: uuid.UUID):
 
                 # 대화 생성 - websocket을 통해 자동으로 브로드캐스트됨
                 dialogue, summary = await dialogue_system.generate_dialogue(
-                    content, num_turns=3
+                    content, num_turns=3, mode=debate_mode
                 )
 
                 # 요약 메시지 저장
@@ -410,17 +542,21 @@ async def create_chat_room(room_data: ChatRoomCreate):
         raise HTTPException(
             status_code=400, detail="토론을 위해 정확히 2명의 인물이 필요합니다"
         )
+    if room_data.debate_mode not in DEBATE_MODES:
+        raise HTTPException(
+            status_code=400, detail=f"지원하지 않는 토론 방식입니다: {room_data.debate_mode}"
+        )
 
     conn = get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute(
             """
-            INSERT INTO chat_rooms (user_id, title, status)
-            VALUES (%s, %s, 'ACTIVE')
+            INSERT INTO chat_rooms (user_id, title, status, debate_mode)
+            VALUES (%s, %s, 'ACTIVE', %s)
             RETURNING room_id
             """,
-            (room_data.user_id, room_data.title),
+            (room_data.user_id, room_data.title, room_data.debate_mode),
         )
 
         room_id = cur.fetchone()["room_id"]
@@ -446,21 +582,28 @@ async def create_chat_room(room_data: ChatRoomCreate):
         conn.close()
 
 
-async def save_and_broadcast_message(
+def save_message(
     conn, room_id: uuid.UUID, sender_type: str, sender_id: uuid.UUID, content: str
-):
-    """메시지 저장 및 브로드캐스트"""
+) -> Dict:
+    """메시지 저장 (커밋은 호출하는 쪽에서)"""
     cur = conn.cursor()
+    # 버퍼로 저장하는 토론 턴과 같은 시계로 created_at을 정해야 목록이 만든 순서대로 정렬됨
     cur.execute(
         """
-        INSERT INTO chat_messages (room_id, sender_type, sender_id, content)
-        VALUES (%s, %s, %s, %s)
+        INSERT INTO chat_messages (room_id, sender_type, sender_id, content, created_at)
+        VALUES (%s, %s, %s, %s, %s)
         RETURNING message_id, content, sender_type, created_at
         """,
-        (room_id, sender_type, sender_id, content),
+        (room_id, sender_type, sender_id, content, message_writer.timestamp()),
     )
+    return cur.fetchone()
 
-    message = cur.fetchone()
+
+async def save_and_broadcast_message(
+    conn, room_id: uuid.UUID, sender_type: str, sender_id: uuid.UUID, content: str
+):
+    """메시지 저장 및 브로드캐스트"""
+    message = save_message(conn, room_id, sender_type, sender_id, content)
 
     # 웹소켓으로 메시지 전송
     await manager.broadcast_to_room(
@@ -535,7 +678,7 @@ async def create_message(
 
         # main.py의 generate_dialogue 사용 - 이미 내부적으로 웹소켓 통신 구현되어 있음
         dialogue, summary = await dialogue_system.generate_dialogue(
-            message.content, num_turns=3
+            message.content, num_turns=3, mode=room["debate_mode"]
         )
 
         conn.commit()
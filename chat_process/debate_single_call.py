@@ -0,0 +1,74 @@
+from typing import Any, Dict, List, Optional
+
+# 채팅방별 토론 생성 방식
+# turns: 턴마다 호출 (토큰 단위 스트리밍) / single_call: 모든 턴과 요약을 구조화 출력 한 번으로 생성
+DEBATE_MODES = ("turns", "single_call")
+# 요약까지 한 응답에 담으므로 턴 호출보다 길게 생성
+SINGLE_CALL_MAX_TOKENS = 4096
+
+
+def speaker_names(speakers: List[Optional[str]]) -> List[str]:
+    """speaker enum에 넣을 이름 (빈 이름과 중복 제거 - strict 스키마의 enum은 값이 달라야 함)"""
+    return list(dict.fromkeys(name for name in speakers if name))
+
+
+def debate_response_format(speakers: List[Optional[str]]) -> Dict[str, Any]:
+    """
+    턴 목록과 요약을 담는 json_schema (턴이 요약보다 먼저 오도록 turns를 앞에 둠)
+
+    두 이름이 서로 다를 때만 speaker를 enum으로 제한한다. 이름이 같거나 비어 있으면 화자를
+    이름으로 구분할 수 없으므로 자유 문자열로 두고, 화자는 순서로 정한다 (resolve_speaker).
+    """
+    names = speaker_names(speakers)
+    speaker = {"type": "string", "enum": names} if len(names) == 2 else {"type": "string"}
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "debate",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "turns": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "speaker": speaker,
+                                "content": {"type": "string"}
+                            },
+                            "required": ["speaker", "content"],
+                            "additionalProperties": False
+                        }
+                    },
+                    "summary": {"type": "string"}
+                },
+                "required": ["turns", "summary"],
+                "additionalProperties": False
+            }
+        }
+    }
+
+
+def resolve_speaker(speakers: List[Optional[str]], turn: int, value: Any) -> Optional[str]:
+    """
+    응답의 speaker 값이 두 화자 중 하나로 확인되면 그 이름, 아니면 순서상 화자
+
+    이름이 같거나 비어 있어 구분할 수 없을 때도 순서상 화자를 쓴다.
+    """
+    names = speaker_names(speakers)
+    if len(names) == 2 and value in names:
+        return value
+    return speakers[turn % 2]
+
+
+def single_call_instruction(speakers: List[str], total_turns: int, summary_prompt: str) -> str:
+    """턴 호출의 턴별 지시를 대신하는, 토론 전체를 한 번에 생성하라는 지시"""
+    return f"""{speakers[0]}와 {speakers[1]}의 대화를 처음부터 끝까지 생성하세요.
+
+- turns에는 정확히 {total_turns}개의 발언을 {speakers[0]}부터 번갈아 가며 순서대로 담으세요.
+- 각 발언의 content에는 화자 이름을 붙이지 말고 발언 내용만 쓰세요.
+- 앞선 발언을 고려해 자연스럽게 이어가고, 마지막 발언에 가까워질수록 대화를 자연스럽게 마무리하세요.
+- summary에는 전체 대화를 다음 지시에 따라 요약하세요.
+
+{summary_prompt}"""
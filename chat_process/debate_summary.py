@@ -0,0 +1,218 @@
+import asyncio
+import json
+import os
+from typing import Dict, List, Optional
+
+from circuit_breaker import CircuitOpenError
+from llm_client import chat_completion
+from llm_metrics import llm_tags
+
+# 턴 하나를 반영하는 호출의 최대 응답 길이(토큰) - 전체 요약이 아니라 섹션당 2개 이하의 새 항목만 받으므로 턴 수와 무관
+SUMMARY_DELTA_MAX_TOKENS = int(os.getenv("SUMMARY_DELTA_MAX_TOKENS", "400"))
+# 모든 턴을 반영한 뒤 결론만 쓰는 마지막 호출의 최대 응답 길이(토큰)
+SUMMARY_CONCLUSION_MAX_TOKENS = int(os.getenv("SUMMARY_CONCLUSION_MAX_TOKENS", "200"))
+
+SUMMARY_PROMPT = """지금까지의 대화를 다음 형식으로 마크다운 요약을 작성해주세요:
+
+# 대화 요약
+
+## 주요 논점
+- 각 페르소나가 제시한 핵심 주장
+
+## 공통점과 차이점
+- 두 페르소나의 관점 비교
+
+## 핵심 조언
+- 사용자에게 도움이 될 만한 주요 조언들
+
+## 결론
+사용자의 고민에 대한 최종 조언 요약"""
+
+DELTA_PROMPT = """당신은 두 인물의 토론을 발언 단위로 정리하는 요약자입니다.
+새 발언에서 새로 나온 내용만 항목으로 뽑으세요. 직전 발언은 비교용이며 이미 정리되어 있습니다.
+
+- points: 새 발언의 핵심 주장 ('화자: 주장' 형식, 1~2개)
+- common_ground: 직전 발언과 비교해 새로 드러난 공통점 (없으면 빈 목록)
+- differences: 직전 발언과 비교해 새로 드러난 차이점 (없으면 빈 목록)
+- advice: 사용자에게 도움이 될 새 조언 (없으면 빈 목록)
+
+각 항목은 한 문장으로 간결하게 작성하세요.
+대화 기록은 한 줄에 한 발언씩 '[턴 번호] 화자: 내용' 형식입니다."""
+
+CONCLUSION_PROMPT = """당신은 두 인물의 토론을 정리하는 요약자입니다.
+토론에서 정리된 주요 논점, 공통점과 차이점, 조언을 바탕으로
+사용자의 고민에 대한 최종 조언을 두세 문장의 결론으로 작성하세요."""
+
+SECTIONS = ("points", "common_ground", "differences", "advice")
+
+DELTA_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "debate_summary_delta",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                section: {"type": "array", "items": {"type": "string"}, "maxItems": 2} for section in SECTIONS
+            },
+            "required": list(SECTIONS),
+            "additionalProperties": False
+        }
+    }
+}
+
+CONCLUSION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "debate_summary_conclusion",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"conclusion": {"type": "string"}},
+            "required": ["conclusion"],
+            "additionalProperties": False
+        }
+    }
+}
+
+
+def format_transcript(turns: List[Dict], start: int = 0) -> str:
+    """대화 기록을 '[턴 번호] 화자: 내용' 줄로 변환 (Python repr보다 짧고 읽기 쉬움)"""
+    return "\n".join(
+        f"[{index}] {turn['speaker']}: {' '.join(turn['content'].split())}"
+        for index, turn in enumerate(turns, start=start + 1)
+    )
+
+
+def _bullets(items: List[str]) -> str:
+    return "\n".join(f"- {item}" for item in items) if items else "- 없음"
+
+
+class IncrementalSummary:
+    def __init__(self, user_concern: str, room_id: Optional[str] = None):
+        """
+        토론 턴이 추가될 때마다 백그라운드에서 쌓아 가는 최종 요약
+
+        요약은 섹션별 항목 목록으로 보관하고, 턴마다 그 턴에서 새로 나온 항목만 받아 덧붙인다.
+        턴 하나의 호출에는 그 발언과 비교용 직전 발언만 보내고 응답도 새 항목뿐이므로,
+        턴 수가 늘어도 호출 하나의 토큰 수는 일정하다. 턴마다의 호출은 서로의 결과를 쓰지 않으므로
+        턴이 끝나는 즉시 나란히 시작한다. 결론은 모든 턴의 항목이 모인 뒤 result()에서 그 항목들로
+        한 번만 작성하므로 반영 순서와 관계없이 모든 턴을 바탕으로 한다.
+        마크다운은 로컬에서 SUMMARY_PROMPT 형식으로 만든다.
+        토론이 중간에 실패하면 close()로 남은 호출을 취소해야 한다.
+        """
+        self.user_concern = user_concern
+        self.room_id = room_id
+        self.turns: List[Dict] = []
+        self.deltas: Dict[int, Dict] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def add_turn(self, speaker: str, content: str):
+        self.turns.append({"speaker": speaker, "content": content})
+        self._tasks.append(asyncio.create_task(self._background_delta(len(self.turns) - 1)))
+
+    async def _background_delta(self, index: int):
+        try:
+            await self._delta(index)
+        except Exception as e:
+            # 실패한 턴은 result()에서 다시 반영
+            print(f"Failed to update debate summary: {str(e)}")
+
+    async def close(self):
+        """끝나지 않은 백그라운드 호출을 취소 (토론이 중간에 실패해도 호출이 남지 않도록)"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _delta(self, index: int) -> Dict:
+        """index번째 턴에서 새로 나온 항목 (결과는 self.deltas에도 저장)"""
+        previous = format_transcript(self.turns[index - 1:index], index - 1) if index else ""
+        context = f"직전 발언:\n{previous}\n\n" if previous else ""
+        with llm_tags(endpoint="debate_summary", room=self.room_id):
+            response = await chat_completion(
+                route="debate_summary",
+                messages=[
+                    {"role": "system", "content": DELTA_PROMPT},
+                    {
+                        "role": "user",
+                        "content": f"사용자의 질문: {self.user_concern}\n\n{context}"
+                                   f"새 발언:\n{format_transcript(self.turns[index:index + 1], index)}",
+                    },
+                ],
+                response_format=DELTA_RESPONSE_FORMAT,
+                max_tokens=SUMMARY_DELTA_MAX_TOKENS,
+                cache=True,
+            )
+        self.deltas[index] = json.loads(response.choices[0].message.content)
+        return self.deltas[index]
+
+    def _sections(self) -> Dict[str, List[str]]:
+        """반영된 턴의 항목을 턴 순서로 합침 (같은 항목은 한 번만)"""
+        state: Dict[str, List[str]] = {section: [] for section in SECTIONS}
+        for index in sorted(self.deltas):
+            for section in SECTIONS:
+                for item in self.deltas[index].get(section) or []:
+                    item = " ".join(str(item).split())
+                    if item and item not in state[section]:
+                        state[section].append(item)
+        return state
+
+    async def _conclusion(self, state: Dict[str, List[str]]) -> str:
+        """합친 항목으로 결론 작성 (전체 대화가 아니라 항목만 보내므로 턴 수가 늘어도 작음)"""
+        items = "\n\n".join(
+            f"{title}:\n{_bullets(state[section])}"
+            for section, title in zip(SECTIONS, ("주요 논점", "공통점", "차이점", "조언"))
+        )
+        with llm_tags(endpoint="debate_summary", room=self.room_id):
+            response = await chat_completion(
+                route="debate_summary",
+                messages=[
+                    {"role": "system", "content": CONCLUSION_PROMPT},
+                    {"role": "user", "content": f"사용자의 질문: {self.user_concern}\n\n{items}"},
+                ],
+                response_format=CONCLUSION_RESPONSE_FORMAT,
+                max_tokens=SUMMARY_CONCLUSION_MAX_TOKENS,
+                cache=True,
+            )
+        return json.loads(response.choices[0].message.content)["conclusion"].strip()
+
+    def render(self, conclusion: str = "") -> str:
+        """반영된 턴의 항목과 결론으로 SUMMARY_PROMPT 형식의 마크다운 요약 생성"""
+        state = self._sections()
+        comparison = (
+            [f"공통점: {item}" for item in state["common_ground"]]
+            + [f"차이점: {item}" for item in state["differences"]]
+        )
+        return f"""# 대화 요약
+
+## 주요 논점
+{_bullets(state["points"])}
+
+## 공통점과 차이점
+{_bullets(comparison)}
+
+## 핵심 조언
+{_bullets(state["advice"])}
+
+## 결론
+{conclusion or "정리된 결론이 없습니다."}"""
+
+    async def result(self, degraded: Optional[str] = None) -> str:
+        """
+        모든 턴을 반영한 요약 (진행 중인 호출을 기다리고, 실패한 턴은 턴 순서대로 한 번 더 시도한 뒤 결론 작성)
+
+        회로가 열려 반영하지 못한 턴이 남으면, degraded가 주어진 경우 반영된 턴만으로 만든 요약을
+        (반영된 턴이 없으면 degraded 문구를) 반환한다.
+        """
+        await asyncio.gather(*self._tasks)
+        try:
+            for index in range(len(self.turns)):
+                if index not in self.deltas:
+                    await self._delta(index)
+            if not self.deltas:
+                return degraded if degraded is not None else self.render()
+            return self.render(await self._conclusion(self._sections()))
+        except CircuitOpenError:
+            if degraded is None:
+                raise
+            return self.render() if self.deltas else degraded
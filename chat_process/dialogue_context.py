@@ -0,0 +1,128 @@
+import os
+from typing import Dict, List, Optional
+
+from llm_client import chat_completion
+from llm_metrics import llm_tags
+from rate_limiter import estimate_request_tokens
+
+# 요약하지 않고 원문으로 보내는 최근 턴 수
+DEBATE_CONTEXT_TURNS = int(os.getenv("DEBATE_CONTEXT_TURNS", "4"))
+# 턴 호출 하나의 프롬프트 토큰 상한 - 넘으면 오래된 턴부터 요약으로 접음
+DEBATE_CONTEXT_MAX_TOKENS = int(os.getenv("DEBATE_CONTEXT_MAX_TOKENS", "6000"))
+# 누적 요약의 최대 길이(토큰)
+DEBATE_CONTEXT_SUMMARY_TOKENS = int(os.getenv("DEBATE_CONTEXT_SUMMARY_TOKENS", "500"))
+
+ROLLING_SUMMARY_PROMPT = """당신은 두 인물의 토론 내용을 이어서 정리하는 요약자입니다.
+이전 요약과 새로 추가된 발언을 합쳐 하나의 요약으로 다시 작성하세요.
+
+- 각 인물의 핵심 주장, 근거, 상대 의견에 대한 반응을 인물별로 구분해 남기세요.
+- 아직 결론이 나지 않은 쟁점은 빠뜨리지 마세요.
+- 인사말이나 반복되는 표현은 생략하고 간결한 문장으로 작성하세요."""
+
+
+def strip_speaker(text: str, speaker_name: str) -> str:
+    """
+    응답 앞의 따옴표와 '화자 이름: '을 떼고 양끝 따옴표를 제거 (본문 중간의 이름은 그대로 둠)
+
+    스트리밍 중인 부분 응답에도 그대로 쓰므로, 중계한 조각을 이어 붙인 내용과 최종 내용이 같다.
+    """
+    prefix = f"{speaker_name}: "
+    head = text.lstrip('"')
+    if head.startswith(prefix):
+        head = head[len(prefix):]
+    return head.strip('"')
+
+
+def format_turns(turns: List[Dict]) -> str:
+    return "\n".join(f"{turn['speaker']}: {turn['content']}" for turn in turns)
+
+
+class DialogueContext:
+    def __init__(
+        self,
+        system_prompt: str,
+        user_concern: str,
+        keep_turns: int = DEBATE_CONTEXT_TURNS,
+        max_tokens: int = DEBATE_CONTEXT_MAX_TOKENS,
+        room_id: Optional[str] = None
+    ):
+        """
+        토론 턴 호출에 보낼 메시지를 관리하는 컨텍스트 창
+
+        최근 턴은 원문으로 두고, 그보다 오래된 턴은 누적 요약(rolling summary)으로 접어서
+        턴이 늘어나도 호출마다 보내는 토큰 수가 일정 범위 안에 머물게 한다.
+        원문 턴이 keep_turns의 두 배가 되면 오래된 keep_turns개를 한 번에 접으므로, 요약이
+        바뀌지 않는 동안은 메시지 앞부분이 같게 유지되어 프롬프트 캐시를 계속 사용할 수 있다.
+        그래도 max_tokens를 넘으면 최근 한 턴만 남을 때까지 더 접는다.
+
+        Args:
+            system_prompt (str): 페르소나 프로필과 지침
+            user_concern (str): 사용자의 질문
+            keep_turns (int): 원문으로 유지할 최근 턴 수 (최소)
+            max_tokens (int): 턴 호출 하나의 프롬프트 토큰 상한
+            room_id: 요약 호출의 지표 태그
+        """
+        self.system_prompt = system_prompt
+        self.user_concern = user_concern
+        self.keep_turns = max(1, keep_turns)
+        self.max_tokens = max_tokens
+        self.room_id = room_id
+        self.summary = ""
+        self.summarized_turns = 0
+        self.turns: List[Dict] = []
+
+    def add_turn(self, speaker: str, content: str):
+        self.turns.append({"speaker": speaker, "content": content})
+
+    def _messages(self, instruction: str) -> List[Dict]:
+        messages = [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": f"사용자의 질문: {self.user_concern}"},
+        ]
+        if self.summary:
+            messages.append({"role": "system", "content": f"지금까지의 대화 요약 ({self.summarized_turns}턴):\n{self.summary}"})
+        messages += [{"role": "assistant", "content": turn["content"]} for turn in self.turns]
+        messages.append({"role": "user", "content": instruction})
+        return messages
+
+    async def messages(self, instruction: str) -> List[Dict]:
+        """다음 턴 호출에 보낼 메시지 (필요하면 오래된 턴을 먼저 요약으로 접음)"""
+        if len(self.turns) >= self.keep_turns * 2:
+            await self._fold(self.keep_turns)
+
+        messages = self._messages(instruction)
+        while estimate_request_tokens(messages, 0) > self.max_tokens:
+            if not await self._fold(max(1, len(self.turns) - self.keep_turns)):
+                break
+            messages = self._messages(instruction)
+        return messages
+
+    async def _fold(self, count: int) -> bool:
+        """
+        가장 오래된 count개의 턴을 누적 요약에 합침 (최근 한 턴은 항상 남김)
+
+        요약 호출이 실패하면 턴을 그대로 두고 False를 반환한다 (이번 호출은 원문으로 진행).
+        """
+        count = min(count, len(self.turns) - 1)
+        if count <= 0:
+            return False
+        folded = self.turns[:count]
+        previous = f"이전 요약:\n{self.summary}\n\n" if self.summary else ""
+        try:
+            with llm_tags(endpoint="debate_context", room=self.room_id):
+                response = await chat_completion(
+                    route="debate_context",
+                    messages=[
+                        {"role": "system", "content": ROLLING_SUMMARY_PROMPT},
+                        {"role": "user", "content": f"사용자의 질문: {self.user_concern}\n\n{previous}새 발언:\n{format_turns(folded)}"},
+                    ],
+                    temperature=0,
+                    max_tokens=DEBATE_CONTEXT_SUMMARY_TOKENS,
+                )
+        except Exception as e:
+            print(f"Failed to summarize dialogue context: {str(e)}")
+            return False
+        self.summary = response.choices[0].message.content
+        self.summarized_turns += count
+        self.turns = self.turns[count:]
+        return True
@@ -1,16 +1,18 @@
+import asyncio
 import json
-import os
 from datetime import datetime
 from typing import Dict, List, Tuple
 
 from dotenv import load_dotenv
-from openai import OpenAI
 from rich.console import Console
 from rich.markdown import Markdown
 
-load_dotenv()
+from debate_summary import IncrementalSummary
+from dialogue_context import DialogueContext, strip_speaker
+from llm_client import DEGRADED_MESSAGE, chat_completion
+from persona_prompt import persona_prompts
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+load_dotenv()
 
 
 class Persona:
@@ -18,6 +20,7 @@ class Persona:
         """
         페르소나 데이터 초기화
         """
+        self.persona_data = persona_data
         self.basic_info = persona_data.get("basic_info", {})
         self.professional = persona_data.get("professional", {})
         self.personal = persona_data.get("personal", {})
@@ -26,56 +29,7 @@ class Persona:
 
     def get_prompt_context(self) -> str:
         """페르소나의 전체적인 컨텍스트 정보 생성"""
-        achievements = "\n        - ".join(
-            achievement["achievementName"]
-            for achievement in self.professional.get("major_achievements", [])
-        )
-        personality = "\n        - ".join(
-            trait["traitName"] for trait in self.personal.get("personality_traits", [])
-        )
-        key_events = "\n        - ".join(
-            event["eventDescription"]
-            for event in self.historical_context.get("key_events", [])
-        )
-        other_roles = ", ".join(
-            role["roleName"] for role in self.professional.get("other_roles", [])
-        )
-        influences = "\n        - ".join(
-            influence["influenceName"]
-            for influence in self.personal.get("influences", [])
-        )
-
-        return f"""
-    === 페르소나 상세 프로필 ===
-
-    1. 인물 정보
-    - 이름: {self.basic_info.get('name', '')}
-    - 생애: {self.basic_info.get('birth_death', '')}
-    - 시대: {self.basic_info.get('era', '')}
-    - 국적: {self.basic_info.get('nationality', '')}
-
-    2. 직업과 업적
-    - 주요 직책: {self.professional.get('primary_occupation', '')}
-    - 관련 역할: {other_roles}
-    - 주요 업적:
-            - {achievements}
-
-    3. 개인 배경과 성향
-    - 교육 배경: {self.personal.get('education', '')}
-    - 개인 이력: {self.personal.get('background', '')}
-    - 성격 특성:
-            - {personality}
-    - 영향 받은 요소:
-            - {influences}
-
-    4. 역사적 맥락
-    - 시대적 배경: {self.historical_context.get('period_background', '')}
-    - 주요 사건:
-            - {key_events}
-
-    5. 역사적 의의
-    - 역사적 영향: {self.legacy.get('impact', '')}
-    - 현대적 의미: {self.legacy.get('modern_significance', '')}"""
+        return persona_prompts.compile(self.persona_data)["profile_text"]
 
 
 class DialogueSystem:
@@ -117,10 +71,8 @@ class DialogueSystem:
 두 번째 페르소나:
 {self.persona2.get_prompt_context()}
 
-사용자의 질문: {user_concern}
-
 다음 지침을 따라 대화를 생성하세요:
-1. 각 페르소나는 자신의 경험과 관점에서 사용자의 질문에 대해 답변해야 합니다.
+1. 각 페르소나는 자신의 경험과 관점에서 사용자의 질문(첫 번째 사용자 메시지)에 대해 답변해야 합니다.
 2. 대화는 자연스럽게 이어져야 하며, 각자의 시대적 배경과 가치관이 반영되어야 합니다.
 3. 페르소나의 성격 특성과 말투를 반영하여 대화를 생성하세요.
 4. 역사적 맥락과 개인적 경험을 연결지어 답변하도록 합니다.
@@ -129,7 +81,11 @@ class DialogueSystem:
 
 반드시 사용자의 고민에 대한 올바른 조언을 포함해야 합니다."""
 
-        dialogue_messages = [{"role": "system", "content": system_prompt}]
+        # 페르소나 프로필과 지침(system)은 같은 두 인물이면 항상 같은 앞부분이 되도록 두고,
+        # 사용자 질문과 대화 내용처럼 매번 달라지는 부분은 그 뒤에 붙인다 (프롬프트 캐시 재사용)
+        # 오래된 턴은 누적 요약으로 접어 턴 수가 늘어도 호출당 토큰이 일정 범위 안에 머물게 함
+        context = DialogueContext(system_prompt, user_concern, room_id=self.room_id)
+        summarizer = IncrementalSummary(user_concern, room_id=self.room_id)
 
         dialogue = []
         current_persona = self.persona1  # 첫 번째 페르소나부터 시작
@@ -149,15 +105,16 @@ class DialogueSystem:
 페르소나의 시대적 배경, 경험, 성격을 반영한 자연스러운 대화를 생성해주세요.
 현재 턴이 {turn + 1}/{num_turns * 2}입니다. 마지막 턴에 가까워질수록 대화를 자연스럽게 마무리해주세요."""
 
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=dialogue_messages + [{"role": "user", "content": prompt}],
+            response = await chat_completion(
+                route="debate_turn",
+                degraded=DEGRADED_MESSAGE,
+                messages=await context.messages(prompt),
             )
 
             # GPT 응답에서 화자 이름 및 양끝 제거
             content = response.choices[0].message.content
             speaker_name = current_persona.basic_info.get("name")
-            content = content.replace(f"{speaker_name}: ", "").strip('"')
+            content = strip_speaker(content, speaker_name)
 
             dialogue_turn = {
                 "speaker": speaker_name,
@@ -176,7 +133,8 @@ class DialogueSystem:
             self.console.print(Markdown(content))
             self.console.print(Markdown("\n"))
 
-            dialogue_messages.append({"role": "assistant", "content": content})
+            context.add_turn(speaker_name, content)
+            summarizer.add_turn(speaker_name, content)
 
             # 다음 턴을 위해 페르소나 교체
             current_persona, other_persona = other_persona, current_persona
@@ -185,31 +143,8 @@ class DialogueSystem:
             Markdown("\n# 대화 종료\n\n"), style="bold red"
         )  # 임시 마크다운 출력용
 
-        summary_prompt = """지금까지의 대화를 다음 형식으로 마크다운 요약을 작성해주세요:
-
-# 대화 요약
-
-## 주요 논점
-- 각 페르소나가 제시한 핵심 주장
-
-## 공통점과 차이점
-- 두 페르소나의 관점 비교
-
-## 핵심 조언
-- 사용자에게 도움이 될 만한 주요 조언들
-
-## 결론
-사용자의 고민에 대한 최종 조언 요약"""
-
-        summary_response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": summary_prompt},
-                {"role": "user", "content": str(dialogue)},
-            ],
-        )
-
-        summary = summary_response.choices[0].message.content
+        # 턴마다 백그라운드에서 갱신해 온 요약에 남은 턴만 반영
+        summary = await summarizer.result(degraded=DEGRADED_MESSAGE)
 
         self.console.print(Markdown(summary))  # 임시 마크다운 출력용
 
@@ -371,7 +306,7 @@ def main():
 
     # 임시 사용자 질문
     user_concern = "제가 뭘 좋아하고 잘하는 건지 모르겠습니다. 두 분은 어떻게 자신의 장점을 발견하셨나요?"
-    dialogue_system.generate_dialogue(user_concern)
+    asyncio.run(dialogue_system.generate_dialogue(user_concern))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,180 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from psycopg2.extras import execute_values
+
+# 버퍼에 쌓인 메시지를 저장하기까지 기다리는 최대 시간(초)
+MESSAGE_FLUSH_INTERVAL = float(os.getenv("MESSAGE_FLUSH_INTERVAL", "0.5"))
+# 채팅방 버퍼가 이 개수에 이르면 간격을 기다리지 않고 바로 저장
+MESSAGE_FLUSH_MAX_ROWS = int(os.getenv("MESSAGE_FLUSH_MAX_ROWS", "20"))
+# 서버 종료 시 저장에 실패한 채팅방을 다시 시도하는 횟수
+MESSAGE_CLOSE_RETRIES = int(os.getenv("MESSAGE_CLOSE_RETRIES", "3"))
+
+INSERT_MESSAGES = """
+INSERT INTO chat_messages (message_id, room_id, sender_type, sender_id, content, created_at)
+VALUES %s
+"""
+
+
+class MessageWriter:
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        interval: float = MESSAGE_FLUSH_INTERVAL,
+        max_rows: int = MESSAGE_FLUSH_MAX_ROWS
+    ):
+        """
+        채팅방별로 메시지를 모아 여러 행 INSERT 한 번으로 저장하는 write-behind 버퍼
+
+        add()는 DB를 기다리지 않고 message_id와 created_at을 바로 정해 돌려주므로,
+        토론 턴마다 연결을 열고 커밋하는 시간이 턴 생성 경로에서 빠진다.
+        토론이 끝날 때와 서버 종료 시에는 flush()/close()로 남은 메시지를 저장해야 한다.
+
+        메시지 목록은 created_at 순으로 조회하므로, 이 서비스가 저장하는 모든 행(버퍼를 거치지 않는
+        사용자 메시지와 요약 포함)의 created_at은 timestamp() 하나로 정한다. 이 시계는 프로세스 안에서
+        항상 증가하므로 저장 시점(배치)과 관계없이 만든 순서가 유지된다.
+
+        add()가 돌려주는 message_id는 flush()가 끝나기 전까지 DB에 없다. 저장에 끝내 실패하면
+        (close()가 로그로 남기고 버림) 그 message_id로는 메시지를 찾을 수 없다.
+
+        Args:
+            connect: psycopg2 연결을 만드는 함수
+            interval (float): 첫 메시지가 버퍼에 들어온 뒤 저장까지 기다리는 시간(초)
+            max_rows (int): 채팅방 버퍼가 이 개수에 이르면 바로 저장
+        """
+        self.connect = connect
+        self.interval = interval
+        self.max_rows = max(1, max_rows)
+        self.buffers: Dict[uuid.UUID, List[tuple]] = {}
+        self.timers: Dict[uuid.UUID, asyncio.Task] = {}
+        self.locks: Dict[uuid.UUID, asyncio.Lock] = {}
+        # 채팅방 잠금을 쓰고 있거나 기다리는 flush 수 (0이 되면 잠금을 지움)
+        self.lock_users: Dict[uuid.UUID, int] = {}
+        # max_rows로 바로 시작한 flush (예외를 놓치지 않고 close()에서 기다리도록 참조 유지)
+        self.tasks: Set[asyncio.Task] = set()
+        self.last_created: Optional[datetime] = None
+        self.closing = False
+
+    def timestamp(self) -> datetime:
+        """저장할 행의 created_at (직전에 정한 값보다 항상 큼)"""
+        # DB의 now()와 같은 기준이 되도록 로컬 시간대 기준 시각을 사용
+        created_at = datetime.now().astimezone()
+        if self.last_created is not None and created_at <= self.last_created:
+            created_at = self.last_created + timedelta(microseconds=1)
+        self.last_created = created_at
+        return created_at
+
+    def add(self, room_id: uuid.UUID, sender_type: str, sender_id: uuid.UUID, content: str) -> Dict:
+        """메시지를 버퍼에 추가하고 저장될 message_id/created_at을 반환"""
+        created_at = self.timestamp()
+        message = {
+            "message_id": uuid.uuid4(),
+            "content": content,
+            "sender_type": sender_type,
+            "created_at": created_at,
+        }
+        buffer = self.buffers.setdefault(room_id, [])
+        buffer.append((message["message_id"], room_id, sender_type, sender_id, content, created_at))
+
+        if len(buffer) >= self.max_rows:
+            task = asyncio.create_task(self.flush(room_id))
+            self.tasks.add(task)
+            task.add_done_callback(self._task_done)
+        else:
+            self._schedule(room_id)
+        return message
+
+    def _task_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Message flush failed: {str(task.exception())}")
+
+    def _schedule(self, room_id: uuid.UUID):
+        if self.closing:
+            return
+        timer = self.timers.get(room_id)
+        if timer is None or timer.done():
+            timer = asyncio.create_task(self._flush_later(room_id))
+            self.timers[room_id] = timer
+            timer.add_done_callback(lambda task: self._timer_done(room_id, task))
+
+    def _timer_done(self, room_id: uuid.UUID, task: asyncio.Task):
+        if self.timers.get(room_id) is task:
+            del self.timers[room_id]
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Message flush failed for room {room_id}: {str(task.exception())}")
+
+    async def _flush_later(self, room_id: uuid.UUID):
+        await asyncio.sleep(self.interval)
+        # 저장에 실패하면 같은 간격으로 다시 시도 (메시지를 버리지 않음, 종료 중이면 close()가 이어받음)
+        while not await self.flush(room_id) and not self.closing:
+            await asyncio.sleep(self.interval)
+
+    def _insert(self, rows: List[tuple]):
+        conn = self.connect()
+        try:
+            with conn.cursor() as cur:
+                execute_values(cur, INSERT_MESSAGES, rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    async def flush(self, room_id: uuid.UUID) -> bool:
+        """
+        채팅방 버퍼의 메시지를 저장
+
+        같은 채팅방의 저장은 한 번에 하나씩 진행한다. 실패한 메시지는 버퍼 앞에 되돌려
+        다음 저장 때 다시 시도하고 False를 반환한다.
+        """
+        lock = self.locks.setdefault(room_id, asyncio.Lock())
+        self.lock_users[room_id] = self.lock_users.get(room_id, 0) + 1
+        try:
+            async with lock:
+                rows = self.buffers.pop(room_id, [])
+                if not rows:
+                    return True
+                try:
+                    await asyncio.to_thread(self._insert, rows)
+                except Exception as e:
+                    print(f"Failed to save {len(rows)} messages for room {room_id}: {str(e)}")
+                    self.buffers[room_id] = rows + self.buffers.get(room_id, [])
+                    self._schedule(room_id)
+                    return False
+                return True
+        finally:
+            # 기다리는 flush가 없을 때만 지워야 같은 채팅방에 잠금이 둘 생기지 않음
+            self.lock_users[room_id] -= 1
+            if not self.lock_users[room_id]:
+                del self.lock_users[room_id]
+                del self.locks[room_id]
+
+    async def close(self):
+        """
+        서버 종료 시 모든 채팅방 버퍼를 저장
+
+        실패한 채팅방은 MESSAGE_CLOSE_RETRIES번까지 간격을 두고 다시 시도하고,
+        그래도 남은 메시지는 복구할 수 있도록 한 줄씩 로그로 남긴 뒤 버린다.
+        """
+        self.closing = True
+        # INSERT 도중에 취소하면 꺼낸 행을 잃으므로 타이머는 취소하지 않고 한 번 저장을 마칠 때까지 기다림
+        await asyncio.gather(*self.tasks, *self.timers.values(), return_exceptions=True)
+        for attempt in range(MESSAGE_CLOSE_RETRIES + 1):
+            if attempt:
+                await asyncio.sleep(self.interval * 2 ** (attempt - 1))
+            await asyncio.gather(*(self.flush(room_id) for room_id in list(self.buffers)))
+            if not self.buffers:
+                break
+
+        for room_id, rows in self.buffers.items():
+            for message_id, _, sender_type, sender_id, content, created_at in rows:
+                print(
+                    f"Dropped unsaved message {message_id} for room {room_id} "
+                    f"({sender_type} {sender_id} at {created_at.isoformat()}): {content!r}"
+                )
+        self.buffers.clear()
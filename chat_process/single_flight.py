@@ -0,0 +1,79 @@
+import asyncio
+import contextlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        같은 키로 동시에 들어온 작업을 하나로 합치는 단일 실행(single-flight) 그룹
+
+        먼저 들어온 호출이 작업을 시작하고, 작업이 끝나기 전에 같은 키로 들어온 호출은
+        새로 실행하지 않고 같은 결과(또는 예외)를 함께 기다린다. 작업이 끝나면 키를 지우므로
+        결과를 캐시하지는 않는다.
+        """
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.followers += 1
+        # 기다리던 요청 하나가 취소되어도 다른 요청이 기다리는 작업은 계속 진행
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # 모든 요청이 취소되어 아무도 결과를 가져가지 않은 경우의 경고 방지
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {"leaders": self.leaders, "followers": self.followers, "in_flight": len(self._calls)}
+
+
+@contextlib.asynccontextmanager
+async def pg_advisory_lock(
+    connect: Callable[[], Any], key: str, poll_interval: float = 0.2, timeout: float = 300
+) -> AsyncIterator[Any]:
+    """
+    여러 워커/서버에 걸친 단일 실행을 위한 Postgres advisory lock
+
+    트랜잭션 단위 잠금(pg_try_advisory_xact_lock)을 사용하므로 트랜잭션 모드 커넥션 풀러
+    (pgbouncer 등) 뒤에서도 동작하고, 블록을 나가며 롤백할 때 잠금이 풀린다.
+    잠금을 기다리는 동안 스레드를 붙잡지 않도록 poll_interval마다 다시 시도한다.
+
+    Args:
+        connect: psycopg2 연결을 만드는 함수
+        key (str): 잠금 키 (hashtextextended로 64비트 정수로 변환)
+        poll_interval (float): 잠금 재시도 간격(초)
+        timeout (float): 이 시간(초) 안에 잠금을 얻지 못하면 TimeoutError
+    """
+    conn = await asyncio.to_thread(connect)
+
+    def try_lock() -> bool:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_xact_lock(hashtextextended(%s, 0))", (key,))
+            row = cur.fetchone()
+        return bool(row[0] if isinstance(row, (tuple, list)) else next(iter(row.values())))
+
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not await asyncio.to_thread(try_lock):
+            if loop.time() >= deadline:
+                raise TimeoutError(f"advisory lock timeout: {key}")
+            await asyncio.sleep(poll_interval)
+        yield conn
+    finally:
+        await asyncio.to_thread(conn.rollback)
+        await asyncio.to_thread(conn.close)
@@ -0,0 +1,293 @@
+"""
+부하 테스트용 OpenAI 호환 가짜 서버
+
+실제 API 할당량을 쓰지 않고 DialogueSystem, get_ai_response, generate_persona를
+실행해 볼 수 있도록 /v1/chat/completions를 흉내 낸다.
+
+    python main.py                          # http://localhost:8090
+    OPENAI_BASE_URL=http://localhost:8090/v1 python ../chat_process/debate_api.py
+
+- response_format이 json_schema면 스키마를 만족하는 JSON을 생성 (persona 스키마 포함)
+- stream=true면 SSE로 청크를 보내고, stream_options.include_usage면 마지막에 usage 청크 추가
+- 같은 요청이면 같은 응답 (FAKE_SEED로 전체 결과를 바꿀 수 있음)
+- 이전 요청과 메시지 앞부분이 같으면 usage.prompt_tokens_details.cached_tokens로 보고 (프롬프트 캐시 흉내)
+- 지연 시간과 오류 비율은 환경 변수 또는 POST /_config 로 실행 중에 바꿀 수 있음
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+app = FastAPI()
+
+
+class FakeConfig(BaseModel):
+    # 첫 토큰까지의 지연(ms) 분포: fixed | uniform | lognormal
+    latency_distribution: str = os.getenv("FAKE_LATENCY_DISTRIBUTION", "lognormal")
+    # fixed: 그대로 / uniform: 0.5배~1.5배 / lognormal: 중앙값(p50)
+    ttft_ms: float = float(os.getenv("FAKE_TTFT_MS", "400"))
+    # lognormal 분포의 sigma (클수록 꼬리 지연이 길어짐)
+    latency_sigma: float = float(os.getenv("FAKE_LATENCY_SIGMA", "0.5"))
+    # 생성 속도 (0이면 생성 시간 없이 즉시 응답)
+    tokens_per_second: float = float(os.getenv("FAKE_TOKENS_PER_SECOND", "80"))
+    # 요청 비율로 주입할 오류
+    error_rate_429: float = float(os.getenv("FAKE_ERROR_RATE_429", "0"))
+    error_rate_500: float = float(os.getenv("FAKE_ERROR_RATE_500", "0"))
+    retry_after_seconds: float = float(os.getenv("FAKE_RETRY_AFTER", "1"))
+    # 텍스트 응답 길이(토큰)
+    completion_tokens: int = int(os.getenv("FAKE_COMPLETION_TOKENS", "120"))
+    seed: int = int(os.getenv("FAKE_SEED", "0"))
+
+
+config = FakeConfig()
+# 제공자 측 프롬프트 캐시 흉내: 최근에 본 메시지 앞부분(prefix)의 해시
+seen_prefixes: "OrderedDict[str, None]" = OrderedDict()
+PREFIX_CACHE_ENTRIES = 10000
+# OpenAI는 1024토큰 이상인 앞부분을 128토큰 단위로 캐시
+PREFIX_CACHE_MIN_TOKENS = 1024
+PREFIX_CACHE_BLOCK = 128
+# 지연/오류 주입용 난수 (응답 내용과 달리 요청마다 달라야 함)
+chaos = random.Random(config.seed)
+
+WORDS = (
+    "나는 그 시대에 백성과 나라를 위해 많은 고민을 하였소. 어려움 속에서도 원칙을 지키는 것이 "
+    "가장 중요하다고 믿었지요. 당신의 고민 역시 시간이 지나면 길이 보일 것이오. 작은 일부터 "
+    "꾸준히 실천하고, 주변 사람들과 신뢰를 쌓으시오. 실패는 배움의 과정일 뿐이며 "
+    "포기하지 않는 마음이 결국 결과를 만든다오."
+).split()
+
+
+def estimate_tokens(text: str) -> int:
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return max(1, math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) * 0.7))
+
+
+def request_rng(body: Dict[str, Any]) -> random.Random:
+    """같은 요청에는 같은 내용을 생성하도록 요청 본문으로 시드를 정함"""
+    encoded = json.dumps(
+        {"messages": body.get("messages"), "response_format": body.get("response_format"), "seed": config.seed},
+        ensure_ascii=False, sort_keys=True
+    )
+    return random.Random(hashlib.sha256(encoded.encode("utf-8")).hexdigest())
+
+
+def fake_text(rng: random.Random, tokens: int) -> str:
+    words: List[str] = []
+    while estimate_tokens(" ".join(words)) < tokens:
+        words.append(rng.choice(WORDS))
+    return " ".join(words)
+
+
+def fake_value(schema: Dict[str, Any], rng: random.Random, name: str = "") -> Any:
+    """JSON Schema(structured outputs에서 쓰는 범위)를 만족하는 값 생성"""
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    if "anyOf" in schema:
+        return fake_value(rng.choice(schema["anyOf"]), rng, name)
+    kind = schema.get("type", "string")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "null")
+    if kind == "object":
+        return {key: fake_value(sub, rng, key) for key, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        count = max(schema.get("minItems", 0), min(schema.get("maxItems", 5), rng.randint(2, 5)))
+        return [fake_value(schema.get("items", {}), rng, name) for _ in range(count)]
+    if kind == "integer":
+        return rng.randint(schema.get("minimum", 0), schema.get("maximum", 100))
+    if kind == "number":
+        return round(rng.uniform(schema.get("minimum", 0), schema.get("maximum", 1)), 3)
+    if kind == "boolean":
+        return rng.random() < 0.5
+    if kind == "null":
+        return None
+    return f"{name} {fake_text(rng, rng.randint(8, 30))}".strip()
+
+
+def build_content(body: Dict[str, Any], rng: random.Random) -> str:
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        schema = response_format["json_schema"].get("schema", {})
+        return json.dumps(fake_value(schema, rng), ensure_ascii=False)
+    if response_format.get("type") == "json_object":
+        return json.dumps({"content": fake_text(rng, 40)}, ensure_ascii=False)
+    tokens = min(body.get("max_tokens") or body.get("max_completion_tokens") or config.completion_tokens,
+                 config.completion_tokens)
+    return fake_text(rng, tokens)
+
+
+def sample_ttft() -> float:
+    """설정한 분포에서 첫 토큰까지의 지연(초) 추출"""
+    if config.latency_distribution == "fixed":
+        ms = config.ttft_ms
+    elif config.latency_distribution == "uniform":
+        ms = chaos.uniform(config.ttft_ms * 0.5, config.ttft_ms * 1.5)
+    else:
+        ms = chaos.lognormvariate(math.log(max(config.ttft_ms, 1)), config.latency_sigma)
+    return ms / 1000
+
+
+def injected_error() -> Optional[JSONResponse]:
+    roll = chaos.random()
+    if roll < config.error_rate_429:
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after": str(config.retry_after_seconds)},
+            content={"error": {"message": "Rate limit reached (injected)", "type": "requests",
+                               "param": None, "code": "rate_limit_exceeded"}}
+        )
+    if roll < config.error_rate_429 + config.error_rate_500:
+        return JSONResponse(
+            status_code=500,
+            content={"error": {"message": "Internal server error (injected)", "type": "server_error",
+                               "param": None, "code": None}}
+        )
+    return None
+
+
+def prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    total = 0
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        total += estimate_tokens(content) + 4
+    return total
+
+
+def cached_prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    """이전 요청과 메시지 단위로 겹치는 가장 긴 앞부분의 토큰 수 (캐시 적중으로 보고)"""
+    cached = 0
+    digest = hashlib.sha256()
+    for index, message in enumerate(messages):
+        digest.update(json.dumps(message, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+        key = digest.hexdigest()
+        if key in seen_prefixes:
+            seen_prefixes.move_to_end(key)
+            cached = prompt_tokens(messages[:index + 1])
+        else:
+            seen_prefixes[key] = None
+    while len(seen_prefixes) > PREFIX_CACHE_ENTRIES:
+        seen_prefixes.popitem(last=False)
+    if cached < PREFIX_CACHE_MIN_TOKENS:
+        return 0
+    return cached // PREFIX_CACHE_BLOCK * PREFIX_CACHE_BLOCK
+
+
+def usage(body: Dict[str, Any], content: str) -> Dict[str, Any]:
+    messages = body.get("messages", [])
+    prompt = prompt_tokens(messages)
+    completion = estimate_tokens(content)
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": prompt + completion,
+        "prompt_tokens_details": {"cached_tokens": cached_prompt_tokens(messages)},
+    }
+
+
+def split_chunks(content: str, size: int = 8) -> List[str]:
+    return [content[i:i + size] for i in range(0, len(content), size)] or [""]
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    error = injected_error()
+    ttft = sample_ttft()
+    if error is not None:
+        await asyncio.sleep(ttft)
+        return error
+
+    content = build_content(body, request_rng(body))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    model = body.get("model", "gpt-4o")
+    token_delay = 1 / config.tokens_per_second if config.tokens_per_second > 0 else 0
+
+    if not body.get("stream"):
+        await asyncio.sleep(ttft + estimate_tokens(content) * token_delay)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content, "refusal": None},
+                "logprobs": None,
+                "finish_reason": "stop"
+            }],
+            "usage": usage(body, content),
+            "system_fingerprint": "fake"
+        }
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra: Any) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}],
+            **extra
+        }
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    async def events():
+        await asyncio.sleep(ttft)
+        yield chunk({"role": "assistant", "content": ""})
+        for piece in split_chunks(content):
+            yield chunk({"content": piece})
+            await asyncio.sleep(estimate_tokens(piece) * token_delay)
+        yield chunk({}, "stop")
+        if include_usage:
+            payload = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [], "usage": usage(body, content)
+            }
+            yield f"data: {json.dumps(payload)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/v1/models")
+async def list_models():
+    return {
+        "object": "list",
+        "data": [
+            {"id": model, "object": "model", "created": 0, "owned_by": "fake"}
+            for model in ("gpt-4o", "gpt-4o-mini")
+        ]
+    }
+
+
+@app.get("/_config")
+async def get_config():
+    return config
+
+
+@app.post("/_config")
+async def update_config(update: Dict[str, Any]):
+    """실행 중에 지연/오류 설정 변경 (예: {"error_rate_429": 0.1, "ttft_ms": 800})"""
+    global config, chaos
+    config = FakeConfig(**{**config.model_dump(), **update})
+    if "seed" in update:
+        chaos = random.Random(config.seed)
+    return config
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("FAKE_OPENAI_PORT", "8090")))
@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from llm_metrics import metrics
+
+# 최근 이 시간(초) 동안의 호출 결과로 오류 비율을 계산
+LLM_BREAKER_WINDOW = float(os.getenv("LLM_BREAKER_WINDOW", "60"))
+# 이 수보다 적게 호출했으면 열지 않음
+LLM_BREAKER_MIN_REQUESTS = int(os.getenv("LLM_BREAKER_MIN_REQUESTS", "20"))
+# 오류 비율이 이보다 높으면 회로를 엶
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+# 연 뒤 이 시간(초)이 지나면 호출 하나만 시험 삼아 보냄 (half-open)
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+
+class CircuitOpenError(Exception):
+    """회로가 열려 있어 제공자를 호출하지 않고 바로 실패"""
+
+    def __init__(self, model: str):
+        super().__init__(f"circuit open: {model}")
+        self.model = model
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        window: float = LLM_BREAKER_WINDOW,
+        min_requests: int = LLM_BREAKER_MIN_REQUESTS,
+        error_rate: float = LLM_BREAKER_ERROR_RATE,
+        cooldown: float = LLM_BREAKER_COOLDOWN
+    ):
+        """
+        모델별 회로 차단기 (closed -> open -> half_open -> closed)
+
+        제공자 오류(연결/타임아웃/5xx) 비율이 높아지면 회로를 열고 cooldown 동안 해당 모델 호출을
+        CircuitOpenError로 즉시 실패시킨다. 이후 호출 하나를 시험으로 보내 성공하면 닫고,
+        실패하면 다시 연다. 시험 호출에는 before_call()이 돌려준 토큰이 있어야 하므로,
+        회로가 열리기 전에 시작해 half-open 중에 끝난 호출은 상태를 바꾸지 않는다.
+        429는 제공자 장애가 아니라 한도 문제이므로 세지 않는다.
+        """
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self._outcomes: Dict[str, Deque[Tuple[float, bool]]] = {}
+        self._opened_at: Dict[str, float] = {}
+        # 모델별 진행 중인 시험 호출의 토큰
+        self._probing: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def state(self, model: str) -> str:
+        with self._lock:
+            opened_at = self._opened_at.get(model)
+        if opened_at is None:
+            return "closed"
+        return "open" if time.time() - opened_at < self.cooldown else "half_open"
+
+    def before_call(self, model: str) -> Optional[object]:
+        """
+        호출 전에 확인 - 열려 있거나 다른 시험 호출이 진행 중이면 CircuitOpenError
+
+        Returns:
+            half-open에서 시험 호출로 허용된 경우 그 호출의 토큰 (record()에 그대로 넘김), 아니면 None
+        """
+        with self._lock:
+            opened_at = self._opened_at.get(model)
+            if opened_at is None:
+                return None
+            if time.time() - opened_at < self.cooldown or model in self._probing:
+                metrics.inc("llm_circuit_rejected_total", model=model)
+                raise CircuitOpenError(model)
+            probe = object()
+            self._probing[model] = probe
+            return probe
+
+    def record(self, model: str, ok: Optional[bool], probe: Optional[object] = None):
+        """
+        호출 결과 기록
+
+        Args:
+            ok (bool): 성공 True, 제공자 오류 False, 판단에 쓰지 않는 결과(429, 취소)는 None
+            probe: before_call()이 돌려준 토큰 - 진행 중인 시험 호출의 토큰일 때만 half-open 상태를 바꿈
+        """
+        with self._lock:
+            is_probe = probe is not None and self._probing.get(model) is probe
+            if is_probe:
+                del self._probing[model]
+            if ok is None:
+                return
+            now = time.time()
+            if model in self._opened_at:
+                if is_probe:
+                    self._transition(model, "closed" if ok else "open", now)
+                return
+            outcomes = self._outcomes.setdefault(model, deque())
+            outcomes.append((now, ok))
+            while outcomes and outcomes[0][0] < now - self.window:
+                outcomes.popleft()
+            errors = sum(1 for _, success in outcomes if not success)
+            if len(outcomes) >= self.min_requests and errors / len(outcomes) > self.error_rate:
+                self._transition(model, "open", now)
+
+    def _transition(self, model: str, state: str, now: float):
+        if state == "open":
+            self._opened_at[model] = now
+        else:
+            self._opened_at.pop(model, None)
+            self._outcomes.pop(model, None)
+        print(f"LLM 회로 {state}: {model}")
+        metrics.inc("llm_circuit_transitions_total", model=model, state=state)
+
+    def stats(self) -> Dict[str, str]:
+        with self._lock:
+            models = set(self._outcomes) | set(self._opened_at)
+        return {model: self.state(model) for model in sorted(models)}
+
+
+# 프로세스 전체에서 공유
+breaker = CircuitBreaker()
@@ -1,37 +1,220 @@
-from openai import OpenAI
-from typing import Dict, Any
+from typing import AsyncIterator, Dict, Any, List, Tuple
+import hashlib
 import json
 from dotenv import load_dotenv
+from llm_client import chat_completion, stream_chat_completion
+from json_stream import IncrementalJsonParser
+from content_selector import CONTENT_TOKEN_BUDGET, select_categories, select_content
 
 load_dotenv()
 
-client = OpenAI()
+# 최대 8192 토큰을 생성하므로 일반 호출보다 길게 기다림
+PERSONA_TIMEOUT = 180
 
-async def generate_persona(wiki_data: Dict[str, Any]) -> Dict[str, Any]:
+PERSONA_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+    "name": "historical_figure_persona_profile",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+        "basic_info": {
+            "type": "object",
+            "properties": {
+            "name": {
+                "type": "string",
+                "description": "Name of the historical figure or Wikipedia page URL."
+            },
+            "birth_death": {
+                "type": "string",
+                "description": "Birth and death years."
+            },
+            "era": {
+                "type": "string",
+                "description": "Era during which the figure lived."
+            },
+            "nationality": {
+                "type": "string",
+                "description": "Nationality or origin of the historical figure."
+            },
+            "gender": {
+                "type": "string",
+                "description": "Gender of the historical figure."
+            }
+            },
+            "required": [
+            "name",
+            "birth_death",
+            "era",
+            "nationality",
+            "gender"
+            ],
+            "additionalProperties": False
+        },
+        "professional": {
+            "type": "object",
+            "properties": {
+            "primary_occupation": {
+                "type": "string",
+                "description": "Primary occupation of the historical figure."
+            },
+            "other_roles": {
+                "type": "array",
+                "description": "Other roles the historical figure was involved in.",
+                "items": {
+                "type": "string"
+                }
+            },
+            "major_achievements": {
+                "type": "array",
+                "description": "Significant achievements of the historical figure.",
+                "items": {
+                "type": "string"
+                }
+            }
+            },
+            "required": [
+            "primary_occupation",
+            "other_roles",
+            "major_achievements"
+            ],
+            "additionalProperties": False
+        },
+        "personal": {
+            "type": "object",
+            "properties": {
+            "education": {
+                "type": "string",
+                "description": "Educational background of the historical figure."
+            },
+            "background": {
+                "type": "string",
+                "description": "Background information about the figure."
+            },
+            "personality_traits": {
+                "type": "array",
+                "description": "Traits or characteristics of the historical figure.",
+                "items": {
+                "type": "string"
+                }
+            },
+            "influences": {
+                "type": "array",
+                "description": "Influences on the historical figure's life.",
+                "items": {
+                "type": "string"
+                }
+            }
+            },
+            "required": [
+            "education",
+            "background",
+            "personality_traits",
+            "influences"
+            ],
+            "additionalProperties": False
+        },
+        "legacy": {
+            "type": "object",
+            "properties": {
+            "impact": {
+                "type": "string",
+                "description": "The impact the historical figure had on history."
+            },
+            "modern_significance": {
+                "type": "string",
+                "description": "The modern significance of the historical figure."
+            }
+            },
+            "required": [
+            "impact",
+            "modern_significance"
+            ],
+            "additionalProperties": False
+        },
+        "historical_context": {
+            "type": "object",
+            "properties": {
+            "period_background": {
+                "type": "string",
+                "description": "Socio-cultural background of the period in which the figure lived."
+            },
+            "key_events": {
+                "type": "array",
+                "description": "Key events that were influential during the historical figure's lifetime.",
+                "items": {
+                "type": "string"
+                }
+            }
+            },
+            "required": [
+            "period_background",
+            "key_events"
+            ],
+            "additionalProperties": False
+        }
+        },
+        "required": [
+        "basic_info",
+        "professional",
+        "personal",
+        "legacy",
+        "historical_context"
+        ],
+        "additionalProperties": False
+    }
+    }
+}
+
+# 프롬프트 문구를 바꾸면 올려서 이전 생성 결과를 재사용하지 않도록 함
+PERSONA_PROMPT_VERSION = "2"
+
+def persona_cache_key(wiki_data: Dict[str, Any]) -> str:
     """
-    Wikipedia 데이터를 기반으로 GPT를 사용하여 상세한 persona 정보를 생성
-    
-    Args:
-        wiki_data (Dict[str, Any]): Wikipedia API에서 가져온 인물 정보
-        
-    Returns:
-        Dict[str, Any]: 생성된 persona 정보
+    persona 생성 결과를 재사용하기 위한 키
+
+    프롬프트에 들어가는 위키 데이터를 정규화한 값과 프롬프트/스키마 버전을
+    함께 해시하므로, 위키 내용이나 프롬프트가 바뀌면 키도 바뀐다.
     """
-    
-    # System prompt 구성
-    system_message = {
-        "role": "system",
-        "content": [
-            {
-                "type": "text",
-                "text": f"""다음 Wikipedia 정보를 기반으로 상세한 인물 프로필을 생성해주세요:
+    payload = {
+        "title": wiki_data["basic_info"]["title"],
+        "birth_death": wiki_data["basic_info"]["birth_death"],
+        "nationality": wiki_data["basic_info"]["nationality"],
+        "content": " ".join(wiki_data.get("content", "").split()),
+        "categories": wiki_data.get("categories", []),
+        "sections": [section["title"] for section in wiki_data.get("sections", [])],
+        "prompt_version": PERSONA_PROMPT_VERSION,
+        "content_token_budget": CONTENT_TOKEN_BUDGET,
+        "schema": PERSONA_RESPONSE_FORMAT,
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def build_persona_messages(wiki_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    persona 생성 요청 메시지 구성
+
+    본문은 섹션 정보를 이용해 프로필에 유용한 문단을 골라 토큰 예산 안에서만 넣는다.
+    """
+    content = select_content(wiki_data['content'], wiki_data.get('sections', []))
+    categories = select_categories(wiki_data['categories'])
+
+    return [
+        {
+            "role": "system",
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"""다음 Wikipedia 정보를 기반으로 상세한 인물 프로필을 생성해주세요:
 
 제목: {wiki_data['basic_info']['title']}
 생몰년: {wiki_data['basic_info']['birth_death']}
 국적: {wiki_data['basic_info']['nationality']}
-내용: {wiki_data['content'][:3000]}  # 처음 3000자만 사용
+내용:
+{content}
 
-카테고리: {', '.join(wiki_data['categories'][:10])}
+카테고리: {', '.join(categories)}
 
 다음 구조에 맞춰 프로필을 생성해주세요:
 1. 기본 정보 (시대, 성별 포함)
@@ -41,191 +224,90 @@ async def generate_persona(wiki_data: Dict[str, Any]) -> Dict[str, Any]:
 5. 역사적 맥락 (시대적 배경, 주요 사건들)
 
 가능한 한 상세하고 정확하게 작성해주세요."""
-            }
-        ]
-    }
-
-    # GPT API 호출
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {
-            "role": "system",
-            "content": [
-                {
-                "type": "text",
-                "text": f"{system_message}"
                 }
             ]
-            }
-        ],
-        response_format={
-            "type": "json_schema",
-            "json_schema": {
-            "name": "historical_figure_persona_profile",
-            "strict": True,
-            "schema": {
-                "type": "object",
-                "properties": {
-                "basic_info": {
-                    "type": "object",
-                    "properties": {
-                    "name": {
-                        "type": "string",
-                        "description": "Name of the historical figure or Wikipedia page URL."
-                    },
-                    "birth_death": {
-                        "type": "string",
-                        "description": "Birth and death years."
-                    },
-                    "era": {
-                        "type": "string",
-                        "description": "Era during which the figure lived."
-                    },
-                    "nationality": {
-                        "type": "string",
-                        "description": "Nationality or origin of the historical figure."
-                    },
-                    "gender": {
-                        "type": "string",
-                        "description": "Gender of the historical figure."
-                    }
-                    },
-                    "required": [
-                    "name",
-                    "birth_death",
-                    "era",
-                    "nationality",
-                    "gender"
-                    ],
-                    "additionalProperties": False
-                },
-                "professional": {
-                    "type": "object",
-                    "properties": {
-                    "primary_occupation": {
-                        "type": "string",
-                        "description": "Primary occupation of the historical figure."
-                    },
-                    "other_roles": {
-                        "type": "array",
-                        "description": "Other roles the historical figure was involved in.",
-                        "items": {
-                        "type": "string"
-                        }
-                    },
-                    "major_achievements": {
-                        "type": "array",
-                        "description": "Significant achievements of the historical figure.",
-                        "items": {
-                        "type": "string"
-                        }
-                    }
-                    },
-                    "required": [
-                    "primary_occupation",
-                    "other_roles",
-                    "major_achievements"
-                    ],
-                    "additionalProperties": False
-                },
-                "personal": {
-                    "type": "object",
-                    "properties": {
-                    "education": {
-                        "type": "string",
-                        "description": "Educational background of the historical figure."
-                    },
-                    "background": {
-                        "type": "string",
-                        "description": "Background information about the figure."
-                    },
-                    "personality_traits": {
-                        "type": "array",
-                        "description": "Traits or characteristics of the historical figure.",
-                        "items": {
-                        "type": "string"
-                        }
-                    },
-                    "influences": {
-                        "type": "array",
-                        "description": "Influences on the historical figure's life.",
-                        "items": {
-                        "type": "string"
-                        }
-                    }
-                    },
-                    "required": [
-                    "education",
-                    "background",
-                    "personality_traits",
-                    "influences"
-                    ],
-                    "additionalProperties": False
-                },
-                "legacy": {
-                    "type": "object",
-                    "properties": {
-                    "impact": {
-                        "type": "string",
-                        "description": "The impact the historical figure had on history."
-                    },
-                    "modern_significance": {
-                        "type": "string",
-                        "description": "The modern significance of the historical figure."
-                    }
-                    },
-                    "required": [
-                    "impact",
-                    "modern_significance"
-                    ],
-                    "additionalProperties": False
-                },
-                "historical_context": {
-                    "type": "object",
-                    "properties": {
-                    "period_background": {
-                        "type": "string",
-                        "description": "Socio-cultural background of the period in which the figure lived."
-                    },
-                    "key_events": {
-                        "type": "array",
-                        "description": "Key events that were influential during the historical figure's lifetime.",
-                        "items": {
-                        "type": "string"
-                        }
-                    }
-                    },
-                    "required": [
-                    "period_background",
-                    "key_events"
-                    ],
-                    "additionalProperties": False
-                }
-                },
-                "required": [
-                "basic_info",
-                "professional",
-                "personal",
-                "legacy",
-                "historical_context"
-                ],
-                "additionalProperties": False
-            }
-            }
-        },
+        }
+    ]
+
+async def generate_persona(wiki_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Wikipedia 데이터를 기반으로 GPT를 사용하여 상세한 persona 정보를 생성
+    
+    Args:
+        wiki_data (Dict[str, Any]): Wikipedia API에서 가져온 인물 정보
+        
+    Returns:
+        Dict[str, Any]: 생성된 persona 정보
+    """
+    # GPT API 호출
+    response = await chat_completion(
+        timeout=PERSONA_TIMEOUT,
+        route="persona_generation",
+        messages=build_persona_messages(wiki_data),
+        response_format=PERSONA_RESPONSE_FORMAT,
         temperature=1,
         max_tokens=8192
     )
 
-    # Wikipedia 데이터에서 가져온 기본 정보 추가
-    persona_data = json.loads(response.choices[0].message.content)
+    return parse_persona_content(response.choices[0].message.content, wiki_data)
+
+def build_persona_request(wiki_data: Dict[str, Any], model: str) -> Dict[str, Any]:
+    """generate_persona와 같은 요청 본문 (batch 파일처럼 chat_completion을 거치지 않고 보낼 때 사용)"""
+    return {
+        "model": model,
+        "messages": build_persona_messages(wiki_data),
+        "response_format": PERSONA_RESPONSE_FORMAT,
+        "temperature": 1,
+        "max_tokens": 8192
+    }
+
+def parse_persona_content(content: str, wiki_data: Dict[str, Any]) -> Dict[str, Any]:
+    """GPT 응답 본문(JSON)을 persona 정보로 변환"""
+    persona_data = json.loads(content)
     
     # Wikipedia에서 가져온 기본 정보로 업데이트
-    persona_data["basic_info"].update({
+    apply_wiki_basic_info(persona_data["basic_info"], wiki_data)
+
+    return persona_data
+
+def apply_wiki_basic_info(basic_info: Dict[str, Any], wiki_data: Dict[str, Any]) -> Dict[str, Any]:
+    """이름/생몰년/국적은 GPT 결과 대신 Wikipedia 값을 사용"""
+    basic_info.update({
         "name": wiki_data["basic_info"]["title"],
         "birth_death": wiki_data["basic_info"]["birth_death"],
         "nationality": wiki_data["basic_info"]["nationality"]
     })
+    return basic_info
+
+async def stream_persona(wiki_data: Dict[str, Any]) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    generate_persona의 스트리밍 버전
+
+    같은 스키마로 스트리밍 호출하고, 응답 JSON을 받는 즉시 파싱하여
+    최상위 섹션(basic_info, professional, ...)이 닫힐 때마다 (섹션 이름, 값)을 반환한다.
+    전체 응답을 기다리지 않고 첫 섹션을 바로 보여줄 수 있다.
+    """
+    parser = IncrementalJsonParser(max_depth=1)
+    sections = PERSONA_RESPONSE_FORMAT["json_schema"]["schema"]["required"]
+    emitted = set()
+
+    async for delta in stream_chat_completion(
+        timeout=PERSONA_TIMEOUT,
+        route="persona_generation",
+        messages=build_persona_messages(wiki_data),
+        response_format=PERSONA_RESPONSE_FORMAT,
+        temperature=1,
+        max_tokens=8192
+    ):
+        for path, value in parser.feed(delta):
+            if len(path) != 1:
+                continue
+            section = path[0]
+            if section == "basic_info":
+                apply_wiki_basic_info(value, wiki_data)
+            emitted.add(section)
+            yield section, value
 
-    return persona_data
\ No newline at end of file
+    missing = [section for section in sections if section not in emitted]
+    if missing:
+        raise ValueError(f"Incomplete persona response: missing {', '.join(missing)}")
\ No newline at end of file
@@ -1,19 +1,28 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, validator
 from typing import List, Optional, Dict
 from datetime import datetime
 import psycopg2
 from psycopg2.extras import RealDictCursor, register_uuid
 import uuid
+import asyncio
+import contextlib
 from contextlib import contextmanager
-from openai import OpenAI
 import os
 import httpx
 import json
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from wiki import WikipediaPersonSearch
-from gpt_generator import generate_persona
+from wiki_cache import WikiCache
+from wiki_dump import WikiDumpIndex
+from gpt_generator import generate_persona, persona_cache_key
+from llm_client import DEGRADED_MESSAGE, chat_completion, close_client, render_metrics
+from llm_metrics import llm_tags
+from persona_prompt import name_key, persona_prompts
+from persona_store import PERSONA_KEYS_DDL, find_persona_by_key, insert_persona
+from single_flight import SingleFlight, pg_advisory_lock
 load_dotenv()
 
 app = FastAPI()
@@ -27,7 +36,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# 요청 간 keep-alive 연결을 재사용하도록 모듈 단위로 공유
+# WIKI_DUMP_PATH가 설정되어 있으면 오프라인 덤프 색인에서 조회
+WIKI_DUMP_PATH = os.getenv("WIKI_DUMP_PATH")
+wiki_search = WikipediaPersonSearch(
+    cache=WikiCache(),
+    dump=WikiDumpIndex(WIKI_DUMP_PATH) if WIKI_DUMP_PATH else None
+)
+
+# 같은 persona 생성 요청을 하나로 합침 (PERSONA_ADVISORY_LOCK=1이면 워커 간에도 DB 잠금으로 합침)
+persona_flights = SingleFlight()
+PERSONA_ADVISORY_LOCK = os.getenv("PERSONA_ADVISORY_LOCK", "0") == "1"
 PERSONA_API_BASE = "https://port-0-back-m1ung2x3f53d462a.sel4.cloudtype.app"
 
 # Database configuration
@@ -44,6 +63,8 @@ def get_db_connection():
 # Pydantic models for request/response
 class PersonaRequest(BaseModel):
     name: str
+    # True면 같은 위키 데이터로 생성된 persona가 있어도 다시 생성
+    force: bool = False
 # Pydantic models
 class MessageCreate(BaseModel):
     content: str
@@ -84,129 +105,105 @@ def get_db_cursor():
     finally:
         conn.close()
 
-async def insert_persona_data(persona_data: Dict, wiki_data: Dict) -> str:
-    person_id = str(uuid.uuid4())
-    
-    with get_db_connection() as conn:
+async def insert_persona_data(persona_data: Dict, wiki_data: Dict, dedupe_key: Optional[str] = None) -> str:
+    # psycopg2 호출이 이벤트 루프를 막지 않도록 스레드에서 실행
+    return await asyncio.to_thread(save_persona_data, persona_data, wiki_data, dedupe_key)
+
+def save_persona_data(persona_data: Dict, wiki_data: Dict, dedupe_key: Optional[str] = None) -> str:
+    conn = get_db_connection()
+    try:
         with conn.cursor() as cur:
-            try:
-                # Begin transaction
-                cur.execute("BEGIN")
-                
-                # 1. Insert basic info
-                cur.execute("""
-                    INSERT INTO basic_info (person_id, name, birth_death, era, nationality, gender, image_url)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    person_id,
-                    persona_data["basic_info"]["name"],
-                    persona_data["basic_info"]["birth_death"],
-                    persona_data["basic_info"]["era"],
-                    persona_data["basic_info"]["nationality"],
-                    persona_data["basic_info"]["gender"],
-                    wiki_data.get("basic_info", {}).get("image_url")
-                ))
-
-                # 2. Insert professional info
-                cur.execute("""
-                    INSERT INTO professional_info (person_id, primary_occupation)
-                    VALUES (%s, %s)
-                """, (person_id, persona_data["professional"]["primary_occupation"]))
-
-                # 3. Insert other roles
-                for role in persona_data["professional"]["other_roles"]:
-                    cur.execute("""
-                        INSERT INTO other_roles (person_id, role_name)
-                        VALUES (%s, %s)
-                    """, (person_id, role))
-
-                # 4. Insert major achievements
-                for achievement in persona_data["professional"]["major_achievements"]:
-                    cur.execute("""
-                        INSERT INTO major_achievements (person_id, achievement_name)
-                        VALUES (%s, %s)
-                    """, (person_id, achievement))
-
-                # 5. Insert personal info
-                cur.execute("""
-                    INSERT INTO personal_info (person_id, education, background)
-                    VALUES (%s, %s, %s)
-                """, (
-                    person_id,
-                    persona_data["personal"]["education"],
-                    persona_data["personal"]["background"]
-                ))
-
-                # 6. Insert personality traits
-                for trait in persona_data["personal"]["personality_traits"]:
-                    cur.execute("""
-                        INSERT INTO personality_traits (person_id, trait_name)
-                        VALUES (%s, %s)
-                    """, (person_id, trait))
-
-                # 7. Insert influences
-                for influence in persona_data["personal"]["influences"]:
-                    cur.execute("""
-                        INSERT INTO influences (person_id, influence_name)
-                        VALUES (%s, %s)
-                    """, (person_id, influence))
-
-                # 8. Insert legacy
-                cur.execute("""
-                    INSERT INTO legacy (person_id, impact, modern_significance)
-                    VALUES (%s, %s, %s)
-                """, (
-                    person_id,
-                    persona_data["legacy"]["impact"],
-                    persona_data["legacy"]["modern_significance"]
-                ))
-
-                # 9. Insert historical context
-                cur.execute("""
-                    INSERT INTO historical_context (person_id, period_background)
-                    VALUES (%s, %s)
-                """, (
-                    person_id,
-                    persona_data["historical_context"]["period_background"]
-                ))
-
-                # 10. Insert key events
-                for event in persona_data["historical_context"]["key_events"]:
-                    cur.execute("""
-                        INSERT INTO key_events (person_id, event_description)
-                        VALUES (%s, %s)
-                    """, (person_id, event))
-
-                # Commit transaction
-                conn.commit()
-                return person_id
-
-            except Exception as e:
-                conn.rollback()
-                raise e
+            person_id = insert_persona(cur, persona_data, wiki_data, dedupe_key)
+        conn.commit()
+        return person_id
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+def get_generated_persona(dedupe_key: str) -> Optional[str]:
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            return find_persona_by_key(cur, dedupe_key)
+    finally:
+        conn.close()
+
+async def find_generated_persona(dedupe_key: str) -> Optional[str]:
+    """같은 위키 데이터와 프롬프트로 이미 생성된 persona의 person_id 조회"""
+    return await asyncio.to_thread(get_generated_persona, dedupe_key)
+
+def ensure_persona_schema():
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(PERSONA_KEYS_DDL)
+        conn.commit()
+    finally:
+        conn.close()
+
+@app.on_event("startup")
+async def prepare_persona_schema():
+    await asyncio.to_thread(ensure_persona_schema)
+
+@app.on_event("shutdown")
+async def shutdown_resources():
+    await wiki_search.aclose()
+    wiki_search.cache.close()
+    await close_client()
 
 @app.post("/persona_generator")
 async def create_persona(request: PersonaRequest):
     try:
-        # 1. Wikipedia에서 데이터 가져오기
-        wiki_search = WikipediaPersonSearch()
-        wiki_data = wiki_search.search_person(request.name, summary_only=False)
-        
-        if not wiki_data:
-            raise HTTPException(status_code=404, detail="Person not found in Wikipedia")
-
-        # 2. GPT를 통해 persona 생성
-        persona_data = await generate_persona(wiki_data)
-        print(persona_data)
-        # 3. DB에 데이터 저장
-        person_id = await insert_persona_data(persona_data, wiki_data)
-        return {"status": "success", "person_id": person_id}
+        # 같은 이름으로 동시에 들어온 요청은 위키 조회/GPT 생성/저장을 한 번만 실행
+        key = (" ".join(request.name.split()).casefold(), request.force)
+        result = await persona_flights.do(key, lambda: build_persona(request.name, request.force))
+        return dict(result)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def persona_generation_lock(dedupe_key: str):
+    """PERSONA_ADVISORY_LOCK이면 다른 워커와 같은 persona를 동시에 생성하지 않도록 DB 잠금"""
+    if PERSONA_ADVISORY_LOCK:
+        return pg_advisory_lock(get_db_connection, f"persona:{dedupe_key}")
+    return contextlib.nullcontext()
+
+async def build_persona(name: str, force: bool) -> Dict:
+    # 1. Wikipedia에서 데이터 가져오기
+    wiki_data = await wiki_search.search_person(name, summary_only=False)
+    
+    if not wiki_data:
+        raise HTTPException(status_code=404, detail="Person not found in Wikipedia")
+
+    dedupe_key = persona_cache_key(wiki_data)
+    async with persona_generation_lock(dedupe_key):
+        # 2. 같은 위키 데이터로 생성된 persona가 있으면 재사용
+        # (잠금을 기다리는 동안 다른 워커가 저장했을 수 있으므로 잠금 안에서 확인)
+        if not force:
+            person_id = await find_generated_persona(dedupe_key)
+            if person_id:
+                return {"status": "success", "person_id": person_id, "cached": True}
+
+        # 3. GPT를 통해 persona 생성
+        with llm_tags(endpoint="persona_generator", persona=name):
+            persona_data = await generate_persona(wiki_data)
+        print(persona_data)
+        # 4. DB에 데이터 저장
+        person_id = await insert_persona_data(persona_data, wiki_data, dedupe_key)
+        # get_ai_response는 이름으로 페르소나를 불러오므로 같은 이름 키의 이전 프롬프트를 제거
+        persona_prompts.invalidate(name_key(name))
+        return {"status": "success", "person_id": person_id, "cached": False}
+
+# 같은 이름의 동시 조회는 HTTP 호출 한 번으로 합침
+persona_fetches = SingleFlight()
+
 async def fetch_persona_info(name: str) -> Dict:
     """외부 API에서 페르소나 정보 조회"""
+    return await persona_fetches.do(name, lambda: _fetch_persona_info(name))
+
+async def _fetch_persona_info(name: str) -> Dict:
     async with httpx.AsyncClient() as client:
         response = await client.get(f"{PERSONA_API_BASE}/persons", params={"name": name})
         if response.status_code != 200:
@@ -215,42 +212,26 @@ async def fetch_persona_info(name: str) -> Dict:
 
 def create_persona_prompt(persona_data: Dict) -> str:
     """페르소나 데이터를 기반으로 시스템 프롬프트 생성"""
-    prompt = f"""당신은 {persona_data['name']}입니다. 
-생애: {persona_data['birthDeath']}
-시대: {persona_data['era']}
-국적: {persona_data['nationality']}
-
-직업: {', '.join(p['primaryOccupation'] for p in persona_data['professionalInfo'])}
-다른 역할: {', '.join(r['roleName'] for r in persona_data['otherRoles'])}
-
-주요 업적:
-{chr(10).join('- ' + a['achievementName'] for a in persona_data['achievements'])}
-
-개인 배경:
-교육: {persona_data['personalInfo']['education']}
-배경: {persona_data['personalInfo']['background']}
+    return persona_prompts.compile(persona_data)["roleplay_text"]
 
-성격 특성:
-{chr(10).join('- ' + t['traitName'] for t in persona_data['personalityTraits'])}
+# 프롬프트에 넣을 최근 메시지 수와, 앞부분을 잘라내는 단위
+HISTORY_LIMIT = int(os.getenv("MENTOR_HISTORY_LIMIT", "10"))
+HISTORY_STEP = int(os.getenv("MENTOR_HISTORY_STEP", "6"))
 
-영향받은 요소:
-{chr(10).join('- ' + i['influenceName'] for i in persona_data['influences'])}
+def history_window(history: List[dict], total: int) -> List[dict]:
+    """
+    시간순 히스토리에서 프롬프트에 넣을 구간 선택
 
-역사적 맥락:
-{persona_data['historicalContext']['periodBackground']}
+    매번 최근 HISTORY_LIMIT개만 남기면 메시지가 하나 늘 때마다 앞부분이 바뀌어
+    프롬프트 캐시를 쓸 수 없다. 시작 위치를 HISTORY_STEP 단위로만 옮기므로
+    HISTORY_STEP개의 메시지 동안은 같은 앞부분에 새 메시지만 덧붙는다.
 
-주요 사건:
-{chr(10).join('- ' + e['eventDescription'] for e in persona_data['keyEvents'])}
-
-유산:
-영향력: {persona_data['legacy']['impact']}
-현대적 의의: {persona_data['legacy']['modernSignificance']}
-
-당신은 위 정보를 바탕으로 해당 인물의 성격, 사고방식, 말투를 완벽히 재현해야 합니다. 
-대화할 때는 당신의 시대와 맥락에 맞는 적절한 언어를 사용하되, 현대인과 소통이 가능한 수준을 유지하세요.
-당신의 모든 발언과 행동은 위의 역사적 사실과 인물의 성격에 부합해야 합니다."""
-
-    return prompt
+    Args:
+        history (List[dict]): 시간순으로 정렬된 최근 메시지 (최대 HISTORY_LIMIT + HISTORY_STEP - 1개)
+        total (int): 방의 전체 메시지 수 (현재 메시지 제외)
+    """
+    start = max(0, total - HISTORY_LIMIT) // HISTORY_STEP * HISTORY_STEP
+    return history[len(history) - (total - start):] if total > start else []
 
 def format_chat_history(history: List[dict]) -> List[dict]:
     """채팅 히스토리를 OpenAI API 형식으로 변환"""
@@ -266,14 +247,15 @@ def format_chat_history(history: List[dict]) -> List[dict]:
         })
     return formatted_messages
 
-async def get_ai_response(history: List[dict], current_message: str, persona_name: str) -> str:
+async def get_ai_response(
+    history: List[dict], current_message: str, persona_name: str
+) -> str:
     """AI 응답 생성"""
     try:
-        # 페르소나 정보 조회
-        persona_data = await fetch_persona_info(persona_name)
-        
-        # 시스템 프롬프트 생성
-        system_prompt = create_persona_prompt(persona_data)
+        # 페르소나 정보 조회 및 시스템 프롬프트 생성 (TTL 동안은 컴파일된 프롬프트 재사용)
+        # 페르소나는 이름으로 조회하므로 build_persona의 invalidate와 같은 이름 키를 사용
+        persona = await persona_prompts.load(name_key(persona_name), lambda _: fetch_persona_info(persona_name))
+        system_prompt = persona["roleplay_text"]
         
         # 시스템 메시지 구성
         system_message = {
@@ -299,8 +281,9 @@ async def get_ai_response(history: List[dict], current_message: str, persona_nam
         # API 요청 메시지 구성
         messages = [system_message] + chat_history + [current_message]
         
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        response = await chat_completion(
+            route="mentor_reply",
+            degraded=DEGRADED_MESSAGE,
             messages=messages,
             response_format={"type": "text"},
             temperature=1,
@@ -315,6 +298,11 @@ async def get_ai_response(history: List[dict], current_message: str, persona_nam
         raise HTTPException(status_code=500, detail="AI 응답 생성 중 오류가 발생했습니다.")
 
 # API Endpoints
+@app.get("/metrics")
+async def get_metrics():
+    """LLM 호출 지표 (Prometheus 텍스트 형식)"""
+    return PlainTextResponse(render_metrics())
+
 @app.get("/")
 async def read_root():
     return {"status": "running", "message": "Chat API is running"}
@@ -443,20 +431,21 @@ async def create_message(
             
             user_message = cur.fetchone()
             
-            # 대화 히스토리 조회
+            # 대화 히스토리 조회 (방금 저장한 메시지는 마지막에 따로 붙임)
             cur.execute("""
-                SELECT m.content, m.sender_type, m.created_at
+                SELECT m.content, m.sender_type, m.created_at, count(*) OVER () AS total
                 FROM chat_messages m
-                WHERE m.room_id = %s
+                WHERE m.room_id = %s AND m.message_id <> %s
                 ORDER BY m.created_at DESC
-                LIMIT 10
-            """, (room_id,))
+                LIMIT %s
+            """, (room_id, user_message['message_id'], HISTORY_LIMIT + HISTORY_STEP - 1))
             
-            history = cur.fetchall()
+            rows = cur.fetchall()
+            history = history_window(rows[::-1], rows[0]['total'] if rows else 0)
             
             # 페르소나 정보 조회
             cur.execute("""
-                SELECT p.name
+                SELECT p.person_id, p.name
                 FROM chat_room_persons crp
                 JOIN basic_info p ON crp.person_id = p.person_id
                 WHERE crp.room_id = %s
@@ -468,7 +457,10 @@ async def create_message(
                 raise HTTPException(status_code=404, detail="페르소나 정보를 찾을 수 없습니다.")
             
             # AI 응답 생성
-            ai_response = await get_ai_response(history, message.content, person_info['name'])
+            with llm_tags(endpoint="mentor_chat", room=room_id, persona=person_info['name']):
+                ai_response = await get_ai_response(
+                    history, message.content, person_info['name']
+                )
             
             # AI 응답 저장
             cur.execute("""
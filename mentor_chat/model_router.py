@@ -0,0 +1,157 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from llm_metrics import metrics
+
+# 호출 종류(route)별 모델 순서와 지연 목표(SLO, 초) - LLM_ROUTES(json)로 항목 단위로 덮어쓸 수 있음
+# 예) {"debate_turn": {"models": ["gpt-4o-mini", "gpt-4o"], "slo": 5}}
+# small_model을 지정하면 프롬프트가 small_prompt_tokens 이하일 때 그 모델을 먼저 시도 (짧은 초반 토론 턴 등)
+# hedge가 켜진 route는 응답이 p95(관측이 부족하면 hedge_delay)보다 늦으면 같은 요청을 한 번 더 보냄
+ROUTES: Dict[str, Dict[str, Any]] = {
+    "persona_generation": {"models": ["gpt-4o", "gpt-4o-mini"], "slo": 90},
+    "debate_turn": {
+        "models": ["gpt-4o", "gpt-4o-mini"], "slo": 8, "small_model": None, "small_prompt_tokens": 0,
+        "hedge": True, "hedge_delay": 4
+    },
+    "debate_summary": {"models": ["gpt-4o-mini", "gpt-4o"], "slo": 15},
+    # 긴 토론에서 오래된 턴을 접는 누적 요약
+    "debate_context": {"models": ["gpt-4o-mini", "gpt-4o"], "slo": 10},
+    # 토론 전체(모든 턴과 요약)를 구조화 출력 한 번으로 생성하는 single_call 방식
+    "debate_single_call": {"models": ["gpt-4o", "gpt-4o-mini"], "slo": 60},
+    "mentor_reply": {"models": ["gpt-4o", "gpt-4o-mini"], "slo": 10},
+}
+for _route, _override in json.loads(os.getenv("LLM_ROUTES", "{}")).items():
+    ROUTES[_route] = {**ROUTES.get(_route, {}), **_override}
+
+# 이 시간(초)이 지난 관측값은 버림 - 저하된 모델도 이 시간이 지나면 다시 우선 순위로 돌아옴
+LLM_ROUTER_WINDOW = float(os.getenv("LLM_ROUTER_WINDOW", "300"))
+# 관측값이 이보다 적으면 판단하지 않음
+LLM_ROUTER_MIN_SAMPLES = int(os.getenv("LLM_ROUTER_MIN_SAMPLES", "10"))
+# 오류 비율이 이보다 높으면 저하된 것으로 봄
+LLM_ROUTER_ERROR_RATE = float(os.getenv("LLM_ROUTER_ERROR_RATE", "0.2"))
+# 헤징 대기 시간의 하한(초) - 관측 지연이 짧아져도 중복 요청이 과도하게 늘지 않도록
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))
+
+
+def _size_bucket(prompt_tokens: int) -> int:
+    """비슷한 크기의 프롬프트끼리 지연을 비교하기 위한 2의 거듭제곱 구간"""
+    return max(0, math.ceil(math.log2(max(prompt_tokens, 1))))
+
+
+def _p95(values: List[float]) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, math.ceil(len(values) * 0.95) - 1)]
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        routes: Dict[str, Dict[str, Any]] = ROUTES,
+        window: float = LLM_ROUTER_WINDOW,
+        min_samples: int = LLM_ROUTER_MIN_SAMPLES,
+        error_rate: float = LLM_ROUTER_ERROR_RATE
+    ):
+        """
+        호출 종류별로 최근 관측한 지연/오류를 보고 모델을 고르는 라우터
+
+        (route, model)마다 최근 window초 동안의 (시각, 지연, 프롬프트 토큰, 성공 여부)를 보관한다.
+        비슷한 크기의 프롬프트에서 p95 지연이 SLO를 넘거나 오류 비율이 높으면 그 모델을
+        저하(degraded)로 보고 다음 모델을 먼저 시도한다. 상태는 프로세스 단위로 관리한다.
+        """
+        self.routes = routes
+        self.window = window
+        self.min_samples = min_samples
+        self.error_rate = error_rate
+        self._samples: Dict[Tuple[str, str], Deque[Tuple[float, float, int, bool]]] = {}
+        self._lock = threading.Lock()
+
+    def _recent(self, route: str, model: str) -> List[Tuple[float, float, int, bool]]:
+        samples = self._samples.get((route, model))
+        if not samples:
+            return []
+        cutoff = time.time() - self.window
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return list(samples)
+
+    def degraded(self, route: str, model: str, prompt_tokens: int = 0) -> bool:
+        """최근 관측으로 보아 이 모델이 route의 SLO를 지키지 못하는지 여부"""
+        slo = self.routes[route].get("slo")
+        with self._lock:
+            samples = self._recent(route, model)
+        if len(samples) < self.min_samples:
+            return False
+        errors = sum(1 for sample in samples if not sample[3])
+        if errors / len(samples) > self.error_rate:
+            return True
+        if not slo:
+            return False
+        p95 = self._latency_p95(samples, prompt_tokens)
+        return p95 is not None and p95 > slo
+
+    def _latency_p95(self, samples: List[Tuple[float, float, int, bool]], prompt_tokens: int) -> Optional[float]:
+        latencies = [latency for _, latency, _, ok in samples if ok]
+        # 같은 크기 구간의 관측이 충분하면 그것만 사용 (긴 프롬프트의 지연으로 짧은 호출을 판단하지 않도록)
+        bucket = _size_bucket(prompt_tokens)
+        similar = [latency for _, latency, tokens, ok in samples if ok and _size_bucket(tokens) == bucket]
+        if len(similar) >= self.min_samples:
+            latencies = similar
+        return _p95(latencies) if len(latencies) >= self.min_samples else None
+
+    def hedge_delay(self, route: str, model: str, prompt_tokens: int = 0) -> Optional[float]:
+        """헤징 요청을 보낼 때까지 기다릴 시간(초) - route에 hedge가 꺼져 있으면 None"""
+        config = self.routes[route]
+        if not config.get("hedge"):
+            return None
+        with self._lock:
+            samples = self._recent(route, model)
+        p95 = self._latency_p95(samples, prompt_tokens)
+        return max(LLM_HEDGE_MIN_DELAY, p95 if p95 is not None else config.get("hedge_delay", config.get("slo", 10)))
+
+    def choose(self, route: str, prompt_tokens: int = 0) -> List[str]:
+        """
+        시도할 모델 순서 - 정상 모델을 설정 순서대로 먼저, 저하된 모델은 뒤에
+
+        Args:
+            route (str): ROUTES의 호출 종류
+            prompt_tokens (int): 예상 프롬프트 토큰 수
+        """
+        config = self.routes[route]
+        models = list(config["models"])
+        small_model = config.get("small_model")
+        if small_model and prompt_tokens <= config.get("small_prompt_tokens", 0):
+            models = [small_model] + [model for model in models if model != small_model]
+
+        healthy = [model for model in models if not self.degraded(route, model, prompt_tokens)]
+        ordered = healthy + [model for model in models if model not in healthy]
+        metrics.inc("llm_route_decisions_total", route=route, model=ordered[0], primary=str(ordered[0] == models[0]).lower())
+        return ordered
+
+    def observe(self, route: str, model: str, latency: float, prompt_tokens: int, ok: bool):
+        with self._lock:
+            self._samples.setdefault((route, model), deque(maxlen=1000)).append((time.time(), latency, prompt_tokens, ok))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """route/model별 최근 관측 수, 오류 비율, p95 지연, 저하 여부"""
+        result: Dict[str, Dict[str, Any]] = {}
+        for route, config in self.routes.items():
+            for model in config["models"]:
+                with self._lock:
+                    samples = self._recent(route, model)
+                latencies = [latency for _, latency, _, ok in samples if ok]
+                result.setdefault(route, {})[model] = {
+                    "samples": len(samples),
+                    "error_rate": sum(1 for sample in samples if not sample[3]) / len(samples) if samples else 0.0,
+                    "p95": _p95(latencies) if latencies else None,
+                    "degraded": self.degraded(route, model),
+                }
+        return result
+
+
+# 프로세스 전체에서 공유
+router = ModelRouter()
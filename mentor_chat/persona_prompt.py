@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# 이 시간(초) 동안은 페르소나 API를 다시 조회하지 않고 컴파일된 프롬프트를 사용
+PERSONA_PROMPT_TTL = int(os.getenv("PERSONA_PROMPT_TTL", "300"))
+PERSONA_PROMPT_MAX_ENTRIES = int(os.getenv("PERSONA_PROMPT_MAX_ENTRIES", "1000"))
+# 프롬프트 문구를 바꾸면 올려서 이전에 컴파일된 프롬프트를 쓰지 않도록 함
+PROMPT_TEMPLATE_VERSION = "1"
+
+
+def _pick(data: Dict, *keys: str, default: Any = "") -> Any:
+    for key in keys:
+        if data.get(key) is not None:
+            return data[key]
+    return default
+
+
+def _names(items: Optional[List], *keys: str) -> List[str]:
+    """["a", ...] 또는 [{"roleName": "a"}, ...] 형태의 목록을 문자열 목록으로 변환"""
+    names = []
+    for item in items or []:
+        if isinstance(item, dict):
+            item = _pick(item, *keys, default=None) or next(iter(item.values()), "")
+        names.append(str(item))
+    return names
+
+
+def normalize_persona(data: Dict) -> Dict:
+    """
+    페르소나 데이터를 프롬프트용 평면 구조로 정규화
+
+    persons API 응답(camelCase)과 DialogueSystem이 쓰는 중첩 구조(basic_info, professional, ...)를
+    모두 받아 같은 결과를 만들므로, 어디서 불러온 데이터든 같은 프롬프트가 나온다.
+    """
+    if "basic_info" in data:
+        basic = data.get("basic_info", {})
+        professional = data.get("professional", {})
+        personal = data.get("personal", {})
+        legacy = data.get("legacy", {})
+        historical = data.get("historical_context", {})
+        occupation = professional.get("primary_occupation", "")
+    else:
+        basic = data
+        professional = {
+            "other_roles": data.get("otherRoles"),
+            "major_achievements": data.get("achievements"),
+        }
+        personal = {
+            **(data.get("personalInfo") or {}),
+            "personality_traits": data.get("personalityTraits"),
+            "influences": data.get("influences"),
+        }
+        legacy = data.get("legacy") or {}
+        historical = {**(data.get("historicalContext") or {}), "key_events": data.get("keyEvents")}
+        occupation = ", ".join(_names(data.get("professionalInfo"), "primaryOccupation"))
+
+    return {
+        "id": str(_pick(basic, "id", "person_id", default="")),
+        "name": _pick(basic, "name"),
+        "birth_death": _pick(basic, "birth_death", "birthDeath"),
+        "era": _pick(basic, "era"),
+        "nationality": _pick(basic, "nationality"),
+        "primary_occupation": occupation,
+        "other_roles": _names(professional.get("other_roles"), "roleName", "role_name"),
+        "major_achievements": _names(professional.get("major_achievements"), "achievementName", "achievement_name"),
+        "education": _pick(personal, "education"),
+        "background": _pick(personal, "background"),
+        "personality_traits": _names(personal.get("personality_traits"), "traitName", "trait_name"),
+        "influences": _names(personal.get("influences"), "influenceName", "influence_name"),
+        "period_background": _pick(historical, "period_background", "periodBackground"),
+        "key_events": _names(historical.get("key_events"), "eventDescription", "event_description"),
+        "impact": _pick(legacy, "impact"),
+        "modern_significance": _pick(legacy, "modern_significance", "modernSignificance"),
+    }
+
+
+def profile_version(profile: Dict) -> str:
+    """정규화된 프로필 내용과 템플릿 버전의 해시 - 페르소나 행이 바뀌면 값이 바뀜"""
+    encoded = json.dumps({"profile": profile, "template": PROMPT_TEMPLATE_VERSION}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:16]
+
+
+def source_version(data: Dict) -> Optional[str]:
+    """페르소나 행의 수정 시각(updated_at)과 템플릿 버전 - 있으면 정규화/해시 없이 캐시 항목을 찾는 데 사용"""
+    basic = data.get("basic_info", data)
+    updated_at = _pick(basic, "updated_at", "updatedAt", default=None)
+    return None if updated_at is None else f"{updated_at}:{PROMPT_TEMPLATE_VERSION}"
+
+
+def _bullets(items: List[str]) -> str:
+    return "\n".join(f"  - {item}" for item in items)
+
+
+def render_profile(profile: Dict) -> str:
+    """페르소나 상세 프로필 (토론/멘토 채팅 공통)"""
+    return f"""=== 페르소나 상세 프로필 ===
+
+1. 인물 정보
+- 이름: {profile['name']}
+- 생애: {profile['birth_death']}
+- 시대: {profile['era']}
+- 국적: {profile['nationality']}
+
+2. 직업과 업적
+- 주요 직책: {profile['primary_occupation']}
+- 관련 역할: {', '.join(profile['other_roles'])}
+- 주요 업적:
+{_bullets(profile['major_achievements'])}
+
+3. 개인 배경과 성향
+- 교육 배경: {profile['education']}
+- 개인 이력: {profile['background']}
+- 성격 특성:
+{_bullets(profile['personality_traits'])}
+- 영향 받은 요소:
+{_bullets(profile['influences'])}
+
+4. 역사적 맥락
+- 시대적 배경: {profile['period_background']}
+- 주요 사건:
+{_bullets(profile['key_events'])}
+
+5. 역사적 의의
+- 역사적 영향: {profile['impact']}
+- 현대적 의미: {profile['modern_significance']}"""
+
+
+def render_roleplay_prompt(profile: Dict, profile_text: str) -> str:
+    """멘토 채팅의 시스템 프롬프트 - 한 인물을 직접 연기"""
+    return f"""당신은 {profile['name']}입니다.
+
+{profile_text}
+
+당신은 위 정보를 바탕으로 해당 인물의 성격, 사고방식, 말투를 완벽히 재현해야 합니다.
+대화할 때는 당신의 시대와 맥락에 맞는 적절한 언어를 사용하되, 현대인과 소통이 가능한 수준을 유지하세요.
+당신의 모든 발언과 행동은 위의 역사적 사실과 인물의 성격에 부합해야 합니다."""
+
+
+def name_key(name: str) -> str:
+    """이름으로 불러오는 페르소나의 캐시 키 (공백/대소문자 차이로 항목이 갈리지 않도록 정규화)"""
+    return "name:" + " ".join(str(name).split()).casefold()
+
+
+class PersonaPromptCache:
+    def __init__(self, ttl: int = PERSONA_PROMPT_TTL, max_entries: int = PERSONA_PROMPT_MAX_ENTRIES):
+        """
+        person_id별로 컴파일된 페르소나 프롬프트를 보관하는 캐시
+
+        항목은 (person_id, 프로필 버전)으로 구분한다. 같은 내용이면 이전에 만든 문자열을
+        그대로 돌려주므로 프롬프트 앞부분이 호출마다 바이트 단위로 같게 유지되고,
+        페르소나 행이 바뀌어 버전이 달라지면 그때만 다시 렌더링한다.
+        load()가 돌려준 데이터 객체나 updated_at이 같은 데이터는 정규화와 해시 계산 없이 찾는다.
+        다른 서비스에서 수정된 페르소나는 TTL이 지나 다시 불러올 때 반영된다.
+
+        Args:
+            ttl (int): load()가 페르소나 데이터를 다시 조회하지 않고 재사용할 시간(초)
+            max_entries (int): 보관할 최대 페르소나 수 (초과 시 LRU 순으로 제거)
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compile(self, data: Dict, person_id: Optional[str] = None) -> Dict:
+        """
+        페르소나 데이터로 프롬프트를 만들거나, 같은 버전이 캐시에 있으면 그대로 반환
+
+        Returns:
+            Dict: person_id, version, data, profile, profile_text, roleplay_text, loaded_at
+        """
+        basic = data.get("basic_info", data)
+        key = str(person_id or _pick(basic, "id", "person_id", default="") or _pick(basic, "name"))
+        source = source_version(data)
+        now = time.time()
+
+        # 같은 데이터 객체(load() 결과를 턴마다 다시 넘기는 경우)나 같은 updated_at이면 바로 반환
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry["data"] is data or (source is not None and entry["source_version"] == source)):
+                return self._hit(key, entry, data, now)
+
+        profile = normalize_persona(data)
+        version = profile_version(profile)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["version"] == version:
+                entry["source_version"] = source
+                return self._hit(key, entry, data, now)
+            self.misses += 1
+
+        profile_text = render_profile(profile)
+        entry = {
+            "person_id": key,
+            "version": version,
+            "source_version": source,
+            "data": data,
+            "profile": profile,
+            "profile_text": profile_text,
+            "roleplay_text": render_roleplay_prompt(profile, profile_text),
+            "loaded_at": now,
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _hit(self, key: str, entry: Dict, data: Dict, now: float) -> Dict:
+        """캐시 적중 처리 (self._lock 안에서 호출)"""
+        self.hits += 1
+        entry["data"] = data
+        entry["loaded_at"] = now
+        self._entries.move_to_end(key)
+        return entry
+
+    async def load(self, person_id: Any, loader: Callable[[Any], Awaitable[Dict]]) -> Dict:
+        """
+        TTL 이내에 불러온 항목이 있으면 조회 없이 반환하고, 아니면 loader(person_id)로 다시 불러와 컴파일
+        """
+        with self._lock:
+            entry = self._entries.get(str(person_id))
+            if entry is not None and time.time() - entry["loaded_at"] < self.ttl:
+                self.hits += 1
+                return entry
+        return self.compile(await loader(person_id), person_id=str(person_id))
+
+    def invalidate(self, person_id: Any):
+        """같은 프로세스에서 페르소나를 다시 생성/수정했을 때 호출 - 다음 조회에서 다시 불러옴"""
+        with self._lock:
+            self._entries.pop(str(person_id), None)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries)
+        }
+
+
+# 프로세스 전체에서 공유
+persona_prompts = PersonaPromptCache()
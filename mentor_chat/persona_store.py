@@ -0,0 +1,104 @@
+import uuid
+from typing import Dict, Optional
+
+# 위키 데이터/프롬프트 해시 -> 생성된 person_id 매핑
+PERSONA_KEYS_DDL = """
+    CREATE TABLE IF NOT EXISTS persona_generation_keys (
+        dedupe_key TEXT PRIMARY KEY,
+        person_id UUID NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+# persona 한 명을 한 번의 왕복으로 저장하는 data-modifying CTE
+# 자식 테이블은 basic_info의 RETURNING 결과를 참조하므로 외래 키 순서가 보장되고,
+# 목록 항목은 배열 파라미터를 unnest 하여 여러 행으로 한 번에 넣는다.
+INSERT_PERSONA_SQL = """
+    WITH basic AS (
+        INSERT INTO basic_info (person_id, name, birth_death, era, nationality, gender, image_url)
+        VALUES (%(person_id)s, %(name)s, %(birth_death)s, %(era)s, %(nationality)s, %(gender)s, %(image_url)s)
+        RETURNING person_id
+    ), professional AS (
+        INSERT INTO professional_info (person_id, primary_occupation)
+        SELECT person_id, %(primary_occupation)s FROM basic
+    ), roles AS (
+        INSERT INTO other_roles (person_id, role_name)
+        SELECT person_id, unnest(%(other_roles)s::text[]) FROM basic
+    ), achievements AS (
+        INSERT INTO major_achievements (person_id, achievement_name)
+        SELECT person_id, unnest(%(major_achievements)s::text[]) FROM basic
+    ), personal AS (
+        INSERT INTO personal_info (person_id, education, background)
+        SELECT person_id, %(education)s, %(background)s FROM basic
+    ), traits AS (
+        INSERT INTO personality_traits (person_id, trait_name)
+        SELECT person_id, unnest(%(personality_traits)s::text[]) FROM basic
+    ), influences AS (
+        INSERT INTO influences (person_id, influence_name)
+        SELECT person_id, unnest(%(influences)s::text[]) FROM basic
+    ), legacy AS (
+        INSERT INTO legacy (person_id, impact, modern_significance)
+        SELECT person_id, %(impact)s, %(modern_significance)s FROM basic
+    ), historical AS (
+        INSERT INTO historical_context (person_id, period_background)
+        SELECT person_id, %(period_background)s FROM basic
+    ), events AS (
+        INSERT INTO key_events (person_id, event_description)
+        SELECT person_id, unnest(%(key_events)s::text[]) FROM basic
+    ), generation_key AS (
+        INSERT INTO persona_generation_keys (dedupe_key, person_id)
+        SELECT %(dedupe_key)s, person_id FROM basic WHERE %(dedupe_key)s IS NOT NULL
+        ON CONFLICT (dedupe_key) DO UPDATE
+        SET person_id = EXCLUDED.person_id, created_at = now()
+    )
+    SELECT person_id FROM basic
+"""
+
+
+def persona_params(person_id: str, persona_data: Dict, wiki_data: Dict, dedupe_key: Optional[str] = None) -> Dict:
+    """INSERT_PERSONA_SQL에 바인딩할 파라미터 구성"""
+    return {
+        "person_id": person_id,
+        "dedupe_key": dedupe_key,
+        "name": persona_data["basic_info"]["name"],
+        "birth_death": persona_data["basic_info"]["birth_death"],
+        "era": persona_data["basic_info"]["era"],
+        "nationality": persona_data["basic_info"]["nationality"],
+        "gender": persona_data["basic_info"]["gender"],
+        "image_url": wiki_data.get("basic_info", {}).get("image_url"),
+        "primary_occupation": persona_data["professional"]["primary_occupation"],
+        "other_roles": list(persona_data["professional"]["other_roles"]),
+        "major_achievements": list(persona_data["professional"]["major_achievements"]),
+        "education": persona_data["personal"]["education"],
+        "background": persona_data["personal"]["background"],
+        "personality_traits": list(persona_data["personal"]["personality_traits"]),
+        "influences": list(persona_data["personal"]["influences"]),
+        "impact": persona_data["legacy"]["impact"],
+        "modern_significance": persona_data["legacy"]["modern_significance"],
+        "period_background": persona_data["historical_context"]["period_background"],
+        "key_events": list(persona_data["historical_context"]["key_events"]),
+    }
+
+
+def insert_persona(cur, persona_data: Dict, wiki_data: Dict, dedupe_key: Optional[str] = None) -> str:
+    """
+    persona 데이터를 모든 테이블에 한 문장으로 저장하고 person_id 반환
+
+    dedupe_key가 주어지면 같은 키로 이전에 저장된 매핑을 새 person_id로 바꾼다.
+    트랜잭션 커밋/롤백은 호출하는 쪽에서 처리한다.
+    """
+    person_id = str(uuid.uuid4())
+    cur.execute(INSERT_PERSONA_SQL, persona_params(person_id, persona_data, wiki_data, dedupe_key))
+    return person_id
+
+
+def find_persona_by_key(cur, dedupe_key: str) -> Optional[str]:
+    """같은 키로 생성되어 아직 남아 있는 persona의 person_id 조회"""
+    cur.execute("""
+        SELECT k.person_id
+        FROM persona_generation_keys k
+        JOIN basic_info b ON b.person_id = k.person_id
+        WHERE k.dedupe_key = %s
+    """, (dedupe_key,))
+    row = cur.fetchone()
+    return str(row[0]) if row else None
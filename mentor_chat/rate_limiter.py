@@ -0,0 +1,156 @@
+import asyncio
+import contextlib
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# 모든 서비스/워커가 같은 한도를 나눠 쓰도록 기본값은 호스트 공용 임시 디렉터리
+LLM_RATE_LIMIT_PATH = os.getenv(
+    "LLM_RATE_LIMIT_PATH", os.path.join(tempfile.gettempdir(), "llm_rate_limit.sqlite3")
+)
+# 모델별 분당 요청 수 / 분당 토큰 수 (LLM_RATE_LIMITS로 모델마다 덮어쓸 수 있음)
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "500"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "30000"))
+# 예) {"gpt-4o": {"rpm": 5000, "tpm": 800000}}
+LLM_RATE_LIMITS: Dict[str, Dict[str, int]] = json.loads(os.getenv("LLM_RATE_LIMITS", "{}"))
+
+
+def estimate_tokens(text: str) -> int:
+    """ASCII 4자당 1토큰, 그 외 문자(한글 등) 1자당 0.7토큰으로 근사"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) * 0.7)
+
+
+def estimate_request_tokens(messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> int:
+    """
+    요청이 소비할 토큰 수 추정 (프롬프트 + 최대 생성 토큰)
+
+    OpenAI도 TPM 한도를 max_tokens를 포함해 계산하므로 같은 방식으로 미리 차감하고,
+    응답의 usage로 실제 사용량을 알게 되면 RateLimiter.settle로 차이를 돌려준다.
+    """
+    prompt = 0
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        # 메시지마다 역할/구분자 토큰이 몇 개 붙음
+        prompt += estimate_tokens(content) + 4
+    return prompt + (max_tokens or 0)
+
+
+class RateLimiter:
+    def __init__(self, path: str = LLM_RATE_LIMIT_PATH):
+        """
+        SQLite에 상태를 두는 모델별 토큰 버킷 (요청 수 / 토큰 수)
+
+        같은 파일을 쓰는 모든 프로세스(uvicorn 워커, 다른 서비스)가 한도를 나눠 쓴다.
+        버킷은 분당 한도만큼 채워져 있다가 초당 한도/60씩 다시 차고,
+        429를 받으면 block으로 모든 프로세스가 retry-after 동안 새 요청을 멈춘다.
+        """
+        self.path = path
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                level REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                blocked_until REAL NOT NULL DEFAULT 0
+            )
+        """)
+        return conn
+
+    @staticmethod
+    def limits(model: str) -> Tuple[int, int]:
+        override = LLM_RATE_LIMITS.get(model, {})
+        return override.get("rpm", LLM_RPM_LIMIT), override.get("tpm", LLM_TPM_LIMIT)
+
+    def _refill(self, conn: sqlite3.Connection, name: str, capacity: float, now: float) -> Tuple[float, float]:
+        """버킷을 현재 시각까지 채운 뒤 (잔량, 차단 해제 시각) 반환"""
+        row = conn.execute("SELECT level, updated_at, blocked_until FROM buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            conn.execute("INSERT INTO buckets (name, level, updated_at) VALUES (?, ?, ?)", (name, capacity, now))
+            return capacity, 0.0
+        level, updated_at, blocked_until = row
+        return min(capacity, level + (now - updated_at) * capacity / 60), blocked_until
+
+    def _try_acquire(self, model: str, tokens: int) -> float:
+        """한도가 남아 있으면 차감하고 0, 아니면 기다려야 할 시간(초) 반환"""
+        rpm, tpm = self.limits(model)
+        # 한 요청이 분당 한도보다 크면 버킷이 가득 찼을 때 통과시킴
+        tokens = min(tokens, tpm)
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                requests_left, blocked_until = self._refill(conn, f"{model}:requests", rpm, now)
+                tokens_left, _ = self._refill(conn, f"{model}:tokens", tpm, now)
+
+                wait = max(
+                    blocked_until - now,
+                    (1 - requests_left) * 60 / rpm,
+                    (tokens - tokens_left) * 60 / tpm,
+                )
+                if wait <= 0:
+                    requests_left -= 1
+                    tokens_left -= tokens
+                for name, level in ((f"{model}:requests", requests_left), (f"{model}:tokens", tokens_left)):
+                    conn.execute("UPDATE buckets SET level = ?, updated_at = ? WHERE name = ?", (level, now, name))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return max(wait, 0.0)
+
+    async def acquire(self, model: str, tokens: int):
+        """요청 1개와 tokens 토큰을 쓸 수 있을 때까지 대기"""
+        while True:
+            wait = await asyncio.to_thread(self._try_acquire, model, tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(min(wait, 5.0))
+
+    def _adjust(self, model: str, delta: int):
+        _, tpm = self.limits(model)
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE buckets SET level = MIN(?, level + ?) WHERE name = ?",
+                (tpm, delta, f"{model}:tokens")
+            )
+
+    async def settle(self, model: str, reserved: int, used: int):
+        """미리 차감한 토큰과 실제 사용량의 차이를 돌려주거나 추가로 차감"""
+        if reserved != used:
+            await asyncio.to_thread(self._adjust, model, reserved - used)
+
+    def _block(self, model: str, seconds: float):
+        until = time.time() + seconds
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE buckets SET blocked_until = MAX(blocked_until, ?) WHERE name = ?",
+                (until, f"{model}:requests")
+            )
+
+    async def block(self, model: str, seconds: float):
+        """429 응답의 retry-after 동안 모든 프로세스에서 해당 모델 요청을 멈춤"""
+        await asyncio.to_thread(self._block, model, seconds)
+
+
+def retry_after_seconds(headers: Any) -> Optional[float]:
+    """응답 헤더의 retry-after-ms / retry-after 값(초). 없거나 해석할 수 없으면 None"""
+    if headers is None:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
@@ -1,17 +1,55 @@
-import requests
-from typing import Dict, Optional
+import asyncio
+import httpx
+from typing import Dict, Optional, Tuple
 from datetime import datetime
+from wiki_cache import WikiCache
+from wiki_dump import WikiDumpIndex
 
 class WikipediaPersonSearch:
-    def __init__(self, language: str = 'ko'):
+    def __init__(
+        self,
+        language: str = 'ko',
+        timeout: float = 10.0,
+        cache: Optional[WikiCache] = None,
+        dump: Optional[WikiDumpIndex] = None
+    ):
         """
         위키피디아 API를 사용하여 인물을 검색하는 클래스
         
         Args:
             language (str): 위키피디아 언어 설정 (기본값: 'ko' - 한국어)
+            timeout (float): 요청당 타임아웃(초)
+            cache (WikiCache): 페이지 결과를 저장할 디스크 캐시 (없으면 매번 요청)
+            dump (WikiDumpIndex): 설정하면 네트워크 대신 오프라인 덤프 색인에서 조회
         """
+        self.language = language
         self.base_url = f"https://{language}.wikipedia.org/w/api.php"
-        self.session = requests.Session()
+        self.timeout = timeout
+        self.cache = cache
+        self.dump = dump
+        self.client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """keep-alive 연결을 재사용하도록 AsyncClient를 지연 생성"""
+        if self.client is None or self.client.is_closed:
+            self.client = httpx.AsyncClient(timeout=self.timeout)
+        return self.client
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def _get(self, params: Dict) -> Dict:
+        response = await self._get_client().get(self.base_url, params=params)
+        response.raise_for_status()
+        return response.json()
     
     def extract_birth_death(self, content: str) -> str:
         """
@@ -37,10 +75,31 @@ class WikipediaPersonSearch:
                     return keyword
         return "정보 없음"
 
-    def search_person(self, name: str, summary_only: bool = False) -> Optional[Dict]:
+    def _sections_params(self, **target) -> Dict:
+        return {
+            "action": "parse",
+            "format": "json",
+            "prop": "sections",
+            "redirects": 1,
+            **target
+        }
+
+    async def _fetch_sections(self, params: Dict) -> Dict:
+        """섹션 정보 요청 - 실패해도 본문 결과는 반환할 수 있도록 예외를 삼킴"""
+        try:
+            return await self._get(params)
+        except (httpx.HTTPError, ValueError):
+            return {}
+
+    async def search_person(self, name: str, summary_only: bool = False) -> Optional[Dict]:
         """
         이름으로 인물을 검색하고 관련 정보를 반환
         
+        캐시가 설정되어 있으면 TTL 이내의 결과는 네트워크 요청 없이 반환하고,
+        TTL이 지난 결과는 lastrevid만 확인하여 리비전이 같으면 그대로 재사용한다.
+        확인이나 재조회 요청이 실패하면(네트워크 오류, 5xx 등) TTL이 지난 결과를 그대로 반환한다.
+        덤프 색인이 설정되어 있으면 네트워크 없이 로컬 색인에서만 조회한다.
+        
         Args:
             name (str): 검색할 인물 이름
             summary_only (bool): True면 요약만, False면 전체 내용 반환
@@ -49,56 +108,111 @@ class WikipediaPersonSearch:
             Dict: 검색된 인물 정보를 담은 딕셔너리
             None: 검색 결과가 없는 경우
         """
-        # 1. 검색어와 가장 일치하는 페이지 찾기
-        search_params = {
+        if self.dump is not None:
+            page_data = self.dump.get(name, summary_only)
+            if page_data is None:
+                return None
+            return self.build_result(page_data, page_data["sections"])
+
+        if self.cache is None:
+            result, _ = await self._fetch_person(name, summary_only)
+            return result
+
+        cached = self.cache.lookup(self.language, name, summary_only)
+        if cached and cached["fresh"]:
+            return cached["payload"]
+
+        if cached:
+            try:
+                revision = await self._fetch_revision(name)
+            except (httpx.HTTPError, ValueError) as e:
+                return self._serve_stale(name, cached, e)
+            if revision == (cached["page_id"], cached["lastrevid"]):
+                self.cache.revalidate(self.language, cached["page_id"], summary_only)
+                return cached["payload"]
+            self.cache.record_miss()
+
+        try:
+            result, page_data = await self._fetch_person(name, summary_only)
+        except (httpx.HTTPError, ValueError) as e:
+            if cached:
+                return self._serve_stale(name, cached, e)
+            raise
+        if result is not None:
+            self.cache.put(
+                self.language, name, summary_only,
+                page_data["pageid"], page_data.get("lastrevid", 0), result
+            )
+        return result
+
+    def _serve_stale(self, name: str, cached: Dict, error: Exception) -> Dict:
+        print(f"위키피디아 요청 실패로 캐시된 결과 사용: {name} {error!r}")
+        self.cache.serve_stale()
+        return cached["payload"]
+
+    async def _fetch_revision(self, name: str) -> Optional[Tuple[int, int]]:
+        """검색 결과 페이지의 (page id, lastrevid)만 가볍게 조회"""
+        data = await self._get({
             "action": "query",
             "format": "json",
-            "list": "search",
-            "srsearch": name,
-            "srprop": "snippet",
-            "srlimit": 1
-        }
-        
-        search_response = self.session.get(url=self.base_url, params=search_params)
-        search_data = search_response.json()
-        
-        if not search_data["query"]["search"]:
+            "generator": "search",
+            "gsrsearch": name,
+            "gsrlimit": 1,
+            "prop": "info"
+        })
+        pages = data.get("query", {}).get("pages", {})
+        if not pages:
             return None
-            
-        page_id = search_data["query"]["search"][0]["pageid"]
+        page = next(iter(pages.values()))
+        return page["pageid"], page.get("lastrevid", 0)
+
+    async def _fetch_person(self, name: str, summary_only: bool) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """
+        위키피디아 API에서 인물 정보를 가져와 (결과, 원본 페이지 데이터) 반환
         
-        # 2. 페이지 상세 정보 가져오기
-        detail_params = {
+        검색과 상세 조회는 generator=search 로 한 번의 요청에 합치고,
+        섹션 정보(action=parse)는 검색어를 제목으로 가정해 동시에 요청한다.
+        추측한 페이지가 검색 결과와 다를 때만 섹션을 한 번 더 요청한다.
+        """
+        # 1. 검색 + 페이지 상세 정보를 한 번에 가져오기
+        query_params = {
             "action": "query",
             "format": "json",
-            "prop": "extracts|pageimages|info|categories|sections|langlinks",
-            "exintro": summary_only,
-            "explaintext": True,
+            "generator": "search",
+            "gsrsearch": name,
+            "gsrlimit": 1,
+            "prop": "extracts|pageimages|info|categories|langlinks",
+            "explaintext": 1,
             "inprop": "url|displaytitle",
             "piprop": "original",
-            "pageids": page_id,
             "cllimit": "max",
             "llprop": "url|langname",
             "lllimit": "max"
         }
-        
-        detail_response = self.session.get(url=self.base_url, params=detail_params)
-        detail_data = detail_response.json()
-        
-        page_data = detail_data["query"]["pages"][str(page_id)]
-        
-        # 3. 섹션 정보 가져오기
-        sections_params = {
-            "action": "parse",
-            "format": "json",
-            "pageid": page_id,
-            "prop": "sections"
-        }
-        
-        sections_response = self.session.get(url=self.base_url, params=sections_params)
-        sections_data = sections_response.json()
-        
-        # 4. 결과 데이터 구성
+        if summary_only:
+            query_params["exintro"] = 1
+
+        # 2. 섹션 정보는 검색어를 제목으로 하여 동시에 요청
+        query_data, sections_data = await asyncio.gather(
+            self._get(query_params),
+            self._fetch_sections(self._sections_params(page=name))
+        )
+
+        pages = query_data.get("query", {}).get("pages", {})
+        if not pages:
+            return None, None
+
+        page_data = next(iter(pages.values()))
+        page_id = page_data["pageid"]
+
+        # 3. 추측한 페이지가 검색 결과와 다르면 page id로 섹션 재요청
+        if sections_data.get("parse", {}).get("pageid") != page_id:
+            sections_data = await self._fetch_sections(self._sections_params(pageid=page_id))
+
+        return self.build_result(page_data, sections_data.get("parse", {}).get("sections", [])), page_data
+
+    def build_result(self, page_data: Dict, sections: list) -> Dict:
+        """API 응답의 페이지 데이터와 섹션 목록으로 결과 딕셔너리 구성"""
         content = page_data.get("extract", "")
         categories = [cat["title"].replace("Category:", "") for cat in page_data.get("categories", [])]
         
@@ -118,7 +232,7 @@ class WikipediaPersonSearch:
                     "level": section["level"],
                     "index": section["index"]
                 }
-                for section in sections_data.get("parse", {}).get("sections", [])
+                for section in sections
             ],
             "other_languages": [
                 {
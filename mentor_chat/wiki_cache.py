@@ -0,0 +1,173 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+DEFAULT_CACHE_PATH = os.getenv(
+    "WIKI_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "wiki_cache.sqlite3")
+)
+DEFAULT_TTL = int(os.getenv("WIKI_CACHE_TTL", str(7 * 24 * 60 * 60)))
+DEFAULT_MAX_ENTRIES = int(os.getenv("WIKI_CACHE_MAX_ENTRIES", "5000"))
+
+
+class WikiCache:
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        ttl: int = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        """
+        위키피디아 페이지 결과를 디스크(SQLite)에 저장하는 캐시
+
+        페이지는 (언어, page id, 요약 여부)로 저장하고 lastrevid를 함께 기록한다.
+        검색어 -> page id 매핑은 TTL 동안 그대로 사용하고, TTL이 지나면
+        lastrevid를 비교해 리비전이 바뀐 경우에만 다시 가져온다.
+
+        Args:
+            path (str): SQLite 파일 경로
+            ttl (int): 네트워크 확인 없이 캐시를 사용할 시간(초)
+            max_entries (int): 보관할 최대 페이지 수 (초과 시 LRU 순으로 제거)
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.stale_served = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                language TEXT NOT NULL,
+                page_id INTEGER NOT NULL,
+                summary_only INTEGER NOT NULL,
+                lastrevid INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (language, page_id, summary_only)
+            );
+            CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at);
+            CREATE TABLE IF NOT EXISTS lookups (
+                language TEXT NOT NULL,
+                query TEXT NOT NULL,
+                page_id INTEGER NOT NULL,
+                PRIMARY KEY (language, query)
+            );
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def normalize(name: str) -> str:
+        return " ".join(name.split()).casefold()
+
+    def lookup(self, language: str, name: str, summary_only: bool) -> Optional[Dict]:
+        """
+        검색어로 캐시된 페이지 조회
+
+        Returns:
+            Dict: page_id, lastrevid, payload, fresh(TTL 이내 여부)
+            None: 캐시에 없는 경우
+        """
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT p.page_id, p.lastrevid, p.payload, p.fetched_at
+                FROM lookups l
+                JOIN pages p ON p.language = l.language AND p.page_id = l.page_id
+                WHERE l.language = ? AND l.query = ? AND p.summary_only = ?
+            """, (language, self.normalize(name), int(summary_only))).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        page_id, lastrevid, payload, fetched_at = row
+        fresh = time.time() - fetched_at < self.ttl
+        if fresh:
+            self.hits += 1
+            self._touch(language, page_id, summary_only, refresh=False)
+        return {
+            "page_id": page_id,
+            "lastrevid": lastrevid,
+            "payload": json.loads(payload),
+            "fresh": fresh
+        }
+
+    def record_miss(self):
+        """TTL이 지난 항목의 리비전이 바뀌어 다시 가져와야 하는 경우"""
+        self.misses += 1
+
+    def serve_stale(self):
+        """TTL이 지난 항목을 위키피디아 요청 실패로 확인하지 못하고 그대로 반환하는 경우"""
+        self.stale_served += 1
+
+    def revalidate(self, language: str, page_id: int, summary_only: bool):
+        """리비전이 그대로인 것이 확인된 항목의 TTL 갱신"""
+        self.revalidations += 1
+        self.hits += 1
+        self._touch(language, page_id, summary_only, refresh=True)
+
+    def _touch(self, language: str, page_id: int, summary_only: bool, refresh: bool):
+        now = time.time()
+        with self._lock:
+            if refresh:
+                self._conn.execute("""
+                    UPDATE pages SET accessed_at = ?, fetched_at = ?
+                    WHERE language = ? AND page_id = ? AND summary_only = ?
+                """, (now, now, language, page_id, int(summary_only)))
+            else:
+                self._conn.execute("""
+                    UPDATE pages SET accessed_at = ?
+                    WHERE language = ? AND page_id = ? AND summary_only = ?
+                """, (now, language, page_id, int(summary_only)))
+            self._conn.commit()
+
+    def put(self, language: str, name: str, summary_only: bool, page_id: int, lastrevid: int, payload: Dict):
+        """페이지 결과 저장 후 최대 크기를 넘으면 오래 사용되지 않은 항목부터 제거"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO pages
+                    (language, page_id, summary_only, lastrevid, payload, fetched_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (language, page_id, int(summary_only), lastrevid,
+                  json.dumps(payload, ensure_ascii=False), now, now))
+            self._conn.execute("""
+                INSERT OR REPLACE INTO lookups (language, query, page_id)
+                VALUES (?, ?, ?)
+            """, (language, self.normalize(name), page_id))
+            self._conn.execute("""
+                DELETE FROM pages WHERE rowid IN (
+                    SELECT rowid FROM pages ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._conn.execute("""
+                DELETE FROM lookups WHERE NOT EXISTS (
+                    SELECT 1 FROM pages p
+                    WHERE p.language = lookups.language AND p.page_id = lookups.page_id
+                )
+            """)
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "stale_served": self.stale_served,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,345 @@
+import argparse
+import bz2
+import gzip
+import json
+import mmap
+import os
+import re
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+DATA_FILE = "pages.dat"
+INDEX_FILE = "titles.idx"
+META_FILE = "meta.json"
+
+HEADING_RE = re.compile(r"^(={2,6})\s*(.+?)\s*\1\s*$", re.MULTILINE)
+LANGLINK_RE = re.compile(r"\[\[([a-z]{2,3}(?:-[a-z]+)?):([^\]|]+)\]\]")
+
+
+def normalize_title(title: str) -> str:
+    """색인 키로 사용할 제목 정규화 (공백/밑줄 통일, 대소문자 무시)"""
+    return " ".join(title.replace("_", " ").split()).casefold()
+
+
+def _open_source(path: str):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def _strip_nested(text: str, pattern: re.Pattern) -> str:
+    previous = None
+    while previous != text:
+        previous = text
+        text = pattern.sub("", text)
+    return text
+
+
+class WikitextCleaner:
+    def __init__(self, category_names: List[str], file_names: List[str]):
+        """
+        덤프의 위키텍스트를 API의 explaintext 추출 결과와 비슷한 평문으로 변환
+
+        Args:
+            category_names (List[str]): 분류 이름공간 접두어 (예: '분류', 'Category')
+            file_names (List[str]): 파일 이름공간 접두어 (예: '파일', 'File')
+        """
+        categories = "|".join(re.escape(name) for name in category_names)
+        files = "|".join(re.escape(name) for name in file_names)
+        self.category_re = re.compile(rf"\[\[\s*(?:{categories})\s*:\s*([^\]|]+)(?:\|[^\]]*)?\]\]", re.IGNORECASE)
+        self.file_re = re.compile(rf"\[\[\s*(?:{files})\s*:[^\[\]]*(?:\[\[[^\]]*\]\][^\[\]]*)*\]\]", re.IGNORECASE)
+        self.template_re = re.compile(r"\{\{[^{}]*\}\}")
+        self.table_re = re.compile(r"\{\|[^{}]*?\|\}", re.DOTALL)
+
+    def categories(self, wikitext: str) -> List[str]:
+        return [match.strip() for match in self.category_re.findall(wikitext)]
+
+    def langlinks(self, wikitext: str) -> List[Tuple[str, str]]:
+        return [(code, title.strip()) for code, title in LANGLINK_RE.findall(wikitext)]
+
+    def to_plaintext(self, wikitext: str) -> str:
+        text = re.sub(r"<!--.*?-->", "", wikitext, flags=re.DOTALL)
+        text = re.sub(r"<ref[^>/]*/>", "", text)
+        text = re.sub(r"<ref[^>]*>.*?</ref>", "", text, flags=re.DOTALL)
+        text = _strip_nested(text, self.template_re)
+        text = _strip_nested(text, self.table_re)
+        text = self.file_re.sub("", text)
+        text = self.category_re.sub("", text)
+        text = LANGLINK_RE.sub("", text)
+        text = re.sub(r"\[\[[^\]|]*\|([^\]]*)\]\]", r"\1", text)
+        text = re.sub(r"\[\[([^\]]*)\]\]", r"\1", text)
+        text = re.sub(r"\[https?://\S+\s+([^\]]*)\]", r"\1", text)
+        text = re.sub(r"\[https?://\S+\]", "", text)
+        text = re.sub(r"'{2,}", "", text)
+        text = re.sub(r"<[^>]+>", "", text)
+        text = re.sub(r"\n{3,}", "\n\n", text)
+        return text.strip()
+
+
+def _sections(content: str) -> List[Dict]:
+    """본문의 '== 제목 ==' 줄로 action=parse 형식의 섹션 목록 구성"""
+    return [
+        {"line": match.group(2), "level": str(len(match.group(1))), "index": str(i)}
+        for i, match in enumerate(HEADING_RE.finditer(content), start=1)
+    ]
+
+
+def _intro_length(content: str) -> int:
+    match = HEADING_RE.search(content)
+    return match.start() if match else len(content)
+
+
+def iter_xml_pages(path: str, language: str) -> Iterator[Dict]:
+    """MediaWiki XML 덤프에서 일반 문서(ns=0)를 API 페이지 형식으로 변환"""
+    category_names = ["Category"]
+    file_names = ["File", "Image"]
+    cleaner = None
+    root = None
+
+    with _open_source(path) as source:
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            if root is None:
+                root = elem
+            if event != "end":
+                continue
+            tag = elem.tag.rsplit("}", 1)[-1]
+
+            if tag == "namespace":
+                if elem.get("key") == "14" and elem.text:
+                    category_names.insert(0, elem.text)
+                elif elem.get("key") == "6" and elem.text:
+                    file_names.insert(0, elem.text)
+                continue
+
+            if tag != "page":
+                continue
+
+            if cleaner is None:
+                cleaner = WikitextCleaner(category_names, file_names)
+
+            fields = {child.tag.rsplit("}", 1)[-1]: child for child in elem}
+            if fields.get("ns") is not None and fields["ns"].text != "0":
+                elem.clear()
+                root.clear()
+                continue
+
+            title = fields["title"].text
+            redirect = fields.get("redirect")
+            revision = fields.get("revision")
+            wikitext = ""
+            lastrevid = 0
+            if revision is not None:
+                for child in revision:
+                    name = child.tag.rsplit("}", 1)[-1]
+                    if name == "text":
+                        wikitext = child.text or ""
+                    elif name == "id":
+                        lastrevid = int(child.text)
+
+            if redirect is not None:
+                yield {"redirect_from": title, "redirect_to": redirect.get("title")}
+            else:
+                content = cleaner.to_plaintext(wikitext)
+                yield {
+                    "pageid": int(fields["id"].text),
+                    "title": title,
+                    "lastrevid": lastrevid,
+                    "extract": content,
+                    "intro_length": _intro_length(content),
+                    "fullurl": f"https://{language}.wikipedia.org/wiki/{title.replace(' ', '_')}",
+                    "categories": [
+                        {"title": f"{category_names[0]}:{category}"}
+                        for category in cleaner.categories(wikitext)
+                    ],
+                    "langlinks": [
+                        {"langname": code, "url": f"https://{code}.wikipedia.org/wiki/{link.replace(' ', '_')}"}
+                        for code, link in cleaner.langlinks(wikitext)
+                    ],
+                    "sections": _sections(content)
+                }
+            # 처리한 page를 루트에서도 떼어 내야 전체 덤프를 읽는 동안 메모리가 늘지 않음
+            elem.clear()
+            root.clear()
+
+
+def iter_jsonl_pages(path: str, language: str) -> Iterator[Dict]:
+    """
+    JSONL 덤프(한 줄에 문서 하나)를 API 페이지 형식으로 변환
+
+    CirrusSearch 덤프처럼 문서 줄 사이에 색인 명령 줄이 끼어 있어도 되며,
+    title이 없는 줄은 건너뛴다. 본문은 평문으로 간주한다.
+    """
+    with _open_source(path) as source:
+        for line in source:
+            if not line.strip():
+                continue
+            doc = json.loads(line)
+            if "title" not in doc or doc.get("namespace", 0) != 0:
+                continue
+
+            title = doc["title"]
+            content = doc.get("extract") or doc.get("text") or doc.get("content") or ""
+            categories = doc.get("categories") or doc.get("category") or []
+            sections = doc.get("sections") or doc.get("heading") or []
+            langlinks = doc.get("other_languages") or doc.get("langlinks") or []
+
+            page = {
+                "pageid": int(doc.get("pageid") or doc.get("page_id") or doc.get("id") or 0),
+                "title": title,
+                "lastrevid": int(doc.get("lastrevid") or doc.get("version") or 0),
+                "extract": content,
+                "intro_length": len(doc["opening_text"]) if doc.get("opening_text") else _intro_length(content),
+                "fullurl": doc.get("url") or f"https://{language}.wikipedia.org/wiki/{title.replace(' ', '_')}",
+                "categories": [{"title": category} for category in categories],
+                "langlinks": [
+                    {"langname": lang.get("langname") or lang.get("language"), "url": lang["url"]}
+                    for lang in langlinks
+                ],
+                "sections": [
+                    section if isinstance(section, dict) and "line" in section else
+                    {
+                        "line": section.get("title") if isinstance(section, dict) else section,
+                        "level": str(section.get("level", 2)) if isinstance(section, dict) else "2",
+                        "index": str(i)
+                    }
+                    for i, section in enumerate(sections, start=1)
+                ]
+            }
+            if doc.get("image_url"):
+                page["original"] = {"source": doc["image_url"]}
+            yield page
+
+            for redirect in doc.get("redirect") or doc.get("redirects") or []:
+                alias = redirect.get("title") if isinstance(redirect, dict) else redirect
+                yield {"redirect_from": alias, "redirect_to": title}
+
+
+def _map(file) -> Union[mmap.mmap, bytes]:
+    """파일을 읽기 전용으로 mmap (빈 파일은 mmap 할 수 없으므로 빈 bytes)"""
+    if os.fstat(file.fileno()).st_size == 0:
+        return b""
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class WikiDumpIndex:
+    def __init__(self, path: str):
+        """
+        build()로 만든 오프라인 위키피디아 덤프 색인을 메모리 맵으로 열기
+
+        본문 파일(pages.dat)과 정렬된 제목 색인(titles.idx)을 모두 mmap 하므로
+        여는 비용이 거의 없고, 조회는 제목 색인의 이진 탐색 한 번으로 끝난다.
+
+        Args:
+            path (str): build()의 출력 디렉토리
+        """
+        self.path = path
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.language = self.meta["language"]
+        self._data_file = open(os.path.join(path, DATA_FILE), "rb")
+        self._index_file = open(os.path.join(path, INDEX_FILE), "rb")
+        # 문서가 하나도 없는 덤프면 두 파일이 비어 있으므로 빈 색인으로 연다
+        self._data = _map(self._data_file)
+        self._index = _map(self._index_file)
+
+    def _find(self, key: bytes) -> Optional[Tuple[int, int]]:
+        """정렬된 'key\\toffset\\tlength' 줄에서 이진 탐색"""
+        index = self._index
+        lo, hi = 0, len(index)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = index.rfind(b"\n", lo, mid)
+            start = lo if start < 0 else start + 1
+            end = index.find(b"\n", start)
+            line_key, offset, length = index[start:end].split(b"\t")
+            if line_key == key:
+                return int(offset), int(length)
+            if line_key < key:
+                lo = end + 1
+            else:
+                hi = start
+        return None
+
+    def get(self, title: str, summary_only: bool = False) -> Optional[Dict]:
+        """
+        제목(또는 넘겨주기 제목)으로 페이지 조회
+
+        Returns:
+            Dict: API의 query 결과와 같은 형식의 페이지 데이터 (sections 포함)
+            None: 색인에 없는 경우
+        """
+        location = self._find(normalize_title(title).encode("utf-8"))
+        if location is None:
+            return None
+        offset, length = location
+        page = json.loads(self._data[offset:offset + length])
+        if summary_only:
+            page["extract"] = page["extract"][:page["intro_length"]].strip()
+        return page
+
+    def close(self):
+        for mapped in (self._data, self._index):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        self._data_file.close()
+        self._index_file.close()
+
+    @classmethod
+    def build(cls, source: str, path: str, language: str = "ko") -> "WikiDumpIndex":
+        """
+        XML(.xml/.bz2/.gz) 또는 JSONL 덤프를 한 번 읽어 색인 디렉토리 생성
+
+        Args:
+            source (str): 덤프 파일 경로
+            path (str): 색인을 저장할 디렉토리
+            language (str): 덤프의 위키피디아 언어
+        """
+        os.makedirs(path, exist_ok=True)
+        is_xml = any(source.endswith(ext) for ext in (".xml", ".xml.bz2", ".xml.gz"))
+        pages = iter_xml_pages(source, language) if is_xml else iter_jsonl_pages(source, language)
+
+        locations: Dict[str, Tuple[int, int]] = {}
+        redirects: List[Tuple[str, str]] = []
+        count = 0
+        with open(os.path.join(path, DATA_FILE), "wb") as data:
+            for page in pages:
+                if "redirect_from" in page:
+                    redirects.append((page["redirect_from"], page["redirect_to"]))
+                    continue
+                record = json.dumps(page, ensure_ascii=False).encode("utf-8")
+                locations[normalize_title(page["title"])] = (data.tell(), len(record))
+                data.write(record)
+                count += 1
+
+        for alias, target in redirects:
+            alias_key = normalize_title(alias)
+            target_location = locations.get(normalize_title(target))
+            if target_location and alias_key not in locations:
+                locations[alias_key] = target_location
+
+        entries = sorted(
+            (key.encode("utf-8"), offset, length)
+            for key, (offset, length) in locations.items()
+        )
+        with open(os.path.join(path, INDEX_FILE), "wb") as index:
+            for key, offset, length in entries:
+                index.write(b"%s\t%d\t%d\n" % (key, offset, length))
+
+        with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as meta:
+            json.dump({"language": language, "source": os.path.basename(source), "pages": count}, meta)
+
+        return cls(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="위키피디아 덤프로 오프라인 색인 생성")
+    parser.add_argument("source", help="XML(.xml/.bz2/.gz) 또는 JSONL 덤프 파일")
+    parser.add_argument("path", help="색인을 저장할 디렉토리")
+    parser.add_argument("--language", default="ko")
+    args = parser.parse_args()
+
+    index = WikiDumpIndex.build(args.source, args.path, args.language)
+    print(f"{index.meta['pages']} pages indexed into {args.path}")
+    index.close()
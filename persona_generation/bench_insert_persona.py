@@ -0,0 +1,177 @@
+"""
+insert_persona_data 저장 방식 비교 마이크로 벤치마크
+
+기존 방식(행마다 INSERT)과 persona_store.insert_persona(단일 CTE 문장)의
+DB 왕복 횟수를 비교한다.
+
+    python bench_insert_persona.py --rtt-ms 30
+        DB 없이 문장 수만 세고, 왕복 지연(RTT)을 곱해 예상 시간을 계산
+
+    python bench_insert_persona.py --dsn postgresql://... --iterations 20
+        실제 DB에 두 방식을 실행해 시간을 측정 (매 회 롤백하여 데이터는 남기지 않음)
+"""
+import argparse
+import statistics
+import time
+import uuid
+from typing import Dict, List
+
+from persona_store import insert_persona
+
+SAMPLE_PERSONA = {
+    "basic_info": {
+        "name": "이순신",
+        "birth_death": "1545-1598",
+        "era": "조선 중기",
+        "nationality": "조선",
+        "gender": "남성"
+    },
+    "professional": {
+        "primary_occupation": "조선 수군 지휘관, 장군",
+        "other_roles": ["병법가", "전략가", "시인"],
+        "major_achievements": [
+            "임진왜란 당시 조선 수군을 이끌어 다수의 승리 획득",
+            "한산도 대첩, 명량 대첩 등에서 결정적 승리를 이끌어냄",
+            "거북선을 개발 및 활용",
+            "난중일기 집필",
+            "조선 해군의 명성을 드높이며 조국을 지켜냄"
+        ]
+    },
+    "personal": {
+        "education": "무과 급제",
+        "background": "어려운 가정 형편 속에서도 학문과 무예에 매진",
+        "personality_traits": [
+            "책임감 강하고 불굴의 의지를 가짐",
+            "타인을 배려하며 군사들과 신뢰를 쌓음",
+            "침착하고 냉철한 판단력",
+            "조국과 백성을 위한 희생정신",
+            "원칙을 굽히지 않는 강직함"
+        ],
+        "influences": ["유학의 충효 사상", "병법과 전략", "임진왜란", "백성들의 지지"]
+    },
+    "legacy": {
+        "impact": "조선의 해상 방어를 강화하고 침략에 맞서 조국을 구함",
+        "modern_significance": "리더십과 애국심의 상징"
+    },
+    "historical_context": {
+        "period_background": "임진왜란으로 인한 조선의 위기",
+        "key_events": [
+            "임진왜란 발발 (1592년)",
+            "옥포 해전",
+            "한산도 대첩",
+            "명량 해전",
+            "노량 해전에서 전사"
+        ]
+    }
+}
+SAMPLE_WIKI = {"basic_info": {"image_url": None}}
+
+
+def insert_per_row(cur, persona_data: Dict, wiki_data: Dict) -> str:
+    """기존 insert_persona_data와 같은 방식 - 목록 항목마다 INSERT 한 번"""
+    person_id = str(uuid.uuid4())
+    basic = persona_data["basic_info"]
+    cur.execute(
+        "INSERT INTO basic_info (person_id, name, birth_death, era, nationality, gender, image_url) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+        (person_id, basic["name"], basic["birth_death"], basic["era"], basic["nationality"],
+         basic["gender"], wiki_data.get("basic_info", {}).get("image_url"))
+    )
+    cur.execute(
+        "INSERT INTO professional_info (person_id, primary_occupation) VALUES (%s, %s)",
+        (person_id, persona_data["professional"]["primary_occupation"])
+    )
+    for role in persona_data["professional"]["other_roles"]:
+        cur.execute("INSERT INTO other_roles (person_id, role_name) VALUES (%s, %s)", (person_id, role))
+    for achievement in persona_data["professional"]["major_achievements"]:
+        cur.execute(
+            "INSERT INTO major_achievements (person_id, achievement_name) VALUES (%s, %s)",
+            (person_id, achievement)
+        )
+    cur.execute(
+        "INSERT INTO personal_info (person_id, education, background) VALUES (%s, %s, %s)",
+        (person_id, persona_data["personal"]["education"], persona_data["personal"]["background"])
+    )
+    for trait in persona_data["personal"]["personality_traits"]:
+        cur.execute("INSERT INTO personality_traits (person_id, trait_name) VALUES (%s, %s)", (person_id, trait))
+    for influence in persona_data["personal"]["influences"]:
+        cur.execute("INSERT INTO influences (person_id, influence_name) VALUES (%s, %s)", (person_id, influence))
+    cur.execute(
+        "INSERT INTO legacy (person_id, impact, modern_significance) VALUES (%s, %s, %s)",
+        (person_id, persona_data["legacy"]["impact"], persona_data["legacy"]["modern_significance"])
+    )
+    cur.execute(
+        "INSERT INTO historical_context (person_id, period_background) VALUES (%s, %s)",
+        (person_id, persona_data["historical_context"]["period_background"])
+    )
+    for event in persona_data["historical_context"]["key_events"]:
+        cur.execute("INSERT INTO key_events (person_id, event_description) VALUES (%s, %s)", (person_id, event))
+    return person_id
+
+
+STRATEGIES = {
+    "per_row": insert_per_row,
+    "single_cte": insert_persona,
+}
+
+
+class CountingCursor:
+    """execute 호출 횟수(= DB 왕복 횟수)를 세는 커서 래퍼. cursor가 없으면 실행하지 않음"""
+
+    def __init__(self, cursor=None):
+        self.cursor = cursor
+        self.statements = 0
+
+    def execute(self, query, params=None):
+        self.statements += 1
+        if self.cursor is not None:
+            self.cursor.execute(query, params)
+
+
+def count_round_trips() -> Dict[str, int]:
+    """전략별 왕복 횟수 (BEGIN과 COMMIT 포함)"""
+    counts = {}
+    for name, strategy in STRATEGIES.items():
+        cursor = CountingCursor()
+        strategy(cursor, SAMPLE_PERSONA, SAMPLE_WIKI)
+        counts[name] = cursor.statements + 2
+    return counts
+
+
+def measure_live(dsn: str, iterations: int) -> Dict[str, List[float]]:
+    """실제 DB에서 전략별 소요 시간(ms) 측정 - 매 회 롤백"""
+    import psycopg2
+
+    timings = {name: [] for name in STRATEGIES}
+    conn = psycopg2.connect(dsn)
+    try:
+        for _ in range(iterations):
+            for name, strategy in STRATEGIES.items():
+                started = time.perf_counter()
+                with conn.cursor() as cur:
+                    strategy(cur, SAMPLE_PERSONA, SAMPLE_WIKI)
+                # 커밋 대신 롤백하되 왕복 한 번은 동일하게 포함
+                conn.rollback()
+                timings[name].append((time.perf_counter() - started) * 1000)
+    finally:
+        conn.close()
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="insert_persona_data 왕복 횟수 비교")
+    parser.add_argument("--dsn", help="실제 측정할 PostgreSQL DSN (없으면 문장 수만 계산)")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--rtt-ms", type=float, default=30.0, help="DB 없이 계산할 때 가정할 왕복 지연")
+    args = parser.parse_args()
+
+    counts = count_round_trips()
+    for name, round_trips in counts.items():
+        print(f"{name:>10}: {round_trips:3d} round trips, ~{round_trips * args.rtt_ms:.0f} ms at {args.rtt_ms:.0f} ms RTT")
+    print(f"reduction: {counts['per_row'] / counts['single_cte']:.1f}x fewer round trips")
+
+    if args.dsn:
+        timings = measure_live(args.dsn, args.iterations)
+        for name, samples in timings.items():
+            print(f"{name:>10}: median {statistics.median(samples):.1f} ms, max {max(samples):.1f} ms "
+                  f"over {len(samples)} runs")
@@ -0,0 +1,182 @@
+import math
+import os
+import re
+from typing import Dict, List, Optional
+
+# 프롬프트에 넣을 위키 본문의 최대 토큰 수
+CONTENT_TOKEN_BUDGET = int(os.getenv("PERSONA_CONTENT_TOKEN_BUDGET", "2000"))
+TOKENIZER_ENCODING = os.getenv("PERSONA_TOKENIZER_ENCODING", "o200k_base")
+
+HEADING_RE = re.compile(r"^(={2,6})\s*(.+?)\s*\1\s*$")
+SENTENCE_END_RE = re.compile(r"(?<=[.!?。])\s+")
+
+# 인물 프로필에 도움이 되는 섹션 (제목에 포함되면 가중치 부여)
+SECTION_WEIGHTS = {
+    "생애": 3.0, "활동": 2.5, "업적": 3.0, "경력": 2.5, "사상": 2.5, "평가": 2.5,
+    "초기": 2.0, "유년": 2.0, "교육": 2.0, "가족": 1.5, "사망": 2.0, "죽음": 2.0,
+    "일화": 1.5, "성격": 2.5, "영향": 2.0, "유산": 2.5,
+    "life": 3.0, "career": 2.5, "legacy": 2.5, "personal": 2.0, "early": 2.0,
+    "death": 2.0, "education": 2.0, "views": 2.0, "philosophy": 2.5,
+}
+# 프로필 생성에 쓸모없는 섹션 (제목에 포함되면 제외)
+SKIPPED_SECTIONS = (
+    "각주", "참고 문헌", "참고문헌", "외부 링크", "같이 보기", "관련 항목", "출처", "주석", "갤러리",
+    "references", "notes", "see also", "external links", "bibliography", "further reading", "sources",
+)
+# 관리용 숨은 분류
+SKIPPED_CATEGORY_PATTERNS = (
+    "위키데이터", "CS1", "출처", "인용", "문서", "틀", "잘못된", "좌표", "영어 표기",
+    "Wikidata", "Articles", "Pages", "Webarchive", "Use ", "All ", "Commons",
+)
+
+_encoding = None
+
+
+def _get_encoding():
+    """tiktoken 인코딩을 한 번만 불러옴 (설치되어 있지 않거나 불러오지 못하면 None)"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception:
+            _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    """
+    텍스트의 토큰 수 계산
+
+    tiktoken을 쓸 수 있으면 모델 토크나이저로 세고, 그렇지 않으면
+    ASCII 4자당 1토큰, 그 외 문자(한글 등) 1자당 0.7토큰으로 근사한다.
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) * 0.7)
+
+
+def _section_weight(title: Optional[str]) -> Optional[float]:
+    """섹션 제목의 가중치 - 제외할 섹션이면 None"""
+    if title is None:
+        return 4.0  # 도입부
+    lowered = title.lower()
+    if any(skipped in lowered for skipped in SKIPPED_SECTIONS):
+        return None
+    weights = [weight for keyword, weight in SECTION_WEIGHTS.items() if keyword in lowered]
+    return max(weights) if weights else 1.0
+
+
+def split_paragraphs(content: str, sections: List[Dict]) -> List[Dict]:
+    """
+    본문을 문단 단위로 나누고 각 문단이 속한 섹션과 가중치를 붙임
+
+    섹션 목록(search_person의 sections)에 있는 제목의 level을 사용하고,
+    목록에 없는 제목은 '=' 개수로 level을 정한다. 하위 섹션은 상위 섹션
+    가중치의 일부를 물려받고, 상위 섹션이 제외 대상이면 함께 제외된다.
+    """
+    levels = {section["title"]: int(section["level"]) for section in sections}
+    paragraphs = []
+    # (level, 가중치) - 현재 위치의 상위 섹션들
+    stack: List = []
+    title, level, weight = None, 1, _section_weight(None)
+    index_in_section = 0
+
+    for block in re.split(r"\n\s*\n|\n(?==)", content):
+        lines = [line for line in block.strip().split("\n") if line.strip()]
+        if not lines:
+            continue
+        heading = HEADING_RE.match(lines[0].strip())
+        if heading:
+            title = heading.group(2)
+            level = levels.get(title, len(heading.group(1)))
+            while stack and stack[-1][0] >= level:
+                stack.pop()
+            parent = stack[-1][1] if stack else 1.0
+            own = _section_weight(title)
+            weight = None if own is None or parent is None else max(own, parent * 0.8)
+            stack.append((level, weight))
+            index_in_section = 0
+            lines = lines[1:]
+        text = " ".join(line.strip() for line in lines)
+        if not text:
+            continue
+        paragraphs.append({
+            "order": len(paragraphs),
+            "section": title,
+            "level": level,
+            "weight": weight,
+            "index_in_section": index_in_section,
+            "text": text
+        })
+        index_in_section += 1
+    return paragraphs
+
+
+def _score(paragraph: Dict) -> Optional[float]:
+    if paragraph["weight"] is None:
+        return None
+    # 깊은 하위 섹션일수록, 섹션 뒤쪽 문단일수록 낮게 평가
+    depth = 1 + 0.15 * max(paragraph["level"] - 2, 0)
+    position = 1 + 0.3 * paragraph["index_in_section"]
+    # 연도가 있는 문단은 사실 정보가 많은 경우가 많음
+    factual = 1.2 if re.search(r"\d{3,4}년|\d{4}", paragraph["text"]) else 1.0
+    return paragraph["weight"] * factual / (depth * position)
+
+
+def _trim_to_sentences(text: str, budget: int) -> str:
+    """문장 경계에서 잘라 budget 토큰 이하로 줄임 (한 문장도 안 들어가면 빈 문자열)"""
+    kept = ""
+    for sentence in SENTENCE_END_RE.split(text):
+        candidate = f"{kept} {sentence}".strip() if kept else sentence.strip()
+        if count_tokens(candidate) > budget:
+            break
+        kept = candidate
+    return kept
+
+
+def select_content(content: str, sections: List[Dict], budget: int = CONTENT_TOKEN_BUDGET) -> str:
+    """
+    위키 본문에서 인물 프로필에 유용한 문단을 골라 토큰 예산 안에 담기
+
+    도입부와 생애/업적 같은 섹션의 앞쪽 문단을 우선 선택하고, 각주/외부 링크 같은
+    섹션은 제외한다. 선택한 문단은 원래 순서와 섹션 제목을 유지해 이어 붙인다.
+    """
+    scored = [
+        (score, paragraph)
+        for paragraph in split_paragraphs(content, sections)
+        if (score := _score(paragraph)) is not None
+    ]
+
+    selected = []
+    remaining = budget
+    for score, paragraph in sorted(scored, key=lambda item: (-item[0], item[1]["order"])):
+        heading_cost = count_tokens(f"[{paragraph['section']}]\n") if paragraph["section"] else 0
+        cost = count_tokens(paragraph["text"]) + heading_cost
+        if cost <= remaining:
+            selected.append(paragraph)
+            remaining -= cost
+        elif remaining > heading_cost + 20:
+            trimmed = _trim_to_sentences(paragraph["text"], remaining - heading_cost)
+            if trimmed:
+                selected.append({**paragraph, "text": trimmed})
+                remaining -= count_tokens(trimmed) + heading_cost
+
+    output = []
+    current_section = None
+    for paragraph in sorted(selected, key=lambda p: p["order"]):
+        if paragraph["section"] and paragraph["section"] != current_section:
+            output.append(f"[{paragraph['section']}]")
+            current_section = paragraph["section"]
+        output.append(paragraph["text"])
+    return "\n".join(output)
+
+
+def select_categories(categories: List[str], limit: int = 10) -> List[str]:
+    """관리용 숨은 분류를 제외하고 앞에서부터 limit개 선택"""
+    return [
+        category for category in categories
+        if not any(pattern in category for pattern in SKIPPED_CATEGORY_PATTERNS)
+    ][:limit]
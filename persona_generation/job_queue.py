@@ -0,0 +1,247 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+DEFAULT_QUEUE_PATH = os.getenv(
+    "JOB_QUEUE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "persona_jobs.sqlite3")
+)
+# 워커가 죽은 경우 running 상태의 작업을 다시 가져갈 수 있게 되는 시간(초)
+DEFAULT_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+# lease가 만료될 때까지 끝나지 않은 작업(워커가 죽는 작업 등)을 다시 실행하는 최대 횟수
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# 큐(SQLite) 오류가 계속될 때 워커가 다시 시도하기까지 기다리는 최대 시간(초)
+WORKER_MAX_BACKOFF = float(os.getenv("JOB_WORKER_MAX_BACKOFF", "30"))
+
+JobHandler = Callable[..., Awaitable[Dict]]
+
+
+class PersonaJobQueue:
+    def __init__(
+        self,
+        handler: JobHandler,
+        path: str = DEFAULT_QUEUE_PATH,
+        workers: int = 4,
+        lease_seconds: int = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        poll_interval: float = 1.0
+    ):
+        """
+        SQLite에 저장되는 persona 생성 작업 큐와 워커 풀
+
+        작업은 claim 시점에 lease를 잡고 실행되며, 서버가 재시작되거나
+        워커 프로세스가 죽어 lease가 만료되면 다른 워커가 다시 가져간다.
+        여러 uvicorn 워커가 같은 파일을 공유해도 claim은 쓰기 잠금으로 직렬화된다.
+        lease 만료로 max_attempts번 실행된 작업은 더 이상 가져가지 않고 failed로 끝낸다.
+        handler가 예외를 발생시킨 작업은 다시 실행하지 않고 바로 failed가 된다.
+
+        Args:
+            handler: async handler(name, progress, force=...) -> 결과 Dict. 실패 시 예외를 발생
+            path (str): SQLite 파일 경로
+            workers (int): 동시에 실행할 워커 수
+            lease_seconds (int): 실행 중인 작업의 lease 시간(초)
+            max_attempts (int): 작업 하나를 실행하는 최대 횟수 (enqueue 시점에 작업에 기록)
+            poll_interval (float): 대기 작업이 없을 때 다시 확인하는 간격(초)
+        """
+        self.handler = handler
+        self.path = path
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.poll_interval = poll_interval
+        self._tasks: Set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS persona_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    force INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL DEFAULT 3,
+                    lease_until REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS persona_jobs_status ON persona_jobs (status, created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _enqueue(self, name: str, force: bool) -> str:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("""
+                INSERT INTO persona_jobs (job_id, name, force, status, max_attempts, created_at, updated_at)
+                VALUES (?, ?, ?, 'queued', ?, ?, ?)
+            """, (job_id, name, int(force), self.max_attempts, now, now))
+        return job_id
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """대기 중이거나 lease가 만료된 작업 하나를 가져와 running으로 표시"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # 실행 횟수를 다 쓴 채 lease가 만료된 작업은 다시 가져가지 않고 실패 처리
+            conn.execute("""
+                UPDATE persona_jobs
+                SET status = 'failed', error = 'lease expired after ' || attempts || ' attempts',
+                    lease_until = NULL, updated_at = ?
+                WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts
+            """, (now, now))
+            job = conn.execute("""
+                SELECT job_id, name, force FROM persona_jobs
+                WHERE status = 'queued' OR (status = 'running' AND lease_until < ?)
+                ORDER BY created_at
+                LIMIT 1
+            """, (now,)).fetchone()
+            if job is not None:
+                conn.execute("""
+                    UPDATE persona_jobs
+                    SET status = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ?
+                    WHERE job_id = ?
+                """, (now + self.lease_seconds, now, job["job_id"]))
+            conn.execute("COMMIT")
+            return job
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _release(self, job_id: str):
+        """실행하지 못하고 중단된 작업을 queued로 되돌림 (실행 횟수에 넣지 않음)"""
+        with closing(self._connect()) as conn:
+            conn.execute("""
+                UPDATE persona_jobs
+                SET status = 'queued', attempts = MAX(attempts - 1, 0), lease_until = NULL, updated_at = ?
+                WHERE job_id = ? AND status = 'running'
+            """, (time.time(), job_id))
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{column} = ?" for column in fields)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                f"UPDATE persona_jobs SET {columns} WHERE job_id = ?",
+                (*fields.values(), job_id)
+            )
+
+    def _get(self, job_id: str) -> Optional[Dict]:
+        with closing(self._connect()) as conn:
+            job = conn.execute("SELECT * FROM persona_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if job is None:
+            return None
+        return {
+            "job_id": job["job_id"],
+            "name": job["name"],
+            "force": bool(job["force"]),
+            "status": job["status"],
+            "stage": job["stage"],
+            "result": json.loads(job["result"]) if job["result"] else None,
+            "error": job["error"],
+            "attempts": job["attempts"],
+            "max_attempts": job["max_attempts"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"]
+        }
+
+    async def enqueue(self, name: str, force: bool = False) -> str:
+        """작업을 큐에 넣고 job id 반환"""
+        job_id = await asyncio.to_thread(self._enqueue, name, force)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        """작업 상태와 결과 조회"""
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def _run_job(self, job: sqlite3.Row):
+        job_id = job["job_id"]
+
+        async def progress(stage: str):
+            await asyncio.to_thread(self._update, job_id, stage=stage)
+
+        try:
+            result = await self.handler(job["name"], progress, force=bool(job["force"]))
+        except asyncio.CancelledError:
+            # 종료 중에 중단된 작업은 다음 실행 때 다시 처리
+            await asyncio.to_thread(self._release, job_id)
+            raise
+        except Exception as e:
+            await asyncio.to_thread(self._update, job_id, status="failed", error=str(e), lease_until=None)
+            return
+        await asyncio.to_thread(
+            self._update, job_id,
+            status="succeeded", result=json.dumps(result, ensure_ascii=False), lease_until=None
+        )
+
+    async def _claim_job(self) -> Optional[sqlite3.Row]:
+        """
+        스레드에서 claim 실행
+
+        claim 도중 워커가 취소되어도 스레드의 claim은 끝까지 실행되므로, 그 결과를 기다렸다가
+        가져온 작업이 있으면 lease 만료를 기다리지 않도록 바로 queued로 되돌린다.
+        """
+        claim = asyncio.ensure_future(asyncio.to_thread(self._claim))
+        try:
+            return await asyncio.shield(claim)
+        except asyncio.CancelledError:
+            job = await claim
+            if job is not None:
+                await asyncio.to_thread(self._release, job["job_id"])
+            raise
+
+    async def _worker(self):
+        failures = 0
+        while True:
+            try:
+                job = await self._claim_job()
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await self._run_job(job)
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 큐 오류(database is locked 등)로 워커가 사라지지 않도록 기록하고 점점 길게 기다린 뒤 재시도
+                failures += 1
+                delay = min(self.poll_interval * 2 ** failures, WORKER_MAX_BACKOFF)
+                print(f"persona 작업 워커 오류 ({failures}회 연속), {delay:.1f}초 후 재시도: {e!r}")
+                await asyncio.sleep(delay)
+
+    def start(self):
+        """워커 풀 시작 - 이벤트 루프 안에서 호출"""
+        self._wakeup = asyncio.Event()
+        for _ in range(self.workers):
+            task = asyncio.create_task(self._worker())
+            self._tasks.add(task)
+
+    async def stop(self):
+        """워커 풀 종료 - 실행 중이던 작업은 queued로 되돌림"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
@@ -0,0 +1,113 @@
+import json
+from typing import Any, List, Optional, Tuple, Union
+
+PathKey = Union[str, int]
+
+
+class _Frame:
+    __slots__ = ("kind", "key", "index", "expect_key", "value_start")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.key: Optional[str] = None
+        self.index = 0
+        self.expect_key = kind == "{"
+        self.value_start: Optional[int] = None
+
+    def child_key(self) -> PathKey:
+        return self.key if self.kind == "{" else self.index
+
+
+class IncrementalJsonParser:
+    def __init__(self, max_depth: int = 1):
+        """
+        스트리밍으로 들어오는 JSON 텍스트에서 완성된 값을 즉시 꺼내는 파서
+
+        feed()로 조각을 넣을 때마다, 깊이가 max_depth 이하인 값 중 이번에 닫힌 값을
+        (경로, 값) 목록으로 반환한다. 경로는 최상위부터의 키/인덱스 튜플이다.
+        예) max_depth=1 이면 {"a": {...}, "b": [...]} 에서 ("a",), ("b",) 가 닫히는 즉시 반환
+            max_depth=2 이면 ("turns", 0), ("turns", 1) 처럼 배열 원소도 각각 반환
+
+        Args:
+            max_depth (int): 반환할 값의 최대 경로 길이
+        """
+        self.max_depth = max_depth
+        self.buffer = ""
+        self.pos = 0
+        self.stack: List[_Frame] = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.string_is_key = False
+        self.root_start = 0
+
+    def _complete(self, end: int, results: List[Tuple[Tuple[PathKey, ...], Any]]):
+        """현재 프레임의 자식 값이 end 직전에서 끝남"""
+        frame = self.stack[-1]
+        start = frame.value_start
+        frame.value_start = None
+        path = tuple(f.child_key() for f in self.stack)
+        if len(path) <= self.max_depth:
+            results.append((path, json.loads(self.buffer[start:end])))
+
+    def feed(self, chunk: str) -> List[Tuple[Tuple[PathKey, ...], Any]]:
+        self.buffer += chunk
+        results: List[Tuple[Tuple[PathKey, ...], Any]] = []
+        buffer = self.buffer
+
+        for i in range(self.pos, len(buffer)):
+            c = buffer[i]
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    if self.string_is_key:
+                        self.stack[-1].key = json.loads(buffer[self.string_start:i + 1])
+                    elif self.stack:
+                        self._complete(i + 1, results)
+                continue
+
+            if c in " \t\r\n":
+                continue
+
+            frame = self.stack[-1] if self.stack else None
+
+            if c == '"':
+                self.in_string = True
+                self.string_start = i
+                self.string_is_key = frame is not None and frame.kind == "{" and frame.expect_key
+                if frame is not None and not self.string_is_key:
+                    frame.value_start = i
+            elif c in "{[":
+                if frame is not None:
+                    frame.value_start = i
+                else:
+                    self.root_start = i
+                self.stack.append(_Frame(c))
+            elif c in "}]":
+                if frame.value_start is not None:
+                    self._complete(i, results)
+                self.stack.pop()
+                if self.stack:
+                    self._complete(i + 1, results)
+                else:
+                    results.append(((), json.loads(buffer[self.root_start:i + 1])))
+            elif c == ":":
+                frame.expect_key = False
+            elif c == ",":
+                if frame.value_start is not None:
+                    self._complete(i, results)
+                if frame.kind == "{":
+                    frame.expect_key = True
+                else:
+                    frame.index += 1
+            elif frame is not None and frame.value_start is None:
+                # 숫자/true/false/null 시작
+                frame.value_start = i
+
+        self.pos = len(buffer)
+        return results
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite3")
+)
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(24 * 60 * 60)))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+# 0이면 캐시를 끔
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+
+
+def completion_cache_key(request: Dict[str, Any]) -> str:
+    """
+    요청 인자(model, messages, response_format, temperature, max_tokens 등)로 만든 키
+
+    응답을 바꾸는 인자는 모두 포함하고, timeout처럼 결과와 무관한 인자는 호출하는 쪽에서 뺀다.
+    """
+    encoded = json.dumps(request, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        ttl: int = LLM_CACHE_TTL,
+        memory_entries: int = LLM_CACHE_MEMORY_ENTRIES,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES
+    ):
+        """
+        chat completion 응답 캐시 (프로세스 메모리 LRU + 디스크 SQLite)
+
+        메모리에서 먼저 찾고, 없으면 같은 파일을 쓰는 다른 워커가 저장한 디스크 항목을
+        찾아 메모리로 올린다. 두 계층 모두 TTL이 지난 항목은 사용하지 않으며,
+        최대 개수를 넘으면 가장 오래 사용되지 않은 항목부터 제거한다.
+
+        Args:
+            path (str): SQLite 파일 경로
+            ttl (int): 응답을 재사용할 시간(초)
+            memory_entries (int): 메모리에 둘 최대 응답 수
+            max_entries (int): 디스크에 둘 최대 응답 수
+        """
+        self.path = path
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # 캐시를 쓰지 않는 프로세스에서는 파일을 만들지 않도록 처음 사용할 때 연결
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS completions_accessed_at ON completions (accessed_at);
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def _remember(self, key: str, expires_at: float, payload: str):
+        self._memory[key] = (expires_at, payload)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """캐시된 응답(JSON 문자열) 조회 - 없거나 만료되었으면 None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT payload, expires_at FROM completions WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.disk_hits += 1
+            self._remember(key, row[1], row[0])
+            return row[0]
+
+    def put(self, key: str, payload: str):
+        """응답 저장 후 만료 항목과 최대 개수를 넘는 오래된 항목 제거"""
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, payload)
+            conn = self._connection()
+            conn.execute("""
+                INSERT OR REPLACE INTO completions (key, payload, expires_at, accessed_at)
+                VALUES (?, ?, ?, ?)
+            """, (key, payload, expires_at, now))
+            conn.execute("DELETE FROM completions WHERE expires_at <= ?", (now,))
+            conn.execute("""
+                DELETE FROM completions WHERE rowid IN (
+                    SELECT rowid FROM completions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            conn.commit()
+
+    def record_bypass(self):
+        """캐시를 쓰지 않기로 한 호출 (temperature > 0 등)"""
+        self.bypassed += 1
+
+    def stats(self) -> Dict:
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": hits / total if total else 0.0,
+            "memory_entries": len(self._memory)
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,517 @@
+import asyncio
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+from openai import (
+    APIConnectionError, APITimeoutError, AsyncOpenAI, DefaultAsyncHttpxClient, InternalServerError, RateLimitError
+)
+from openai.types.chat import ChatCompletion
+
+from circuit_breaker import CircuitOpenError, breaker
+from llm_cache import LLM_CACHE_ENABLED, CompletionCache, completion_cache_key
+from llm_metrics import current_tags, metrics
+from model_router import router
+from rate_limiter import RateLimiter, estimate_request_tokens, retry_after_seconds
+
+load_dotenv()
+
+# 호출 종류별로 덮어쓸 수 있는 기본 타임아웃(초)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+# 재시도 대기 시간 상한(초) - 실제 대기는 0 ~ min(상한, 2^시도) 사이의 임의 값
+LLM_RETRY_BACKOFF_CAP = float(os.getenv("LLM_RETRY_BACKOFF_CAP", "30"))
+# max_tokens 없이 호출할 때 응답 토큰 수 추정치
+LLM_DEFAULT_COMPLETION_TOKENS = int(os.getenv("LLM_DEFAULT_COMPLETION_TOKENS", "1000"))
+# 재시도까지 실패하면 route의 다음 모델로 넘어가는 오류 (요청 자체가 잘못된 4xx는 다른 모델로도 실패)
+FALLBACK_ERRORS = (APIConnectionError, APITimeoutError, InternalServerError, RateLimitError, CircuitOpenError)
+# 모든 모델의 회로가 열려 있을 때 degraded를 지정한 호출에 돌려주는 기본 문구
+DEGRADED_MESSAGE = os.getenv("LLM_DEGRADED_MESSAGE", "지금은 답변이 지연되고 있습니다. 잠시 후 다시 시도해 주세요.")
+
+_client: Optional[AsyncOpenAI] = None
+_rate_limiter = RateLimiter()
+_cache = CompletionCache()
+
+
+def get_client() -> AsyncOpenAI:
+    """
+    프로세스 전체에서 공유하는 AsyncOpenAI 클라이언트
+
+    keep-alive 연결 풀을 재사용하므로 호출마다 TLS 연결을 새로 맺지 않고,
+    한 워커가 여러 요청/웹소켓의 LLM 호출을 동시에 기다릴 수 있다.
+    """
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            # 재시도는 한도 상태를 알고 있는 chat_completion에서 처리
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                    keepalive_expiry=30
+                )
+            ),
+        )
+    return _client
+
+
+def _backoff(attempt: int) -> float:
+    """지수 백오프에 full jitter를 적용한 대기 시간"""
+    return random.uniform(0, min(LLM_RETRY_BACKOFF_CAP, 2 ** attempt))
+
+
+async def chat_completion(
+    timeout: Optional[float] = None,
+    cache: Optional[bool] = None,
+    route: Optional[str] = None,
+    degraded: Optional[str] = None,
+    **kwargs: Any
+):
+    """
+    모든 서비스가 사용하는 chat completion 호출 경로
+
+    같은 요청 인자의 응답은 CompletionCache에서 재사용한다. 샘플링 결과가 매번 달라야 하는
+    temperature > 0 호출(기본값 1 포함)은 캐시를 건너뛰며, cache로 호출마다 켜거나 끌 수 있다.
+
+    호출 전에 공유 토큰 버킷에서 요청 1개와 예상 토큰 수를 확보하므로, 여러 워커와
+    서비스가 동시에 호출해도 모델별 RPM/TPM 한도 안에서 순서대로 나간다.
+    429는 retry-after 동안 모든 프로세스를 멈추게 한 뒤, 429/5xx/연결 오류는
+    jitter가 들어간 지수 백오프로 LLM_MAX_RETRIES번까지 재시도한다.
+
+    route를 지정하면 model 대신 model_router가 호출 종류의 SLO와 최근 지연을 보고 모델을 고르고,
+    재시도까지 실패하면 다음 모델로 넘어간다. route에 hedge가 켜져 있으면 p95 지연이 지나도록
+    응답이 없을 때 같은 요청을 한 번 더 보내 먼저 온 응답을 사용한다.
+    오류가 잦은 모델은 회로 차단기가 호출 없이 바로 실패시키며, degraded를 주면 이때
+    예외 대신 그 문구를 담은 응답을 돌려준다.
+
+    Args:
+        timeout (float): 이 호출에만 적용할 타임아웃(초). 없으면 LLM_TIMEOUT
+        cache (bool): 응답 캐시 사용 여부. 없으면 temperature <= 0 일 때만 사용
+        route (str): 호출 종류 (model_router.ROUTES - persona_generation, debate_turn, mentor_reply 등)
+        degraded (str): 회로가 열려 호출할 수 없을 때 대신 돌려줄 응답 내용
+        **kwargs: chat.completions.create에 그대로 전달할 인자
+    """
+    # 스트리밍은 stream_chat_completion에서 첫 토큰 시간과 함께 기록
+    if kwargs.get("stream"):
+        return await _create(timeout, kwargs)
+
+    try:
+        if route is not None:
+            return await _routed_completion(timeout, cache, route, kwargs)
+        response, _ = await _complete(timeout, cache, kwargs)
+        return response
+    except CircuitOpenError as e:
+        if degraded is None:
+            raise
+        return _degraded_response(e.model, degraded)
+
+
+async def _routed_completion(timeout: Optional[float], cache: Optional[bool], route: str, kwargs: Dict[str, Any]):
+    models, prompt_tokens = _route_models(route, kwargs)
+    for index, model in enumerate(models):
+        started = time.perf_counter()
+        try:
+            response, status = await _complete(
+                timeout, cache, {**kwargs, "model": model}, router.hedge_delay(route, model, prompt_tokens)
+            )
+        except FALLBACK_ERRORS as e:
+            router.observe(route, model, time.perf_counter() - started, prompt_tokens, ok=False)
+            if index == len(models) - 1:
+                raise
+            _fallback(route, model, e)
+            continue
+        # 캐시 적중은 모델 지연이 아니므로 관측하지 않음
+        if status == "ok":
+            router.observe(route, model, time.perf_counter() - started, prompt_tokens, ok=True)
+        return response
+
+
+def _route_models(route: str, kwargs: Dict[str, Any]):
+    """route에서 시도할 모델 순서와 예상 프롬프트 토큰 수 (kwargs의 model은 무시)"""
+    kwargs.pop("model", None)
+    prompt_tokens = estimate_request_tokens(kwargs.get("messages", []), 0)
+    return router.choose(route, prompt_tokens), prompt_tokens
+
+
+def _fallback(route: str, model: str, error: Exception):
+    print(f"{route}: {model} 호출 실패, 다음 모델로 전환: {error}")
+    metrics.inc("llm_route_fallbacks_total", route=route, model=model)
+
+
+def _degraded_response(model: str, content: str) -> ChatCompletion:
+    """회로가 열려 있을 때 돌려주는 대체 응답 (캐시하지 않음)"""
+    metrics.inc("llm_degraded_responses_total", endpoint=current_tags().get("endpoint", ""), model=model)
+    return ChatCompletion.model_validate({
+        "id": "degraded",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+    })
+
+
+async def _complete(
+    timeout: Optional[float], cache: Optional[bool], kwargs: Dict[str, Any], hedge_delay: Optional[float] = None
+):
+    """캐시 여부를 정해 호출하고 지표를 기록한 뒤 (응답, 상태) 반환"""
+    if cache is None:
+        cache = kwargs.get("temperature", 1) <= 0
+    if not LLM_CACHE_ENABLED:
+        cache = False
+
+    model = kwargs["model"]
+    started = time.perf_counter()
+    try:
+        response, status = await _cached_create(timeout, cache, kwargs, hedge_delay)
+    except CircuitOpenError:
+        metrics.record(model, "circuit_open", time.perf_counter() - started)
+        raise
+    except Exception:
+        metrics.record(model, "error", time.perf_counter() - started)
+        raise
+    elapsed = time.perf_counter() - started
+    # 스트리밍이 아니면 응답 전체를 받은 시각이 첫 토큰을 받은 시각
+    metrics.record(model, status, elapsed, ttft=elapsed, usage=response.usage)
+    return response, status
+
+
+async def _cached_create(
+    timeout: Optional[float], cache: bool, kwargs: Dict[str, Any], hedge_delay: Optional[float] = None
+):
+    """캐시를 확인한 뒤 없으면 호출하고 (응답, 상태) 반환"""
+    if not cache:
+        _cache.record_bypass()
+        return await _hedged_create(timeout, kwargs, hedge_delay), "ok"
+
+    key = completion_cache_key(kwargs)
+    cached = await asyncio.to_thread(_cache.get, key)
+    if cached is not None:
+        return ChatCompletion.model_validate_json(cached), "cache_hit"
+    response = await _hedged_create(timeout, kwargs, hedge_delay)
+    await asyncio.to_thread(_cache.put, key, response.model_dump_json())
+    return response, "ok"
+
+
+async def _hedged_create(timeout: Optional[float], kwargs: Dict[str, Any], delay: Optional[float]):
+    """
+    delay초 안에 응답이 없으면 같은 요청을 한 번 더 보내고 먼저 성공한 응답 사용
+
+    느린 응답 하나가 뒤따르는 토론 턴을 모두 늦추는 꼬리 지연을 줄인다. 늦은 쪽은 취소한다.
+    """
+    if delay is None:
+        return await _create(timeout, kwargs)
+
+    model = kwargs["model"]
+    primary = asyncio.ensure_future(_create(timeout, kwargs))
+    hedge = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        metrics.inc("llm_hedged_requests_total", model=model, outcome="fired")
+        hedge = asyncio.ensure_future(_create(timeout, kwargs))
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    metrics.inc("llm_hedged_requests_total", model=model,
+                                outcome="hedge_won" if task is hedge else "primary_won")
+                    return task.result()
+        # 둘 다 실패하면 원래 요청의 오류를 그대로 전달
+        return primary.result()
+    finally:
+        for task in (primary, hedge):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+async def _refund(model: str, reserved: int):
+    """완료되지 못한 요청이 미리 차감한 토큰을 돌려줌 (취소 중에 불려 다시 취소돼도 끝까지 반영)"""
+    await asyncio.shield(_rate_limiter.settle(model, reserved, 0))
+
+
+async def _create(timeout: Optional[float], kwargs: Dict[str, Any]):
+    """한도를 확보하고 재시도하며 실제 API 호출"""
+    model = kwargs["model"]
+    reserved = estimate_request_tokens(
+        kwargs.get("messages", []), kwargs.get("max_tokens") or LLM_DEFAULT_COMPLETION_TOKENS
+    )
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        # 회로가 열려 있으면 한도를 확보하거나 기다리지 않고 바로 실패
+        probe = breaker.before_call(model)
+        acquired = False
+        try:
+            await _rate_limiter.acquire(model, reserved)
+            acquired = True
+            response = await get_client().chat.completions.create(
+                timeout=httpx.Timeout(timeout or LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                **kwargs
+            )
+        except RateLimitError as e:
+            # 429는 제공자 장애가 아니라 한도 문제이므로 회로 판단에 쓰지 않음
+            breaker.record(model, None, probe)
+            # 거절된 요청은 토큰을 쓰지 않았으므로 돌려줌
+            await _refund(model, reserved)
+            if e.code == "insufficient_quota" or attempt == LLM_MAX_RETRIES:
+                raise
+            retry_after = retry_after_seconds(e.response.headers)
+            if retry_after:
+                await _rate_limiter.block(model, retry_after)
+            await asyncio.sleep(max(retry_after or 0, _backoff(attempt)))
+            continue
+        except (APIConnectionError, APITimeoutError, InternalServerError):
+            breaker.record(model, False, probe)
+            # 실패한 요청의 추정치를 남겨 두면 장애 동안 재시도마다 버킷이 비어 처리량이 떨어짐
+            await _refund(model, reserved)
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            await asyncio.sleep(_backoff(attempt))
+            continue
+        except BaseException:
+            # 잘못된 요청(4xx)이나 헤징으로 취소된 호출
+            breaker.record(model, None, probe)
+            if acquired:
+                await _refund(model, reserved)
+            raise
+        breaker.record(model, True, probe)
+
+        # 스트리밍 응답은 usage가 없으므로 추정치를 그대로 둠
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            await _rate_limiter.settle(model, reserved, usage.total_tokens)
+        return response
+
+
+async def stream_chat_completion(
+    timeout: Optional[float] = None,
+    route: Optional[str] = None,
+    degraded: Optional[str] = None,
+    cache: bool = False,
+    **kwargs: Any
+) -> AsyncIterator[str]:
+    """
+    chat completion을 스트리밍으로 호출하고 본문 조각(delta)을 순서대로 반환
+
+    마지막 usage 청크를 요청해 토큰 사용량과 첫 토큰까지의 시간을 함께 기록한다.
+    route를 지정하면 chat_completion과 같이 모델을 고르되, 이미 내보낸 조각은 되돌릴 수 없으므로
+    첫 조각을 받기 전에 실패한 경우에만 다음 모델로 넘어간다. route에 hedge가 켜져 있으면
+    첫 청크까지의 시간(TTFT)을 기준으로 헤징한다.
+    cache면 chat_completion과 같은 응답 캐시를 사용하며, 적중하면 전체 내용을 조각 하나로 보낸다.
+
+    Args:
+        timeout (float): 스트림 전체에 적용할 타임아웃(초). 없으면 LLM_TIMEOUT
+        route (str): 호출 종류 (chat_completion 참고)
+        degraded (str): 회로가 열려 호출할 수 없을 때 조각 하나로 대신 보낼 내용
+        cache (bool): 응답 캐시 사용 여부
+        **kwargs: chat.completions.create에 그대로 전달할 인자 (stream 제외)
+    """
+    cache = cache and LLM_CACHE_ENABLED
+    received = False
+    try:
+        async for delta in _routed_stream(timeout, route, cache, kwargs) if route else _stream(timeout, cache, kwargs):
+            received = True
+            yield delta
+    except CircuitOpenError as e:
+        if degraded is None or received:
+            raise
+        yield _degraded_response(e.model, degraded).choices[0].message.content
+
+
+async def _routed_stream(
+    timeout: Optional[float], route: str, cache: bool, kwargs: Dict[str, Any]
+) -> AsyncIterator[str]:
+    models, prompt_tokens = _route_models(route, kwargs)
+    for index, model in enumerate(models):
+        started = time.perf_counter()
+        received = False
+        result: Dict[str, str] = {}
+        try:
+            hedge_delay = router.hedge_delay(route, model, prompt_tokens)
+            async for delta in _stream(timeout, cache, {**kwargs, "model": model}, result, hedge_delay):
+                received = True
+                yield delta
+        except FALLBACK_ERRORS as e:
+            router.observe(route, model, time.perf_counter() - started, prompt_tokens, ok=False)
+            if received or index == len(models) - 1:
+                raise
+            _fallback(route, model, e)
+            continue
+        # 캐시 적중은 모델 지연이 아니므로 관측하지 않음
+        if result.get("status") == "ok":
+            router.observe(route, model, time.perf_counter() - started, prompt_tokens, ok=True)
+        return
+
+
+async def _open_stream(timeout: Optional[float], kwargs: Dict[str, Any]):
+    """스트림을 열고 첫 청크까지 받아 (스트림, 청크 이터레이터, 첫 청크) 반환 - 첫 청크 전에 중단되면 스트림을 닫음"""
+    stream = await _create(timeout, {**kwargs, "stream": True, "stream_options": {"include_usage": True}})
+    chunks = stream.__aiter__()
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except BaseException:
+        await stream.close()
+        raise
+    return stream, chunks, first
+
+
+async def _hedged_open_stream(timeout: Optional[float], kwargs: Dict[str, Any], delay: Optional[float]):
+    """
+    delay초 안에 첫 청크가 오지 않으면 같은 스트림을 하나 더 열고, 첫 청크가 먼저 온 쪽을 사용
+
+    _hedged_create와 같은 방식이지만 응답 전체가 아니라 첫 청크까지의 시간(TTFT)을 기준으로 한다.
+    진 쪽은 취소하고, 거의 동시에 열려 이미 첫 청크를 받은 스트림은 닫는다.
+    """
+    if delay is None:
+        return await _open_stream(timeout, kwargs)
+
+    model = kwargs["model"]
+    primary = asyncio.ensure_future(_open_stream(timeout, kwargs))
+    hedge = winner = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            winner = primary
+            return primary.result()
+
+        metrics.inc("llm_hedged_requests_total", model=model, outcome="fired")
+        hedge = asyncio.ensure_future(_open_stream(timeout, kwargs))
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    metrics.inc("llm_hedged_requests_total", model=model,
+                                outcome="hedge_won" if task is hedge else "primary_won")
+                    return task.result()
+        # 둘 다 실패하면 원래 요청의 오류를 그대로 전달
+        return primary.result()
+    finally:
+        for task in (primary, hedge):
+            if task is None or task is winner:
+                continue
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled() and task.exception() is None:
+                await task.result()[0].close()
+
+
+async def _stream(
+    timeout: Optional[float],
+    cache: bool,
+    kwargs: Dict[str, Any],
+    result: Optional[Dict[str, str]] = None,
+    hedge_delay: Optional[float] = None
+) -> AsyncIterator[str]:
+    """스트리밍 호출 한 번 (result가 주어지면 최종 상태를 기록)"""
+    model = kwargs["model"]
+    started = time.perf_counter()
+    ttft = usage = None
+    status = "error"
+    key = completion_cache_key(kwargs) if cache else None
+    try:
+        cached = await asyncio.to_thread(_cache.get, key) if key else None
+        if cached is not None:
+            status = "cache_hit"
+            ttft = time.perf_counter() - started
+            yield ChatCompletion.model_validate_json(cached).choices[0].message.content
+            return
+        if not cache:
+            _cache.record_bypass()
+
+        stream, chunks, first_chunk = await _hedged_open_stream(timeout, kwargs, hedge_delay)
+        parts = []
+        first = finish_reason = None
+        try:
+            async for chunk in _prepend(first_chunk, chunks):
+                first = first or chunk
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                # usage만 담긴 마지막 청크는 choices가 비어 있음
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            status = "ok"
+        finally:
+            await stream.close()
+
+        if key and first is not None:
+            # 스트림을 모은 응답을 chat_completion의 캐시 항목과 같은 형식으로 저장
+            response = ChatCompletion.model_validate({
+                "id": first.id,
+                "object": "chat.completion",
+                "created": first.created,
+                "model": first.model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(parts)},
+                    "finish_reason": finish_reason or "stop"
+                }],
+                "usage": usage.model_dump() if usage is not None else None,
+            })
+            await asyncio.to_thread(_cache.put, key, response.model_dump_json())
+    except CircuitOpenError:
+        status = "circuit_open"
+        raise
+    finally:
+        if result is not None:
+            result["status"] = status
+        metrics.record(model, status, time.perf_counter() - started, ttft=ttft, usage=usage)
+
+
+async def _prepend(first: Any, chunks: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    if first is not None:
+        yield first
+    async for chunk in chunks:
+        yield chunk
+
+
+def cache_stats() -> Dict:
+    """응답 캐시 적중률 (메모리/디스크 적중, 미스, 캐시를 건너뛴 호출 수)"""
+    return _cache.stats()
+
+
+def render_metrics() -> str:
+    """/metrics 응답 - LLM 호출 지표, 캐시 통계, 라우팅/회로 상태"""
+    for route, models in router.stats().items():
+        for model, stat in models.items():
+            metrics.set_gauge("llm_route_degraded", int(stat["degraded"]), route=route, model=model)
+            if stat["p95"] is not None:
+                metrics.set_gauge("llm_route_latency_p95_seconds", stat["p95"], route=route, model=model)
+    for model, state in breaker.stats().items():
+        metrics.set_gauge("llm_circuit_open", int(state != "closed"), model=model)
+    return metrics.render({
+        f"llm_cache_{name}": value for name, value in cache_stats().items()
+    })
+
+
+async def close_client():
+    """앱 종료 시 연결 풀과 캐시 정리"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+    _cache.close()
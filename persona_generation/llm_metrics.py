@@ -0,0 +1,243 @@
+import bisect
+import contextlib
+import contextvars
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# 모델별 100만 토큰당 가격(USD) - LLM_PRICES로 덮어쓸 수 있음
+# 예) {"gpt-4o": {"input": 2.5, "cached_input": 1.25, "output": 10}}
+MODEL_PRICES: Dict[str, Dict[str, float]] = {
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    **json.loads(os.getenv("LLM_PRICES", "{}")),
+}
+# 설정하면 호출마다 태그와 사용량을 JSON 한 줄로 기록 (방/페르소나 단위 집계용)
+LLM_CALL_LOG = os.getenv("LLM_CALL_LOG")
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+RATIO_BUCKETS = (0, 0.1, 0.25, 0.5, 0.75, 0.9, 1)
+# Prometheus 라벨로 쓰는 태그 (room/persona는 값이 계속 늘어나므로 호출 로그에만 남김)
+LABELS = ("endpoint", "model")
+
+# 호출 로그는 큐에 넣고 별도 스레드(QueueListener)에서 파일에 씀 - 이벤트 루프에서 파일 I/O를 하지 않음
+_call_log = logging.getLogger("llm_calls")
+_call_log.propagate = False
+if LLM_CALL_LOG:
+    _call_log.setLevel(logging.INFO)
+    _call_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _call_log.addHandler(logging.handlers.QueueHandler(_call_log_queue))
+    _call_log_file = logging.FileHandler(LLM_CALL_LOG, encoding="utf-8")
+    _call_log_file.setFormatter(logging.Formatter("%(message)s"))
+    _call_log_listener = logging.handlers.QueueListener(_call_log_queue, _call_log_file)
+    _call_log_listener.start()
+    # 종료 시 큐에 남은 기록을 파일에 씀
+    atexit.register(_call_log_listener.stop)
+
+_tags: contextvars.ContextVar[Dict[str, str]] = contextvars.ContextVar("llm_tags", default={})
+
+
+@contextlib.contextmanager
+def llm_tags(**tags: Any) -> Iterator[None]:
+    """
+    이 블록 안에서 실행되는 LLM 호출에 태그(endpoint, room, persona 등)를 붙임
+
+    contextvars를 사용하므로 같은 태스크 안에서 호출되는 generate_persona 같은
+    하위 함수까지 인자를 넘기지 않아도 태그가 전달되고, 블록을 나가면 이전 태그로 돌아간다.
+    """
+    token = _tags.set({**_tags.get(), **{key: str(value) for key, value in tags.items() if value is not None}})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def current_tags() -> Dict[str, str]:
+    return dict(_tags.get())
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class LLMMetrics:
+    def __init__(self):
+        """
+        LLM 호출별 토큰/지연/비용 지표 (Prometheus 텍스트 형식으로 내보냄)
+
+        카운터와 히스토그램은 (endpoint, model) 라벨 조합마다 따로 누적한다.
+        """
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[Tuple, float]] = {}
+        self.histograms: Dict[str, Dict[Tuple, Histogram]] = {}
+        self.gauges: Dict[str, Dict[Tuple, float]] = {}
+        # 기본 라벨(LABELS)과 다른 라벨을 쓰는 지표의 라벨 이름
+        self.label_names: Dict[str, Tuple[str, ...]] = {"llm_requests_total": LABELS + ("status",)}
+
+    def _inc(self, name: str, labels: Tuple, value: float = 1):
+        series = self.counters.setdefault(name, {})
+        series[labels] = series.get(labels, 0) + value
+
+    def _observe(self, name: str, labels: Tuple, value: float, buckets: Tuple[float, ...]):
+        series = self.histograms.setdefault(name, {})
+        if labels not in series:
+            series[labels] = Histogram(buckets)
+        series[labels].observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: Any):
+        """라우팅/헤징 등 호출 경로의 다른 지표용 카운터 (라벨은 키워드 인자)"""
+        with self._lock:
+            self.label_names[name] = tuple(labels)
+            self._inc(name, tuple(str(v) for v in labels.values()), value)
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels: Any):
+        with self._lock:
+            self.label_names[name] = tuple(labels)
+            self._observe(name, tuple(str(v) for v in labels.values()), value, buckets)
+
+    def set_gauge(self, name: str, value: float, **labels: Any):
+        with self._lock:
+            self.label_names[name] = tuple(labels)
+            self.gauges.setdefault(name, {})[tuple(str(v) for v in labels.values())] = value
+
+    def record(
+        self,
+        model: str,
+        status: str,
+        latency: float,
+        ttft: Optional[float] = None,
+        usage: Any = None
+    ):
+        """
+        호출 한 번의 결과 기록
+
+        Args:
+            model (str): 호출한 모델
+            status (str): ok | cache_hit | error | circuit_open
+            latency (float): 호출 전체 소요 시간(초, 한도 대기와 재시도 포함)
+            ttft (float): 첫 토큰까지의 시간(초). 스트리밍이 아니면 응답을 받은 시각
+            usage: 응답의 usage (없으면 토큰/비용은 기록하지 않음)
+        """
+        tags = current_tags()
+        labels = (tags.get("endpoint", ""), model)
+        prompt = completion = cached = 0
+        cost = 0.0
+        if usage is not None and status == "ok":
+            prompt = usage.prompt_tokens or 0
+            completion = usage.completion_tokens or 0
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+            cost = estimate_cost(model, prompt, completion, cached)
+
+        with self._lock:
+            self._inc("llm_requests_total", labels + (status,))
+            self._observe("llm_request_latency_seconds", labels, latency, LATENCY_BUCKETS)
+            if ttft is not None:
+                self._observe("llm_time_to_first_token_seconds", labels, ttft, LATENCY_BUCKETS)
+            if usage is not None and status == "ok":
+                self._inc("llm_prompt_tokens_total", labels, prompt)
+                self._inc("llm_completion_tokens_total", labels, completion)
+                self._inc("llm_cached_prompt_tokens_total", labels, cached)
+                self._inc("llm_cost_usd_total", labels, cost)
+                self._observe("llm_prompt_tokens", labels, prompt, TOKEN_BUCKETS)
+                self._observe("llm_completion_tokens", labels, completion, TOKEN_BUCKETS)
+                # 프롬프트 중 제공자 측 프롬프트 캐시에서 처리된 비율
+                if prompt:
+                    self._observe("llm_cached_prompt_ratio", labels, cached / prompt, RATIO_BUCKETS)
+
+        if LLM_CALL_LOG:
+            record = {
+                "ts": time.time(), **tags, "model": model, "status": status,
+                "latency": round(latency, 4), "ttft": None if ttft is None else round(ttft, 4),
+                "prompt_tokens": prompt, "completion_tokens": completion, "cached_tokens": cached,
+                "cached_ratio": round(cached / prompt, 4) if prompt else None,
+                "cost_usd": round(cost, 6),
+            }
+            _call_log.info(json.dumps(record, ensure_ascii=False))
+
+    def cached_ratio(self) -> Dict[str, float]:
+        """endpoint별 누적 캐시 토큰 비율 (cached / prompt)"""
+        with self._lock:
+            prompt = self.counters.get("llm_prompt_tokens_total", {})
+            cached = self.counters.get("llm_cached_prompt_tokens_total", {})
+            totals: Dict[str, List[float]] = {}
+            for labels, value in prompt.items():
+                total = totals.setdefault(labels[0], [0.0, 0.0])
+                total[0] += cached.get(labels, 0)
+                total[1] += value
+        return {endpoint: c / p if p else 0.0 for endpoint, (c, p) in totals.items()}
+
+    def render(self, extra: Optional[Dict[str, float]] = None) -> str:
+        """Prometheus 텍스트 형식 (extra는 라벨 없는 게이지로 추가)"""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                names = self.label_names.get(name, LABELS)
+                for labels, value in series.items():
+                    lines.append(f"{name}{{{_format_labels(names, labels)}}} {value:g}")
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in series.items():
+                    label_text = _format_labels(self.label_names.get(name, LABELS), labels)
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f'{name}_bucket{{{label_text},le="{le}"}} {cumulative}')
+                    lines.append(f"{name}_sum{{{label_text}}} {histogram.total:g}")
+                    lines.append(f"{name}_count{{{label_text}}} {histogram.count}")
+            for name, series in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in series.items():
+                    lines.append(f"{name}{{{_format_labels(self.label_names[name], labels)}}} {value:g}")
+        ratios = self.cached_ratio()
+        if ratios:
+            lines.append("# TYPE llm_cached_prompt_token_ratio gauge")
+            for endpoint, ratio in sorted(ratios.items()):
+                lines.append(f"llm_cached_prompt_token_ratio{{{_format_labels(('endpoint',), (endpoint,))}}} {ratio:g}")
+        for name, value in (extra or {}).items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple) -> str:
+    def escape(value: Any) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+def estimate_cost(model: str, prompt: int, completion: int, cached: int = 0) -> float:
+    """토큰 사용량의 예상 비용(USD) - 가격표에 없는 모델은 0"""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        # gpt-4o-2024-08-06 처럼 날짜가 붙은 모델명은 가장 길게 일치하는 이름의 가격 사용
+        matches = [name for name in MODEL_PRICES if model.startswith(name + "-")]
+        if not matches:
+            return 0.0
+        prices = MODEL_PRICES[max(matches, key=len)]
+    return (
+        (prompt - cached) * prices["input"]
+        + cached * prices.get("cached_input", prices["input"])
+        + completion * prices["output"]
+    ) / 1_000_000
+
+
+metrics = LLMMetrics()
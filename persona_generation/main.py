@@ -1,16 +1,37 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
-import uuid
+from typing import Awaitable, Callable, Optional, List
+import asyncio
+import contextlib
+import os
 from wiki import WikipediaPersonSearch
-from gpt_generator import generate_persona
+from wiki_cache import WikiCache
+from wiki_dump import WikiDumpIndex
+from gpt_generator import generate_persona, persona_cache_key, stream_persona
+from job_queue import PersonaJobQueue
+from llm_client import close_client, render_metrics
+from llm_metrics import llm_tags
+from persona_store import PERSONA_KEYS_DDL, find_persona_by_key, insert_persona
+from single_flight import SingleFlight, pg_advisory_lock
 import psycopg2
-from psycopg2.extras import DictCursor
 from typing import Dict
 import json
 
 app = FastAPI()
 
+# 요청 간 keep-alive 연결을 재사용하도록 모듈 단위로 공유
+# WIKI_DUMP_PATH가 설정되어 있으면 오프라인 덤프 색인에서 조회
+WIKI_DUMP_PATH = os.getenv("WIKI_DUMP_PATH")
+wiki_search = WikipediaPersonSearch(
+    cache=WikiCache(),
+    dump=WikiDumpIndex(WIKI_DUMP_PATH) if WIKI_DUMP_PATH else None
+)
+
+# 같은 persona 생성 요청을 하나로 합침 (PERSONA_ADVISORY_LOCK=1이면 워커 간에도 DB 잠금으로 합침)
+persona_flights = SingleFlight()
+PERSONA_ADVISORY_LOCK = os.getenv("PERSONA_ADVISORY_LOCK", "0") == "1"
+
 # Database configuration
 DATABASE_CONFIG = {
     "dbname": "postgres",
@@ -23,130 +44,266 @@ DATABASE_CONFIG = {
 # Pydantic models for request/response
 class PersonaRequest(BaseModel):
     name: str
+    # True면 작업 큐에 넣고 job id를 바로 반환
+    background: bool = False
+    # True면 같은 위키 데이터로 생성된 persona가 있어도 다시 생성
+    force: bool = False
+
+class PersonaBatchRequest(BaseModel):
+    names: List[str]
+    # 단계별 동시 실행 개수 (위키 조회 / GPT 생성 / DB 저장)
+    wiki_concurrency: int = 8
+    gpt_concurrency: int = 4
+    db_concurrency: int = 2
+    force: bool = False
 
 def get_db_connection():
     return psycopg2.connect(**DATABASE_CONFIG)
 
-async def insert_persona_data(persona_data: Dict, wiki_data: Dict) -> str:
-    person_id = str(uuid.uuid4())
-    
-    with get_db_connection() as conn:
+async def insert_persona_data(persona_data: Dict, wiki_data: Dict, dedupe_key: Optional[str] = None) -> str:
+    # psycopg2 호출이 이벤트 루프를 막지 않도록 스레드에서 실행
+    return await asyncio.to_thread(save_persona_data, persona_data, wiki_data, dedupe_key)
+
+def save_persona_data(persona_data: Dict, wiki_data: Dict, dedupe_key: Optional[str] = None) -> str:
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            person_id = insert_persona(cur, persona_data, wiki_data, dedupe_key)
+        conn.commit()
+        return person_id
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+def get_generated_persona(dedupe_key: str) -> Optional[str]:
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            return find_persona_by_key(cur, dedupe_key)
+    finally:
+        conn.close()
+
+async def find_generated_persona(dedupe_key: str) -> Optional[str]:
+    """같은 위키 데이터와 프롬프트로 이미 생성된 persona의 person_id 조회"""
+    return await asyncio.to_thread(get_generated_persona, dedupe_key)
+
+def ensure_persona_schema():
+    conn = get_db_connection()
+    try:
         with conn.cursor() as cur:
-            try:
-                # Begin transaction
-                cur.execute("BEGIN")
-                
-                # 1. Insert basic info
-                cur.execute("""
-                    INSERT INTO basic_info (person_id, name, birth_death, era, nationality, gender, image_url)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    person_id,
-                    persona_data["basic_info"]["name"],
-                    persona_data["basic_info"]["birth_death"],
-                    persona_data["basic_info"]["era"],
-                    persona_data["basic_info"]["nationality"],
-                    persona_data["basic_info"]["gender"],
-                    wiki_data.get("basic_info", {}).get("image_url")
-                ))
-
-                # 2. Insert professional info
-                cur.execute("""
-                    INSERT INTO professional_info (person_id, primary_occupation)
-                    VALUES (%s, %s)
-                """, (person_id, persona_data["professional"]["primary_occupation"]))
-
-                # 3. Insert other roles
-                for role in persona_data["professional"]["other_roles"]:
-                    cur.execute("""
-                        INSERT INTO other_roles (person_id, role_name)
-                        VALUES (%s, %s)
-                    """, (person_id, role))
-
-                # 4. Insert major achievements
-                for achievement in persona_data["professional"]["major_achievements"]:
-                    cur.execute("""
-                        INSERT INTO major_achievements (person_id, achievement_name)
-                        VALUES (%s, %s)
-                    """, (person_id, achievement))
-
-                # 5. Insert personal info
-                cur.execute("""
-                    INSERT INTO personal_info (person_id, education, background)
-                    VALUES (%s, %s, %s)
-                """, (
-                    person_id,
-                    persona_data["personal"]["education"],
-                    persona_data["personal"]["background"]
-                ))
-
-                # 6. Insert personality traits
-                for trait in persona_data["personal"]["personality_traits"]:
-                    cur.execute("""
-                        INSERT INTO personality_traits (person_id, trait_name)
-                        VALUES (%s, %s)
-                    """, (person_id, trait))
-
-                # 7. Insert influences
-                for influence in persona_data["personal"]["influences"]:
-                    cur.execute("""
-                        INSERT INTO influences (person_id, influence_name)
-                        VALUES (%s, %s)
-                    """, (person_id, influence))
-
-                # 8. Insert legacy
-                cur.execute("""
-                    INSERT INTO legacy (person_id, impact, modern_significance)
-                    VALUES (%s, %s, %s)
-                """, (
-                    person_id,
-                    persona_data["legacy"]["impact"],
-                    persona_data["legacy"]["modern_significance"]
-                ))
-
-                # 9. Insert historical context
-                cur.execute("""
-                    INSERT INTO historical_context (person_id, period_background)
-                    VALUES (%s, %s)
-                """, (
-                    person_id,
-                    persona_data["historical_context"]["period_background"]
-                ))
-
-                # 10. Insert key events
-                for event in persona_data["historical_context"]["key_events"]:
-                    cur.execute("""
-                        INSERT INTO key_events (person_id, event_description)
-                        VALUES (%s, %s)
-                    """, (person_id, event))
-
-                # Commit transaction
-                conn.commit()
-                return person_id
-
-            except Exception as e:
-                conn.rollback()
-                raise e
+            cur.execute(PERSONA_KEYS_DDL)
+        conn.commit()
+    finally:
+        conn.close()
+
+@app.on_event("startup")
+async def start_job_workers():
+    await asyncio.to_thread(ensure_persona_schema)
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_resources():
+    await job_queue.stop()
+    await wiki_search.aclose()
+    wiki_search.cache.close()
+    await close_client()
 
 @app.post("/persona_generator")
 async def create_persona(request: PersonaRequest):
+    if request.background:
+        job_id = await job_queue.enqueue(request.name, force=request.force)
+        return {"status": "queued", "job_id": job_id}
+
     try:
-        # 1. Wikipedia에서 데이터 가져오기
-        wiki_search = WikipediaPersonSearch()
-        wiki_data = wiki_search.search_person(request.name, summary_only=False)
-        
-        if not wiki_data:
-            raise HTTPException(status_code=404, detail="Person not found in Wikipedia")
+        # 같은 이름으로 동시에 들어온 요청은 위키 조회/GPT 생성/저장을 한 번만 실행
+        key = (" ".join(request.name.split()).casefold(), request.force)
+        result = await persona_flights.do(key, lambda: build_persona(request.name, request.force))
+        return dict(result)
 
-        # 2. GPT를 통해 persona 생성
-        persona_data = await generate_persona(wiki_data)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def persona_generation_lock(dedupe_key: str):
+    """PERSONA_ADVISORY_LOCK이면 다른 워커와 같은 persona를 동시에 생성하지 않도록 DB 잠금"""
+    if PERSONA_ADVISORY_LOCK:
+        return pg_advisory_lock(get_db_connection, f"persona:{dedupe_key}")
+    return contextlib.nullcontext()
+
+async def build_persona(name: str, force: bool) -> Dict:
+    # 1. Wikipedia에서 데이터 가져오기
+    wiki_data = await wiki_search.search_person(name, summary_only=False)
+    
+    if not wiki_data:
+        raise HTTPException(status_code=404, detail="Person not found in Wikipedia")
+
+    dedupe_key = persona_cache_key(wiki_data)
+    async with persona_generation_lock(dedupe_key):
+        # 2. 같은 위키 데이터로 생성된 persona가 있으면 재사용
+        # (잠금을 기다리는 동안 다른 워커가 저장했을 수 있으므로 잠금 안에서 확인)
+        if not force:
+            person_id = await find_generated_persona(dedupe_key)
+            if person_id:
+                return {"status": "success", "person_id": person_id, "cached": True}
+
+        # 3. GPT를 통해 persona 생성
+        with llm_tags(endpoint="persona_generator", persona=name):
+            persona_data = await generate_persona(wiki_data)
         print(persona_data)
-        # 3. DB에 데이터 저장
-        person_id = await insert_persona_data(persona_data, wiki_data)
-        return {"status": "success", "person_id": person_id}
+        # 4. DB에 데이터 저장
+        person_id = await insert_persona_data(persona_data, wiki_data, dedupe_key)
+        return {"status": "success", "person_id": person_id, "cached": False}
+
+def sse_event(event: str, data: Dict) -> str:
+    """Server-Sent Events 형식의 이벤트 한 개"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/persona_generator/stream")
+async def stream_persona_generation(request: PersonaRequest):
+    """
+    persona를 생성하면서 완성된 최상위 섹션을 SSE로 바로 전송
+
+    이벤트 순서: section(섹션마다) -> done(person_id 포함)
+    같은 위키 데이터로 생성된 persona가 있으면 section 없이 done(cached=true)만 보낸다.
+    실패하면 error 이벤트를 보내고 스트림을 닫는다.
+    """
+    wiki_data = await wiki_search.search_person(request.name, summary_only=False)
+    if not wiki_data:
+        raise HTTPException(status_code=404, detail="Person not found in Wikipedia")
+
+    dedupe_key = persona_cache_key(wiki_data)
+
+    async def events():
+        try:
+            if not request.force:
+                person_id = await find_generated_persona(dedupe_key)
+                if person_id:
+                    yield sse_event("done", {"status": "success", "person_id": person_id, "cached": True})
+                    return
+
+            persona_data = {}
+            with llm_tags(endpoint="persona_generator_stream", persona=request.name):
+                async for section, value in stream_persona(wiki_data):
+                    persona_data[section] = value
+                    yield sse_event("section", {"section": section, "data": value})
+
+            person_id = await insert_persona_data(persona_data, wiki_data, dedupe_key)
+            yield sse_event("done", {"status": "success", "person_id": person_id, "cached": False})
+        except Exception as e:
+            yield sse_event("error", {"status": "error", "detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # 프록시가 이벤트를 모아서 보내지 않도록 버퍼링 해제
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def run_persona_pipeline(
+    name: str,
+    stages: Dict[str, asyncio.Semaphore],
+    on_stage: Optional[Callable[[str], Awaitable[None]]] = None,
+    force: bool = False
+) -> Dict:
+    """
+    한 인물에 대해 위키 조회 -> GPT 생성 -> DB 저장을 실행
+
+    단계마다 별도의 세마포어를 잡으므로, 한 인물이 GPT 단계에 있는 동안
+    다른 인물의 위키 조회와 DB 저장이 함께 진행된다.
+    on_stage가 주어지면 각 단계를 시작할 때 단계 이름으로 호출한다.
+    force가 아니면 같은 위키 데이터로 이미 생성된 persona를 그대로 반환한다.
+    """
+    async def enter(next_stage: str):
+        nonlocal stage
+        stage = next_stage
+        if on_stage:
+            await on_stage(stage)
+
+    stage = "wiki"
+    try:
+        await enter("wiki")
+        async with stages["wiki"]:
+            wiki_data = await wiki_search.search_person(name, summary_only=False)
+        if not wiki_data:
+            return {"name": name, "status": "not_found", "stage": stage}
+
+        dedupe_key = persona_cache_key(wiki_data)
+        if not force:
+            await enter("dedupe")
+            async with stages["db"]:
+                person_id = await find_generated_persona(dedupe_key)
+            if person_id:
+                return {"name": name, "status": "success", "person_id": person_id, "cached": True}
+
+        await enter("gpt")
+        async with stages["gpt"]:
+            with llm_tags(persona=name):
+                persona_data = await generate_persona(wiki_data)
+
+        await enter("db")
+        async with stages["db"]:
+            person_id = await insert_persona_data(persona_data, wiki_data, dedupe_key)
+        return {"name": name, "status": "success", "person_id": person_id, "cached": False}
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return {"name": name, "status": "error", "stage": stage, "detail": str(e)}
+
+@app.post("/persona_generator/batch")
+async def create_persona_batch(request: PersonaBatchRequest):
+    """여러 인물의 persona를 파이프라인으로 생성하고, 끝나는 순서대로 NDJSON으로 스트리밍"""
+    stages = {
+        "wiki": asyncio.Semaphore(max(1, request.wiki_concurrency)),
+        "gpt": asyncio.Semaphore(max(1, request.gpt_concurrency)),
+        "db": asyncio.Semaphore(max(1, request.db_concurrency)),
+    }
+
+    async def stream_results():
+        # 태스크는 생성 시점의 컨텍스트(태그)를 복사해 가짐
+        with llm_tags(endpoint="persona_generator_batch"):
+            tasks = [
+                asyncio.create_task(run_persona_pipeline(name, stages, force=request.force))
+                for name in request.names
+            ]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                result = await completed
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            # 클라이언트가 연결을 끊으면 남은 작업 취소
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+# 백그라운드 작업 큐 워커가 공유하는 단계별 동시 실행 제한
+JOB_STAGES = {
+    "wiki": asyncio.Semaphore(8),
+    "gpt": asyncio.Semaphore(4),
+    "db": asyncio.Semaphore(2),
+}
+
+async def run_persona_job(name: str, progress: Callable[[str], Awaitable[None]], force: bool = False) -> Dict:
+    with llm_tags(endpoint="persona_generator_job"):
+        result = await run_persona_pipeline(name, JOB_STAGES, on_stage=progress, force=force)
+    if result["status"] != "success":
+        raise RuntimeError(f"{result['stage']}: {result.get('detail', result['status'])}")
+    return result
+
+job_queue = PersonaJobQueue(run_persona_job, workers=int(os.getenv("PERSONA_JOB_WORKERS", "4")))
+
+@app.get("/metrics")
+async def get_metrics():
+    """LLM 호출 지표 (Prometheus 텍스트 형식)"""
+    return PlainTextResponse(render_metrics())
+
+@app.get("/persona_generator/jobs/{job_id}")
+async def get_persona_job(job_id: str):
+    """백그라운드 persona 생성 작업의 상태/진행 단계/결과 조회"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,250 @@
+"""
+카탈로그 초기 적재용 오프라인 persona 일괄 생성 (OpenAI Batch API)
+
+대화형 응답 시간이 필요 없는 대량 생성은 Batch API로 보내 비용을 줄이고,
+서비스가 쓰는 RPM/TPM 한도(rate_limiter)를 차지하지 않도록 한다.
+작업 디렉토리에 단계별 파일을 남기므로 각 단계를 따로 다시 실행할 수 있다.
+
+    python persona_batch.py prepare names.txt work/     # 위키 조회 후 requests.jsonl 작성
+    python persona_batch.py submit work/                # 파일 업로드 및 batch 생성
+    python persona_batch.py poll work/                  # 완료될 때까지 대기 후 results.jsonl 저장
+    python persona_batch.py ingest work/                # insert_persona_data로 저장
+    python persona_batch.py run names.txt work/         # 위 단계를 모두 실행
+
+    python persona_batch.py submit work/ --replay results.jsonl
+        API를 호출하지 않고 결과 파일을 그대로 재생 (테스트용)
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from gpt_generator import build_persona_request, parse_persona_content, persona_cache_key
+from llm_client import close_client, get_client
+from llm_metrics import estimate_cost
+from main import find_generated_persona, insert_persona_data, wiki_search
+from model_router import ROUTES
+
+REQUESTS_FILE = "requests.jsonl"
+MANIFEST_FILE = "manifest.jsonl"
+BATCH_FILE = "batch.json"
+RESULTS_FILE = "results.jsonl"
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+# Batch API 요금은 일반 호출의 절반
+BATCH_PRICE_RATIO = float(os.getenv("PERSONA_BATCH_PRICE_RATIO", "0.5"))
+# 더 이상 상태가 바뀌지 않는 batch 상태
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def _read_jsonl(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _write_jsonl(path: str, rows: List[Dict[str, Any]]):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+class OpenAIBatchBackend:
+    """OpenAI Files/Batches API로 요청 파일을 보내고 결과 파일을 받음"""
+
+    async def submit(self, requests_path: str) -> str:
+        client = get_client()
+        with open(requests_path, "rb") as f:
+            uploaded = await client.files.create(file=f, purpose="batch")
+        batch = await client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW,
+            metadata={"purpose": "persona_catalog"}
+        )
+        return batch.id
+
+    async def status(self, batch_id: str) -> Dict[str, Any]:
+        batch = await get_client().batches.retrieve(batch_id)
+        return {
+            "status": batch.status,
+            "output_file_id": batch.output_file_id,
+            "error_file_id": batch.error_file_id,
+            "request_counts": batch.request_counts.model_dump() if batch.request_counts else None,
+        }
+
+    async def results(self, batch: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # 실패한 요청은 error 파일에 따로 담겨 옴
+        rows: List[Dict[str, Any]] = []
+        for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+            if file_id:
+                content = await get_client().files.content(file_id)
+                rows.extend(json.loads(line) for line in content.text.splitlines() if line.strip())
+        return rows
+
+
+class ReplayBatchBackend:
+    def __init__(self, results_path: str):
+        """
+        API를 호출하지 않고 Batch API 출력 형식의 결과 파일을 재생하는 대체 백엔드
+
+        submit은 바로 완료된 batch를 만들고, results는 results_path의 줄을 그대로 돌려준다.
+        """
+        self.results_path = results_path
+
+    async def submit(self, requests_path: str) -> str:
+        return f"replay_{uuid.uuid4().hex}"
+
+    async def status(self, batch_id: str) -> Dict[str, Any]:
+        return {"status": "completed", "output_file_id": None, "error_file_id": None, "request_counts": None}
+
+    async def results(self, batch: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return _read_jsonl(self.results_path)
+
+
+def load_backend(work_dir: str) -> Any:
+    """submit 때 저장한 설정으로 같은 백엔드 생성"""
+    with open(os.path.join(work_dir, BATCH_FILE), encoding="utf-8") as f:
+        batch = json.load(f)
+    if batch.get("replay"):
+        return ReplayBatchBackend(batch["replay"])
+    return OpenAIBatchBackend()
+
+
+async def prepare(names: List[str], work_dir: str, model: Optional[str] = None, force: bool = False) -> Dict[str, int]:
+    """
+    위키 데이터를 조회해 Batch API 요청 파일과 결과 저장에 쓸 manifest 작성
+
+    force가 아니면 같은 위키 데이터로 이미 생성된 persona는 요청에 넣지 않는다.
+    """
+    model = model or ROUTES["persona_generation"]["models"][0]
+    os.makedirs(work_dir, exist_ok=True)
+    requests: List[Dict[str, Any]] = []
+    manifest: List[Dict[str, Any]] = []
+    counts = {"requested": 0, "not_found": 0, "existing": 0}
+
+    for name in dict.fromkeys(" ".join(name.split()) for name in names if name.strip()):
+        wiki_data = await wiki_search.search_person(name, summary_only=False)
+        if not wiki_data:
+            print(f"위키 정보 없음: {name}")
+            counts["not_found"] += 1
+            continue
+        dedupe_key = persona_cache_key(wiki_data)
+        if not force and await find_generated_persona(dedupe_key):
+            counts["existing"] += 1
+            continue
+
+        custom_id = f"persona-{len(requests)}-{dedupe_key[:16]}"
+        requests.append({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": build_persona_request(wiki_data, model)
+        })
+        manifest.append({"custom_id": custom_id, "name": name, "dedupe_key": dedupe_key, "wiki_data": wiki_data})
+        counts["requested"] += 1
+
+    _write_jsonl(os.path.join(work_dir, REQUESTS_FILE), requests)
+    _write_jsonl(os.path.join(work_dir, MANIFEST_FILE), manifest)
+    return counts
+
+
+async def submit(work_dir: str, replay: Optional[str] = None) -> str:
+    backend = ReplayBatchBackend(replay) if replay else OpenAIBatchBackend()
+    batch_id = await backend.submit(os.path.join(work_dir, REQUESTS_FILE))
+    with open(os.path.join(work_dir, BATCH_FILE), "w", encoding="utf-8") as f:
+        json.dump({"batch_id": batch_id, "replay": replay, "submitted_at": time.time()}, f)
+    return batch_id
+
+
+async def poll(work_dir: str, interval: float = 60) -> Dict[str, Any]:
+    """batch가 끝날 때까지 interval초마다 상태를 확인하고, 결과를 results.jsonl로 저장"""
+    backend = load_backend(work_dir)
+    with open(os.path.join(work_dir, BATCH_FILE), encoding="utf-8") as f:
+        batch_id = json.load(f)["batch_id"]
+
+    while True:
+        batch = await backend.status(batch_id)
+        print(f"{batch_id}: {batch['status']} {batch['request_counts'] or ''}")
+        if batch["status"] in FINAL_STATUSES:
+            break
+        await asyncio.sleep(interval)
+
+    _write_jsonl(os.path.join(work_dir, RESULTS_FILE), await backend.results(batch))
+    return batch
+
+
+async def ingest(work_dir: str, db_concurrency: int = 2) -> Dict[str, Any]:
+    """
+    결과 파일의 persona를 insert_persona_data로 저장
+
+    같은 위키 데이터로 이미 저장된 persona는 건너뛰므로 다시 실행해도 중복 저장하지 않는다.
+    """
+    manifest = {row["custom_id"]: row for row in _read_jsonl(os.path.join(work_dir, MANIFEST_FILE))}
+    results = _read_jsonl(os.path.join(work_dir, RESULTS_FILE))
+    semaphore = asyncio.Semaphore(max(1, db_concurrency))
+    summary: Dict[str, Any] = {"success": 0, "existing": 0, "error": 0, "missing": 0, "cost_usd": 0.0}
+
+    async def ingest_one(row: Dict[str, Any]):
+        entry = manifest.get(row.get("custom_id"))
+        response = row.get("response") or {}
+        if entry is None or row.get("error") or response.get("status_code") != 200:
+            print(f"batch 요청 실패: {row.get('custom_id')} {row.get('error') or response.get('status_code')}")
+            summary["error"] += 1
+            return
+        body = response["body"]
+        usage = body.get("usage") or {}
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        summary["cost_usd"] += BATCH_PRICE_RATIO * estimate_cost(
+            body.get("model", ""), usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), cached
+        )
+        try:
+            persona_data = parse_persona_content(body["choices"][0]["message"]["content"], entry["wiki_data"])
+            async with semaphore:
+                if await find_generated_persona(entry["dedupe_key"]):
+                    summary["existing"] += 1
+                    return
+                await insert_persona_data(persona_data, entry["wiki_data"], entry["dedupe_key"])
+            summary["success"] += 1
+        except Exception as e:
+            print(f"persona 저장 실패: {entry['name']} {e}")
+            summary["error"] += 1
+
+    await asyncio.gather(*(ingest_one(row) for row in results))
+    summary["missing"] = len(set(manifest) - {row.get("custom_id") for row in results})
+    return summary
+
+
+async def run(args: argparse.Namespace):
+    try:
+        if args.command in ("prepare", "run"):
+            with open(args.names, encoding="utf-8") as f:
+                print(await prepare(f.read().splitlines(), args.work_dir, model=args.model, force=args.force))
+        if args.command in ("submit", "run"):
+            print(await submit(args.work_dir, replay=args.replay))
+        if args.command in ("poll", "run"):
+            await poll(args.work_dir, interval=args.interval)
+        if args.command in ("ingest", "run"):
+            print(await ingest(args.work_dir))
+    finally:
+        await wiki_search.aclose()
+        wiki_search.cache.close()
+        await close_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch API로 persona 일괄 생성")
+    parser.add_argument("command", choices=["prepare", "submit", "poll", "ingest", "run"])
+    parser.add_argument("names", nargs="?", help="인물 이름 목록 파일 (한 줄에 하나, prepare/run)")
+    parser.add_argument("work_dir", help="요청/결과 파일을 저장할 디렉토리")
+    parser.add_argument("--model", help="생성 모델 (기본: persona_generation route의 첫 모델)")
+    parser.add_argument("--force", action="store_true", help="이미 생성된 persona도 다시 생성")
+    parser.add_argument("--replay", help="API 대신 재생할 Batch API 결과 파일 (submit/run)")
+    parser.add_argument("--interval", type=float, default=60, help="상태 확인 간격(초)")
+    args = parser.parse_args()
+    if args.command in ("prepare", "run") and not args.names:
+        parser.error(f"{args.command}에는 인물 이름 목록 파일이 필요합니다")
+    asyncio.run(run(args))